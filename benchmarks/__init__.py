@@ -0,0 +1 @@
+# Benchmarks for the sprint effort estimation pipeline
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Batched-request throughput comparison
+Runs the same story x trial workload against the local stub server in
+one-call-per-trial, n-samples-per-call and multi-story-per-prompt modes.
+"""
+
+import argparse
+import json
+import time
+from src import model_inference
+from src.async_inference import run_jobs
+from src.output_parser import parse_output
+from src.stub_server import StubLLMServer
+
+
+def _stories(n):
+    return [(i, f"As a user, I want feature number {i} so that I can test batching.")
+            for i in range(1, n + 1)]
+
+
+def compare_batch_modes(n_stories=20, trials=5, batch_size=5, concurrency=4,
+                        latency=0.05, item_latency=0.01, ignore_n=False):
+    """Return throughput stats for each batch mode against a fresh stub server."""
+    stories = _stories(n_stories)
+    results = {}
+    modes = [("single", 1), ("n", batch_size), ("multi", batch_size)]
+    for mode, size in modes:
+        with StubLLMServer(latency=latency, item_latency=item_latency,
+                           ignore_n=ignore_n) as server:
+            model_inference.API_HOST = server.url
+            parsed = []
+            jobs = ((sid, t, story) for sid, story in stories
+                    for t in range(trials))
+            t0 = time.perf_counter()
+            n = run_jobs(jobs, lambda *r: parsed.append(parse_output(r[3])),
+                         concurrency=concurrency, use_cache=False,
+                         batch_mode=mode, batch_size=size)
+            elapsed = time.perf_counter() - t0
+            results[mode] = {
+                "trials": n,
+                "requests": server.request_count,
+                "seconds": elapsed,
+                "trials_per_sec": n / elapsed,
+                "parse_ok_rate": sum(p["parse_status"] == "ok"
+                                     for p in parsed) / max(n, 1)
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stories", type=int, default=20)
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="stub per-request latency (s)")
+    parser.add_argument("--item-latency", type=float, default=0.01,
+                        help="stub latency per generated estimate (s)")
+    parser.add_argument("--ignore-n", action="store_true",
+                        help="make the stub ignore the n parameter")
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = compare_batch_modes(args.stories, args.trials, args.batch_size,
+                                  args.concurrency, args.latency,
+                                  args.item_latency, args.ignore_n)
+    base = results["single"]["trials_per_sec"]
+    print(f"{'mode':<8}{'trials':>8}{'requests':>10}{'trials/s':>10}"
+          f"{'speedup':>9}{'parsed':>8}")
+    for mode, r in results.items():
+        print(f"{mode:<8}{r['trials']:>8}{r['requests']:>10}"
+              f"{r['trials_per_sec']:>10.1f}{r['trials_per_sec'] / base:>8.2f}x"
+              f"{r['parse_ok_rate']:>8.0%}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
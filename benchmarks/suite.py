@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark suite
+Times the pipeline's hot paths on synthetic stories: end-to-end run_pipeline
+against the stub server, output parsing, evaluate, the heuristic baseline
+and chart generation. Results are saved as JSON and can be compared with an
+earlier run to catch regressions.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import generate_stories, write_stories
+from src import model_inference
+from src.baseline import heuristic_estimate, heuristic_estimate_batch
+from src.evaluation import evaluate
+from src.output_parser import parse_output, parse_outputs
+from src.stub_server import StubLLMServer, estimate_body, format_completion
+
+SCENARIOS = ["pipeline", "parsing", "evaluate", "heuristic", "charts"]
+# Work per scenario at each size. pipeline makes real HTTP calls to the
+# stub and chart rendering draws every story, so both stay much smaller
+# than the data-only scenarios
+SIZES = {
+    "small": {"pipeline": 200, "parsing": 10000, "evaluate": 10000,
+              "heuristic": 10000, "charts": 100},
+    "medium": {"pipeline": 1000, "parsing": 100000, "evaluate": 100000,
+               "heuristic": 100000, "charts": 500},
+    "large": {"pipeline": 5000, "parsing": 1000000, "evaluate": 1000000,
+              "heuristic": 1000000, "charts": 2000}
+}
+DATA_SCENARIOS = ["parsing", "evaluate", "heuristic"]
+# Per-row reference loops are capped so large sizes finish in reasonable time
+LOOP_LIMIT = 20000
+
+
+def _best_of(fn, repeat: int) -> float:
+    """Fastest wall-clock time of ``repeat`` calls to ``fn``."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _rate(items: int, seconds: float) -> dict:
+    return {"items": items, "seconds": seconds,
+            "items_per_sec": items / seconds if seconds else None}
+
+
+def _synthetic_outputs(n: int, seed: int, unfenced_rate: float,
+                       malformed_rate: float) -> list:
+    rng = random.Random(seed)
+    stories = generate_stories(min(n, 1000), seed)["story"].tolist()
+    # a tenth distinct answers, as repeated trials of a story tend to repeat
+    distinct = [format_completion(estimate_body(stories[i % len(stories)], rng, 0.7),
+                                  rng, unfenced_rate, malformed_rate)
+                for i in range(max(1, n // 10))]
+    return [distinct[rng.randrange(len(distinct))] for _ in range(n)]
+
+
+def _write_results_csv(path: str, n_rows: int, trials: int, seed: int) -> int:
+    """Per-trial results CSV shaped like main.py output, without raw text."""
+    rng = np.random.default_rng(seed)
+    n_stories = -(-n_rows // trials)
+    story_id = np.repeat(np.arange(1, n_stories + 1), trials)[:n_rows]
+    ok = rng.random(len(story_id)) > 0.03
+    pd.DataFrame({
+        "story_id": story_id,
+        "trial": np.tile(np.arange(trials), n_stories)[:n_rows],
+        "estimate": np.where(ok, rng.integers(1, 11, len(story_id)), np.nan),
+        "response_time": rng.lognormal(-1.0, 0.5, len(story_id)),
+        "parse_status": np.where(ok, "ok", "invalid_json"),
+        "cached": False,
+        "wait_time": rng.lognormal(-1.2, 0.5, len(story_id)),
+        "completion_tokens": rng.integers(40, 120, len(story_id)),
+        "finish_reason": "stop"
+    }).to_csv(path, index=False)
+    return len(story_id)
+
+
+def bench_pipeline(n: int, workdir: str, repeat: int, opts) -> dict:
+    """End-to-end run_pipeline against a stub server with realistic output."""
+    from main import RESULTS_CSV, run_pipeline
+    stories_csv = os.path.join(workdir, "pipeline_stories.csv")
+    write_stories(stories_csv, n, opts.seed)
+    best, requests_made, status = float("inf"), 0, None
+    for i in range(repeat):
+        with StubLLMServer(latency=opts.latency, jitter=opts.jitter,
+                           unfenced_rate=opts.unfenced_rate,
+                           malformed_rate=opts.malformed_rate,
+                           seed=opts.seed) as server:
+            model_inference.API_HOST = server.url
+            results_dir = os.path.join(workdir, f"pipeline-{i}")
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_pipeline(trials=opts.trials, concurrency=opts.concurrency,
+                             use_cache=False, stories_csv=stories_csv,
+                             results_dir=results_dir)
+            elapsed = time.perf_counter() - t0
+            if elapsed < best:
+                best, requests_made = elapsed, server.request_count
+                status = pd.read_csv(os.path.join(results_dir, RESULTS_CSV),
+                                     usecols=["parse_status"])["parse_status"]
+    return dict(_rate(len(status), best), stories=n, requests=requests_made,
+                parse_ok_rate=float((status == "ok").mean()))
+
+
+def bench_parsing(n: int, workdir: str, repeat: int, opts) -> dict:
+    """parse_outputs over a column versus a parse_output loop."""
+    raws = _synthetic_outputs(n, opts.seed, opts.unfenced_rate,
+                              opts.malformed_rate)
+    batch = _best_of(lambda: parse_outputs(raws), repeat)
+    sample = raws[:LOOP_LIMIT]
+    loop = _best_of(lambda: [parse_output(raw) for raw in sample], repeat)
+    ok = (parse_outputs(raws)["parse_status"] == "ok").mean()
+    return dict(_rate(n, batch), loop_items=len(sample), loop_seconds=loop,
+                loop_items_per_sec=len(sample) / loop, parse_ok_rate=float(ok))
+
+
+def bench_evaluate(n: int, workdir: str, repeat: int, opts) -> dict:
+    """evaluate over a synthetic results CSV of ``n`` trials, streamed in chunks."""
+    csv_path = os.path.join(workdir, "eval_outputs.csv")
+    rows = _write_results_csv(csv_path, n, opts.trials, opts.seed)
+    out = os.path.join(workdir, "eval_summary.json")
+    seconds = _best_of(lambda: evaluate(csv_path, out, chunksize=200000), repeat)
+    return dict(_rate(rows, seconds), csv_bytes=os.path.getsize(csv_path))
+
+
+def bench_heuristic(n: int, workdir: str, repeat: int, opts) -> dict:
+    """heuristic_estimate_batch over a column versus a heuristic_estimate loop."""
+    stories = pd.concat([generate_stories(min(100000, n - start), opts.seed + i,
+                                          start + 1)
+                         for i, start in enumerate(range(0, n, 100000))])["story"]
+    batch = _best_of(lambda: heuristic_estimate_batch(stories), repeat)
+    sample = stories.iloc[:LOOP_LIMIT].tolist()
+    loop = _best_of(lambda: [heuristic_estimate(s) for s in sample], repeat)
+    return dict(_rate(n, batch), loop_items=len(sample), loop_seconds=loop,
+                loop_items_per_sec=len(sample) / loop)
+
+
+def bench_charts(n: int, workdir: str, repeat: int, opts) -> dict:
+    """Preview-quality chart generation from a summary of ``n`` stories."""
+    from chart_generator import SprintChartGenerator
+    csv_path = os.path.join(workdir, "chart_outputs.csv")
+    summary_path = os.path.join(workdir, "chart_summary.json")
+    _write_results_csv(csv_path, n * opts.trials, opts.trials, opts.seed)
+    evaluate(csv_path, summary_path)
+    runs = iter(range(repeat))
+
+    def render():
+        # a fresh directory each time, as unchanged charts are skipped
+        charts_dir = os.path.join(workdir, f"charts-{next(runs)}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            SprintChartGenerator(summary_path, csv_path, preview=True,
+                                 charts_dir=charts_dir).generate_all_charts()
+    return dict(_rate(n, _best_of(render, repeat)), stories=n)
+
+
+BENCHMARKS = {
+    "pipeline": bench_pipeline,
+    "parsing": bench_parsing,
+    "evaluate": bench_evaluate,
+    "heuristic": bench_heuristic,
+    "charts": bench_charts
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(scenarios=SCENARIOS, size: str = "small", repeat: int = 3,
+              opts=None, sizes: dict = None) -> dict:
+    """
+    Run the named scenarios and return {"meta": ..., "scenarios": {...}};
+    every scenario reports items, seconds (best of ``repeat``) and
+    items_per_sec. ``sizes`` overrides the preset item count per scenario.
+    """
+    sizes = dict(SIZES[size], **(sizes or {}))
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        for name in scenarios:
+            print(f"Running {name} ({sizes[name]} items)...", flush=True)
+            results[name] = BENCHMARKS[name](sizes[name], workdir, repeat, opts)
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "size": size,
+            "repeat": repeat,
+            "sizes": {name: sizes[name] for name in scenarios},
+            "options": vars(opts)
+        },
+        "scenarios": results
+    }
+
+
+def compare(current: dict, previous: dict, tolerance: float) -> list:
+    """
+    Scenarios whose throughput dropped below ``1 - tolerance`` times the
+    previous run's, as (name, previous, current) items_per_sec tuples.
+    Scenarios run at different sizes are not compared.
+    """
+    regressions = []
+    for name, result in current["scenarios"].items():
+        old = previous.get("scenarios", {}).get(name)
+        if not old or old["items"] != result["items"]:
+            continue
+        if result["items_per_sec"] < (1 - tolerance) * old["items_per_sec"]:
+            regressions.append((name, old["items_per_sec"], result["items_per_sec"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", choices=list(SIZES), default="small")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--stories", type=int,
+                        help="override the item count of the parsing, evaluate "
+                             "and heuristic scenarios")
+    parser.add_argument("--pipeline-stories", type=int)
+    parser.add_argument("--chart-stories", type=int)
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="report the best of this many runs")
+    parser.add_argument("--trials", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="stub per-request latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.5,
+                        help="stub latency varies by up to this fraction")
+    parser.add_argument("--unfenced-rate", type=float, default=0.2)
+    parser.add_argument("--malformed-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="results/benchmark_suite.json",
+                        help="write results as JSON to this path")
+    parser.add_argument("--compare", metavar="JSON",
+                        help="earlier results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed throughput drop before --compare fails")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    sizes = {}
+    if args.stories:
+        sizes.update(dict.fromkeys(DATA_SCENARIOS, args.stories))
+    if args.pipeline_stories:
+        sizes["pipeline"] = args.pipeline_stories
+    if args.chart_stories:
+        sizes["charts"] = args.chart_stories
+    opts = argparse.Namespace(trials=args.trials, concurrency=args.concurrency,
+                              latency=args.latency, jitter=args.jitter,
+                              unfenced_rate=args.unfenced_rate,
+                              malformed_rate=args.malformed_rate, seed=args.seed)
+    results = run_suite(scenarios, args.size, args.repeat, opts, sizes)
+
+    print(f"\n{'scenario':<11}{'items':>10}{'seconds':>10}{'items/s':>12}")
+    for name, r in results["scenarios"].items():
+        print(f"{name:<11}{r['items']:>10}{r['seconds']:>10.3f}"
+              f"{r['items_per_sec']:>12.1f}")
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        regressions = compare(results, previous, args.tolerance)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old:.1f} -> {new:.1f} items/s")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
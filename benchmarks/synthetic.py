@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Synthetic user stories
+Generates any number of stories in the data/user_stories.csv format
+(id,story,human_baseline) for scaling benchmarks.
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+
+ROLES = ["user", "admin", "customer", "manager", "guest", "support agent",
+         "developer", "auditor"]
+# (action phrase, human baseline effort centre); the wording reuses the
+# heuristic baseline's keywords so its tiers get exercised
+ACTIONS = [
+    ("view my order history", 2), ("browse the product catalog", 2),
+    ("list recent notifications", 3), ("display account details", 2),
+    ("read release notes", 1), ("update my profile picture", 2),
+    ("create a new project", 3), ("fill in a feedback form", 3),
+    ("assign tickets to teammates", 4), ("apply a discount code", 4),
+    ("sign in with two-factor auth", 5), ("export reports to CSV", 6),
+    ("import contacts from a spreadsheet", 6), ("see a real time activity feed", 7),
+    ("integrate with the payment provider", 8), ("open an analytics dashboard", 8),
+    ("receive push notifications", 6), ("sync data with the CRM", 7)
+]
+OBJECTS = ["", " on mobile", " for my team", " across all workspaces",
+           " in the admin console", " with audit logging"]
+BENEFITS = ["I can save time", "I stay informed", "I can track progress",
+            "my data stays accurate", "I can make better decisions",
+            "the team can collaborate"]
+
+
+def generate_stories(n: int, seed: int = 0, start_id: int = 1) -> pd.DataFrame:
+    """``n`` synthetic stories with ids from ``start_id`` and 1-10 baselines."""
+    rng = np.random.default_rng(seed)
+    role = rng.integers(len(ROLES), size=n)
+    action = rng.integers(len(ACTIONS), size=n)
+    obj = rng.integers(len(OBJECTS), size=n)
+    benefit = rng.integers(len(BENEFITS), size=n)
+    stories = [f"As a{'n' if ROLES[r][0] in 'aeiou' else ''} {ROLES[r]}, I want to "
+               f"{ACTIONS[a][0]}{OBJECTS[o]} so that {BENEFITS[b]}."
+               for r, a, o, b in zip(role, action, obj, benefit)]
+    centre = np.array([effort for _, effort in ACTIONS])[action] + (obj >= 3)
+    baseline = np.clip(centre + rng.integers(-1, 2, size=n), 1, 10)
+    return pd.DataFrame({"id": np.arange(start_id, start_id + n),
+                         "story": stories, "human_baseline": baseline})
+
+
+def write_stories(path: str, n: int, seed: int = 0,
+                  chunksize: int = 100000) -> int:
+    """Stream ``n`` stories to ``path`` in chunks; memory stays flat."""
+    for i, start in enumerate(range(0, n, chunksize)):
+        chunk = generate_stories(min(chunksize, n - start), seed + i, start + 1)
+        chunk.to_csv(path, mode="w" if i == 0 else "a", header=i == 0,
+                     index=False)
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("out_csv")
+    parser.add_argument("--stories", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_stories(args.out_csv, args.stories, args.seed)
+    print(f"Wrote {args.stories} stories to {args.out_csv}")
+
+
+if __name__ == "__main__":
+    main()
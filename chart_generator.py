@@ -4,21 +4,57 @@ Sprint Effort Estimation Chart Generator
 Generates publication-ready charts from benchmark results
 """
 
+import hashlib
 import json
 import os
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-import seaborn as sns
-import pandas as pd
-import numpy as np
-from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
+# Heavy plotting/data imports (matplotlib, pandas, numpy) are deferred to
+# first use so importing this module stays cheap.
+
+PUBLICATION_DPI = 300
+PREVIEW_DPI = 72
+CHART_PREVIEW = os.getenv("CHART_PREVIEW", "0").lower() in ("1", "true", "yes")
+
+CHART_FILES = {
+    "create_estimation_accuracy_chart": "estimation_analysis.png",
+    "create_consistency_heatmap": "consistency_heatmap.png",
+    "create_performance_metrics_chart": "performance_metrics.png",
+    "create_research_summary_chart": "research_summary.png",
+}
+CHART_METHODS = list(CHART_FILES)
+# Per-trial columns the charts draw on; only these are read from results files
+CHART_COLUMNS = ["story_id", "estimate", "response_time", "parse_status"]
+
+
+def _pyplot():
+    """Import pyplot on the non-interactive backend."""
+    import matplotlib
+    matplotlib.use('Agg')  # Use non-interactive backend
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _render_chart(generator, method):
+    """Process-pool entry point: render one chart on a pickled generator."""
+    return generator.render(method)
+
+
 class SprintChartGenerator:
-    def __init__(self, benchmark_file=None, csv_file=None):
-        """Initialize with benchmark data"""
+    def __init__(self, benchmark_file=None, csv_file=None, preview=None,
+                 summary=None, df=None, charts_dir='charts'):
+        """Initialize with benchmark data
+
+        ``summary`` and ``df`` may be passed as in-memory objects instead of
+        file paths. ``csv_file`` may also be a Parquet file, such as a run in
+        the results store. Per-trial results are only read if the summary
+        lacks the pre-binned ``distributions`` section. ``preview`` (default:
+        $CHART_PREVIEW) renders at low dpi without the tight bounding-box
+        pass, for CI smoke runs.
+        """
+        self.preview = CHART_PREVIEW if preview is None else preview
+        self.dpi = PREVIEW_DPI if self.preview else PUBLICATION_DPI
         if benchmark_file is None:
             benchmark_file = "results/benchmark_summary.json"
         if csv_file is None:
@@ -28,63 +64,121 @@ class SprintChartGenerator:
         self.csv_file = csv_file
         
         # Load data
-        with open(benchmark_file, 'r') as f:
-            self.summary = json.load(f)
-        
-        self.df = pd.read_csv(csv_file)
+        if summary is None:
+            with open(benchmark_file, 'r') as f:
+                summary = json.load(f)
+            print(f"Loaded benchmark data from {benchmark_file}")
+        self.summary = summary
+        self._df = df
         
         # Create output directory
-        self.charts_dir = 'charts'
+        self.charts_dir = charts_dir
         os.makedirs(self.charts_dir, exist_ok=True)
         
-        print(f"Loaded benchmark data from {benchmark_file}")
-        print(f"Loaded CSV data from {csv_file}")
         print(f"Total stories: {len(self.summary['stories'])}")
         print(f"Global mean: {self.summary['global']['mean']:.2f}")
 
+    @property
+    def df(self):
+        """Per-trial results, loaded on first use"""
+        if self._df is None:
+            from src.output_parser import ensure_parsed_columns
+            from src.results_store import read_frame, result_columns
+            header = result_columns(self.csv_file)
+            columns = [c for c in CHART_COLUMNS if c in header]
+            if "parse_status" not in header:
+                columns.append("raw_output")
+            self._df = ensure_parsed_columns(read_frame(self.csv_file, columns))
+            print(f"Loaded CSV data from {self.csv_file}")
+        return self._df
+
+    def _estimate_counts(self):
+        """Story-point values and counts (integer bins), pre-binned if possible"""
+        import numpy as np
+        dist = self.summary.get('distributions', {}).get('estimate_counts')
+        if dist is not None:
+            points = np.array([int(p) for p in dist], dtype=int)
+            return points, np.array(list(dist.values()), dtype=int)
+        import pandas as pd
+        est = pd.to_numeric(self.df["estimate"], errors="coerce").dropna()
+        if est.empty:
+            return np.array([], dtype=int), np.array([], dtype=int)
+        floored = np.floor(est.to_numpy()).astype(int)
+        counts = np.bincount(floored - floored.min())
+        points = np.arange(floored.min(), floored.min() + len(counts))
+        return points[counts > 0], counts[counts > 0]
+
+    def _latency_histogram(self):
+        """Latency bin edges, counts and mean, pre-binned if possible"""
+        import numpy as np
+        hist = self.summary.get('distributions', {}).get('latency_histogram')
+        if hist is None:
+            from src.evaluation import _latency_aggregate, LATENCY_BIN_EDGES
+            agg = _latency_aggregate(self.df['response_time'])
+            hist = {"bin_edges": LATENCY_BIN_EDGES.tolist(), "counts": agg["hist"],
+                    "mean": agg["sum"] / agg["count"] if agg["count"] else None}
+        return (np.array(hist['bin_edges']), np.array(hist['counts']),
+                hist['mean'])
+
+    def _chart_inputs(self, method):
+        """The data a chart is drawn from, used to detect stale PNGs"""
+        stories = self.summary['stories']
+        inputs = {'stories': stories, 'global': self.summary['global']}
+        if method == 'create_estimation_accuracy_chart':
+            points, counts = self._estimate_counts()
+            inputs['estimate_counts'] = [points.tolist(), counts.tolist()]
+        elif method == 'create_performance_metrics_chart':
+            edges, counts, mean = self._latency_histogram()
+            inputs['latency'] = [counts.tolist(), mean]
+        elif method == 'create_consistency_heatmap':
+            inputs.pop('global')
+        return inputs
+
+    def _inputs_hash(self, method):
+        # Round-trip through JSON first so int and str story keys hash alike
+        inputs = json.loads(json.dumps(self._chart_inputs(method), default=str))
+        blob = json.dumps({'inputs': inputs, 'dpi': self.dpi,
+                           'preview': self.preview}, sort_keys=True)
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    def render(self, method, force=False):
+        """Render one chart unless its PNG is already current for the inputs"""
+        png = os.path.join(self.charts_dir, CHART_FILES[method])
+        digest_file = png + '.sha256'
+        digest = self._inputs_hash(method)
+        if not force and os.path.exists(png) and os.path.exists(digest_file):
+            with open(digest_file) as f:
+                if f.read().strip() == digest:
+                    print(f"Skipped {CHART_FILES[method]} (inputs unchanged)")
+                    return False
+        getattr(self, method)()
+        with open(digest_file, 'w') as f:
+            f.write(digest + '\n')
+        return True
+
+    def _save(self, plt, filename):
+        """Save the current figure at the configured quality"""
+        kwargs = {} if self.preview else {'bbox_inches': 'tight'}
+        plt.savefig(f'{self.charts_dir}/{filename}', dpi=self.dpi, **kwargs)
+
     def create_estimation_accuracy_chart(self):
         """Create estimation accuracy comparison chart"""
+        plt = _pyplot()
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
         fig.suptitle('Sprint Effort Estimation Analysis', fontsize=16, fontweight='bold')
         
-        # Parse estimates from CSV
-        estimates = []
-        story_ids = []
-        for _, row in self.df.iterrows():
-            # Parse from raw_output if estimate is null
-            if pd.notna(row["estimate"]) and row["estimate"] != "":
-                try:
-                    estimates.append(float(row["estimate"]))
-                    story_ids.append(int(row["story_id"]))
-                except:
-                    pass
-            else:
-                # Parse from raw_output
-                raw = row["raw_output"]
-                try:
-                    import json
-                    if "```json" in raw:
-                        start = raw.find("```json") + 7
-                        end = raw.find("```", start)
-                        json_str = raw[start:end].strip()
-                    else:
-                        json_str = raw
-                    parsed = json.loads(json_str)
-                    if "estimate" in parsed:
-                        estimates.append(float(parsed["estimate"]))
-                        story_ids.append(int(row["story_id"]))
-                except:
-                    pass
+        # Pre-binned integer story-point counts
+        points, counts = self._estimate_counts()
         
         # 1. Distribution of estimates
-        if len(estimates) > 0:
-            # Use integer bins for story points (1-10)
-            min_est = int(min(estimates))
-            max_est = int(max(estimates))
-            bins = list(range(min_est, max_est + 2))
-            ax1.hist(estimates, bins=bins, alpha=0.7, color='skyblue', edgecolor='black')
-            ax1.axvline(np.mean(estimates), color='red', linestyle='--', linewidth=2,
-                       label=f'Mean: {np.mean(estimates):.2f}')
+        if counts.sum() > 0:
+            mean_est = (points * counts).sum() / counts.sum()
+            if self.summary['global']:
+                mean_est = self.summary['global']['mean']
+            ax1.bar(points, counts, width=1, align='edge', alpha=0.7,
+                    color='skyblue', edgecolor='black')
+            ax1.axvline(mean_est, color='red', linestyle='--', linewidth=2,
+                       label=f'Mean: {mean_est:.2f}')
             ax1.set_xlabel('Story Points')
             ax1.set_ylabel('Frequency')
             ax1.set_title('Distribution of LLM Estimates')
@@ -114,12 +208,14 @@ class SprintChartGenerator:
         plt.setp(ax2.get_xticklabels(), rotation=45, ha='right')
         
         plt.tight_layout()
-        plt.savefig(f'{self.charts_dir}/estimation_analysis.png', dpi=300, bbox_inches='tight')
+        self._save(plt, 'estimation_analysis.png')
         plt.close()
         print("Created estimation accuracy chart")
 
     def create_consistency_heatmap(self):
         """Create consistency analysis heatmap"""
+        plt = _pyplot()
+        import numpy as np
         fig, ax = plt.subplots(figsize=(12, 8))
         
         # Prepare data for heatmap
@@ -158,20 +254,28 @@ class SprintChartGenerator:
         cbar.set_label('Score', rotation=270, labelpad=20)
         
         plt.tight_layout()
-        plt.savefig(f'{self.charts_dir}/consistency_heatmap.png', dpi=300, bbox_inches='tight')
+        self._save(plt, 'consistency_heatmap.png')
         plt.close()
         print("Created consistency heatmap")
 
     def create_performance_metrics_chart(self):
         """Create performance metrics visualization"""
+        plt = _pyplot()
+        import numpy as np
         fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(15, 12))
         fig.suptitle('Sprint Effort Estimation Performance Metrics', fontsize=16, fontweight='bold')
         
-        # 1. Response time distribution
-        response_times = self.df['response_time'].dropna()
-        ax1.hist(response_times, bins=15, alpha=0.7, color='lightgreen', edgecolor='black')
-        ax1.axvline(response_times.mean(), color='red', linestyle='--', linewidth=2,
-                   label=f'Mean: {response_times.mean():.2f}s')
+        # 1. Response time distribution (fixed log-spaced bins from evaluation)
+        edges, counts, mean_rt = self._latency_histogram()
+        occupied = np.nonzero(counts)[0]
+        if len(occupied) > 0:
+            lo, hi = occupied[0], occupied[-1] + 1
+            ax1.bar(edges[lo:hi], counts[lo:hi], width=np.diff(edges)[lo:hi],
+                    align='edge', alpha=0.7, color='lightgreen', edgecolor='black')
+            if edges[lo] > 0:
+                ax1.set_xscale('log')
+            ax1.axvline(mean_rt, color='red', linestyle='--', linewidth=2,
+                       label=f'Mean: {mean_rt:.2f}s')
         ax1.set_xlabel('Response Time (seconds)')
         ax1.set_ylabel('Frequency')
         ax1.set_title('LLM Response Time Distribution')
@@ -232,12 +336,14 @@ class SprintChartGenerator:
             ax4.plot(story_complexity, p(story_complexity), "r--", alpha=0.8)
         
         plt.tight_layout()
-        plt.savefig(f'{self.charts_dir}/performance_metrics.png', dpi=300, bbox_inches='tight')
+        self._save(plt, 'performance_metrics.png')
         plt.close()
         print("Created performance metrics chart")
 
     def create_research_summary_chart(self):
         """Create comprehensive research summary chart"""
+        plt = _pyplot()
+        import numpy as np
         fig, ax = plt.subplots(figsize=(14, 10))
         
         # Create a comprehensive summary visualization
@@ -284,18 +390,27 @@ class SprintChartGenerator:
                    f'{mean:.1f}', ha='center', va='bottom', fontweight='bold')
         
         plt.tight_layout()
-        plt.savefig(f'{self.charts_dir}/research_summary.png', dpi=300, bbox_inches='tight')
+        self._save(plt, 'research_summary.png')
         plt.close()
         print("Created research summary chart")
 
-    def generate_all_charts(self):
-        """Generate all charts"""
+    def generate_all_charts(self, workers=None):
+        """Generate all charts
+
+        With ``workers`` > 1 the charts are rendered in a process pool.
+        """
         print("Generating sprint effort estimation charts...")
         
-        self.create_estimation_accuracy_chart()
-        self.create_consistency_heatmap()
-        self.create_performance_metrics_chart()
-        self.create_research_summary_chart()
+        if workers and workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_render_chart, self, method)
+                           for method in CHART_METHODS]
+                for future in futures:
+                    future.result()
+        else:
+            for method in CHART_METHODS:
+                self.render(method)
         
         print(f"\nAll charts generated successfully in '{self.charts_dir}/' directory:")
         print("- estimation_analysis.png (Estimation accuracy and consistency)")
@@ -306,9 +421,27 @@ class SprintChartGenerator:
 
 def main():
     """Generate all charts"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate benchmark charts")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="render charts in this many processes")
+    parser.add_argument("--preview", action="store_true",
+                        help="fast low-dpi rendering for smoke runs")
+    parser.add_argument("--run", help="chart a run from the results store")
+    parser.add_argument("--store", default=None,
+                        help="results store directory (default: $RESULTS_STORE)")
+    args = parser.parse_args()
+    files = {}
+    if args.run:
+        from src.results_store import (RESULTS_STORE, RUN_RESULTS, RUN_SUMMARY,
+                                       run_dir)
+        path = run_dir(args.run, args.store or RESULTS_STORE)
+        files = {"benchmark_file": os.path.join(path, RUN_SUMMARY),
+                 "csv_file": os.path.join(path, RUN_RESULTS),
+                 "charts_dir": os.path.join("charts", args.run)}
     try:
-        generator = SprintChartGenerator()
-        generator.generate_all_charts()
+        generator = SprintChartGenerator(preview=args.preview or None, **files)
+        generator.generate_all_charts(workers=args.workers)
         
     except FileNotFoundError as e:
         print(f"ERROR: {e}")
@@ -1,53 +1,236 @@
-import pandas as pd
+import argparse
 import json
+import os
+import pandas as pd
+from src.adaptive_sampling import AdaptiveScheduler
+from src.async_inference import check_modes, run_jobs
+from src.baseline import heuristic_estimate_batch
+from src.call_metrics import CALL_METRIC_COLUMNS
+from src.endpoint_pool import EndpointPool
+from src.model_inference import get_client
 from src.evaluation import evaluate
-from src.model_inference import query_model
+from src.output_parser import parse_output
+from src.response_cache import CACHE_BYPASS, get_cache
+from src.result_log import ResultLog, completed_trials, iter_records, log_to_csv
+from src.results_store import RESULTS_STORE, record_run
+from src.sharding import SHARDS_DIR, mark_shard_done, shard_paths
+from src.similarity import KNN_INDEX, KNN_THRESHOLD, StoryIndex, routing_report
+
+
+STORIES_CSV = "data/user_stories.csv"
+RESULTS_DIR = "results"
+# Output file names inside the results directory
+RESULTS_LOG = "model_outputs.jsonl"
+RESULTS_CSV = "model_outputs.csv"
+SUMMARY_JSON = "benchmark_summary.json"
+SAMPLING_REPORT = "sampling_report.json"
+ENDPOINT_REPORT = "endpoint_stats.json"
+KNN_REPORT = "knn_report.json"
+STORY_CHUNKSIZE = 1000
+EVAL_CHUNKSIZE = 200000
+
+
+def _iter_stories(path: str = STORIES_CSV):
+    for chunk in pd.read_csv(path, chunksize=STORY_CHUNKSIZE):
+        chunk["baseline_estimate"] = heuristic_estimate_batch(chunk["story"])
+        yield from chunk.to_dict("records")
+
+
+def _route_knn(rows, index: StoryIndex, threshold: float, routed: dict,
+               human: dict):
+    """
+    Yield the stories the kNN index cannot answer with at least
+    ``threshold`` similarity; the estimates of the others go to ``routed``.
+    A story is left out of its own neighbours (same id or same text), so
+    an index built from the stories being run does not answer them itself.
+    """
+    for row in rows:
+        human[row["id"]] = row.get("human_baseline")
+        est = index.estimate(row["story"],
+                             exclude=index.rows_of(row["id"], row["story"]))
+        if est["similarity"] >= threshold:
+            routed[row["id"]] = est
+        else:
+            yield row
+
+
+def _run_adaptive(scheduler: AdaptiveScheduler, stories: dict, on_result,
+                  **run_opts):
+    round_no = 0
+    while True:
+        pending = scheduler.next_round()
+        if not pending:
+            break
+        round_no += 1
+        print(f"Adaptive round {round_no}: {len(pending)} trials across "
+              f"{len({sid for sid, _ in pending})} stories")
+        run_jobs(((sid, t, stories[sid]) for sid, t in pending), on_result,
+                 **run_opts)
+
+
+def run_pipeline(trials: int = 3, concurrency: int = 1, use_cache: bool = None,
+                 resume: bool = False, adaptive: bool = False,
+                 min_trials: int = 2, max_trials: int = None,
+                 tolerance: float = 0.5, metric: str = "std",
+                 batch_mode: str = "single", batch_size: int = 1,
+                 stream_mode: str = None, stories_csv: str = STORIES_CSV,
+                 results_dir: str = RESULTS_DIR, store: str = None,
+                 knn_index: str = None, knn_threshold: float = KNN_THRESHOLD):
+    """
+    Estimate every story in ``stories_csv`` and evaluate the results, which
+    are written to ``results_dir``.
+
+    With ``adaptive`` each story gets between ``min_trials`` and
+    ``max_trials`` (default 2 * ``trials``) trials: sampling stops once its
+    estimates converge within ``tolerance`` and the calls saved are spent on
+    still-uncertain stories, never exceeding the fixed-mode budget of
+    ``trials`` per story.
 
+    ``batch_mode`` "n" requests up to ``batch_size`` samples of a story per
+    call; "multi" packs up to ``batch_size`` stories into one prompt.
 
-def run_pipeline(trials: int = 3):
-    df = pd.read_csv("data/user_stories.csv")
-    records = []
+    ``stream_mode`` "full" streams answers to record time-to-first-token;
+    "early" also stops each answer once its estimate has been read.
+
+    With ``store`` the trials and summary are also saved as a new run in
+    that columnar results store (needs pyarrow).
+
+    With ``knn_index`` (built by ``python -m src.similarity build``) stories
+    whose nearest indexed neighbour is at least ``knn_threshold`` similar
+    are estimated from their neighbours instead of the model; they are
+    reported in knn_report.json rather than the trial outputs.
+    """
+    # before the result log is opened (and truncated unless resuming)
+    check_modes(batch_mode, batch_size, stream_mode)
+    if use_cache is None:
+        use_cache = not CACHE_BYPASS
+    results_log = os.path.join(results_dir, RESULTS_LOG)
+    done = completed_trials(results_log) if resume and not adaptive else set()
 
     print(f"Running sprint effort estimation pipeline with {trials} "
-          f"trials per story...")
-    print(f"Processing {len(df)} user stories...")
-
-    for _, row in df.iterrows():
-        print(f"Processing story {row['id']}: {row['story'][:50]}...")
-        for t in range(trials):
-            raw, latency = query_model(row["story"])
-
-            # Parse the JSON response to extract estimate
-            try:
-                # Handle markdown code fences
-                if "```json" in raw:
-                    # Extract JSON from markdown code block
-                    start = raw.find("```json") + 7
-                    end = raw.find("```", start)
-                    json_str = raw[start:end].strip()
-                else:
-                    json_str = raw
-                
-                parsed = json.loads(json_str)
-                estimate = parsed.get("estimate", None)
-            except (json.JSONDecodeError, KeyError):
-                estimate = None
-
-            records.append({
-                "story_id": row["id"],
+          f"trials per story ({concurrency} concurrent requests)...")
+    print(f"Processing user stories from {stories_csv}...")
+    if resume and not adaptive:
+        print(f"Resuming: {len(done)} trials already recorded in {results_log}")
+
+    remaining = {}
+    baselines = {}
+    index = StoryIndex.load(knn_index) if knn_index else None
+    routed, human = {}, {}
+
+    def story_rows():
+        rows = _iter_stories(stories_csv)
+        if index is None:
+            return rows
+        return _route_knn(rows, index, knn_threshold, routed, human)
+
+    def jobs():
+        for row in story_rows():
+            todo = [t for t in range(trials) if (row["id"], t) not in done]
+            if todo:
+                remaining[row["id"]] = len(todo)
+                baselines[row["id"]] = row["baseline_estimate"]
+            for t in todo:
+                yield row["id"], t, row["story"]
+
+    scheduler = None
+    if adaptive:
+        stories = {}
+        for row in story_rows():
+            stories[row["id"]] = row["story"]
+            baselines[row["id"]] = row["baseline_estimate"]
+        scheduler = AdaptiveScheduler(
+            stories, min_trials=min_trials,
+            max_trials=max_trials or 2 * trials,
+            budget=trials * len(stories), metric=metric, tolerance=tolerance)
+        if resume:
+            for rec in iter_records(results_log):
+                scheduler.observe(rec["story_id"], rec["trial"], rec["estimate"])
+            print(f"Resuming: {scheduler.calls} trials already recorded in "
+                  f"{results_log}")
+
+    with ResultLog(results_log, resume=resume) as log:
+        def on_result(story_id, t, story, raw, latency, error, metrics):
+            if error:
+                print(f"  Story {story_id} trial {t} failed: {error}")
+            record = {
+                "story_id": story_id,
                 "trial": t,
-                "story": row["story"],
+                "story": story,
                 "raw_output": raw,
                 "response_time": latency,
-                "estimate": estimate
-            })
+                **(metrics or dict.fromkeys(CALL_METRIC_COLUMNS)),
+                **parse_output(raw),
+                "baseline_estimate": baselines[story_id],
+                "error": error
+            }
+            log.append(record)
+            if scheduler is not None:
+                scheduler.observe(story_id, t, record["estimate"])
+                return
+
+            remaining[story_id] -= 1
+            if remaining[story_id] == 0:
+                del remaining[story_id], baselines[story_id]
+                print(f"Completed story {story_id}: {story[:50]}...")
+
+        run_opts = dict(concurrency=concurrency, use_cache=use_cache,
+                        batch_mode=batch_mode, batch_size=batch_size,
+                        stream_mode=stream_mode)
+        if scheduler is not None:
+            _run_adaptive(scheduler, stories, on_result, **run_opts)
+        else:
+            run_jobs(jobs(), on_result, **run_opts)
 
-    out_csv = "results/model_outputs.csv"
-    pd.DataFrame(records).to_csv(out_csv, index=False)
-    print(f"Results saved to {out_csv}")
+    if scheduler is not None:
+        report = scheduler.report(trials)
+        with open(os.path.join(results_dir, SAMPLING_REPORT), "w",
+                  encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Adaptive sampling: {report['calls']} calls vs "
+              f"{report['fixed_calls']} in fixed mode "
+              f"({report['calls_saved']} saved, "
+              f"{report['converged_stories']}/{report['stories']} stories converged)")
+    client = get_client()
+    if isinstance(client, EndpointPool):
+        endpoint_stats = client.stats()
+        with open(os.path.join(results_dir, ENDPOINT_REPORT), "w",
+                  encoding="utf-8") as f:
+            json.dump(endpoint_stats, f, indent=2)
+        for host, st in endpoint_stats.items():
+            mean = f"{st['mean']:.2f}s" if st["mean"] is not None else "n/a"
+            print(f"Endpoint {host}: {st['requests']} requests, "
+                  f"{st['errors']} errors, {st['ejections']} ejections, "
+                  f"mean latency {mean}")
+    if use_cache:
+        stats = get_cache().stats()
+        print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses")
 
-    summary = evaluate(out_csv, "results/benchmark_summary.json")
-    print("Benchmark summary saved to results/benchmark_summary.json")
+    out_csv = os.path.join(results_dir, RESULTS_CSV)
+    n = log_to_csv(results_log, out_csv)
+    print(f"Results saved to {out_csv} ({n} trials)")
+
+    out_summary = os.path.join(results_dir, SUMMARY_JSON)
+    summary = evaluate(out_csv, out_summary, chunksize=EVAL_CHUNKSIZE,
+                       stories_csv=stories_csv)
+    print(f"Benchmark summary saved to {out_summary}")
+    if index is not None:
+        llm_means = {sid: summary["stories"][sid]["mean"] for sid in human
+                     if sid not in routed and sid in summary["stories"]}
+        report = routing_report(routed, llm_means, human, trials, knn_threshold)
+        with open(os.path.join(results_dir, KNN_REPORT), "w",
+                  encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"kNN routing: {report['routed_to_knn']} of {report['stories']} "
+              f"stories answered from the index, {report['calls_avoided']} "
+              f"calls avoided (MAE vs human: kNN {report['knn_mae']}, "
+              f"LLM {report['llm_mae']})")
+    if store:
+        run = record_run(results_log, store, summary, trials=trials,
+                         source=stories_csv, batch_mode=batch_mode,
+                         stream_mode=stream_mode)
+        print(f"Run {run['run_id']} saved to {store} "
+              f"(model {run['model']}, prompt {run['prompt_hash']})")
 
     # Print summary
     print("\n=== BENCHMARK SUMMARY ===")
@@ -60,6 +243,23 @@ def run_pipeline(trials: int = 3):
     else:
         print("Global Statistics: No valid estimates found")
 
+    if summary.get("accuracy"):
+        acc = summary["accuracy"]
+        print(f"\nAccuracy vs human baseline ({acc['stories']} stories, "
+              f"{acc['ci_level']:.0%} CI from {acc['resamples']} resamples):")
+        for name, label in (("mae", "MAE"), ("rmse", "RMSE"),
+                            ("within_1", "Within ±1"), ("spearman", "Spearman")):
+            line = []
+            for source in ("llm", "heuristic"):
+                m = acc[source][name]
+                if m["value"] is None:
+                    line.append(f"{source} n/a")
+                else:
+                    lo, hi = (f"{x:.2f}" if x is not None else "n/a"
+                              for x in m["ci"])
+                    line.append(f"{source} {m['value']:.2f} [{lo}, {hi}]")
+            print(f"  {label}: " + ", ".join(line))
+
     print("\nPer-Story Statistics:")
     for story_id, stats in summary['stories'].items():
         if stats['mean'] is not None:
@@ -71,4 +271,73 @@ def run_pipeline(trials: int = 3):
 
 
 if __name__ == "__main__":
-    run_pipeline(trials=5)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the sprint effort "
+                                     "estimation pipeline")
+    parser.add_argument("--trials", type=int, default=5,
+                        help="trials per story")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="maximum in-flight model requests")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="bypass the on-disk response cache")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip story/trial pairs already in the result log")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="stop sampling stories once their estimates converge")
+    parser.add_argument("--min-trials", type=int, default=2,
+                        help="adaptive mode: trials every story gets")
+    parser.add_argument("--max-trials", type=int, default=None,
+                        help="adaptive mode: trial cap per story "
+                             "(default 2 x --trials)")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="adaptive mode: std (or share outside ±1 for "
+                             "--metric consistency) at which a story has converged")
+    parser.add_argument("--metric", choices=["std", "consistency"], default="std",
+                        help="adaptive mode: convergence metric")
+    parser.add_argument("--batch-mode", choices=["single", "n", "multi"],
+                        default="single",
+                        help="n: several samples per request; "
+                             "multi: several stories per prompt")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="samples or stories per batched request")
+    parser.add_argument("--stream", choices=["off", "full", "early"],
+                        default=None,
+                        help="stream answers (full) or stop once the estimate "
+                             "is read (early); default $LM_STREAM_MODE or off")
+    parser.add_argument("--stories", default=STORIES_CSV,
+                        help="user stories CSV")
+    parser.add_argument("--results-dir", default=RESULTS_DIR,
+                        help="directory for outputs and the summary")
+    parser.add_argument("--shard", type=int, default=None,
+                        help="run shard N of a split made with "
+                             "`python -m src.sharding split`")
+    parser.add_argument("--shards-dir", default=SHARDS_DIR,
+                        help="where the split and its manifest live")
+    parser.add_argument("--knn-index", nargs="?", const=KNN_INDEX, default=None,
+                        help="answer near-duplicate stories from this "
+                             f"similarity index (default {KNN_INDEX})")
+    parser.add_argument("--knn-threshold", type=float, default=KNN_THRESHOLD,
+                        help="minimum similarity to skip the model")
+    parser.add_argument("--store", nargs="?", const=RESULTS_STORE, default=None,
+                        help="also save the run in the columnar results store "
+                             f"(default dir {RESULTS_STORE}; needs pyarrow)")
+    args = parser.parse_args()
+    try:
+        check_modes(args.batch_mode, args.batch_size, args.stream)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.adaptive and args.min_trials > args.trials:
+        parser.error("--min-trials cannot exceed the --trials budget per story")
+    stories_csv, results_dir = args.stories, args.results_dir
+    if args.shard is not None:
+        stories_csv, results_dir = shard_paths(args.shard, args.shards_dir)
+    run_pipeline(trials=args.trials, concurrency=args.concurrency,
+                 use_cache=False if args.no_cache else None,
+                 resume=args.resume, adaptive=args.adaptive,
+                 min_trials=args.min_trials, max_trials=args.max_trials,
+                 tolerance=args.tolerance, metric=args.metric,
+                 batch_mode=args.batch_mode, batch_size=args.batch_size,
+                 stream_mode=args.stream, stories_csv=stories_csv,
+                 results_dir=results_dir, store=args.store,
+                 knn_index=args.knn_index, knn_threshold=args.knn_threshold)
+    if args.shard is not None:
+        mark_shard_done(results_dir, args.shard, args.shards_dir)
@@ -0,0 +1,153 @@
+import os
+import numpy as np
+import pandas as pd
+from src.baseline import heuristic_estimate_batch
+
+ACCURACY_RESAMPLES = int(os.getenv("ACCURACY_RESAMPLES", "1000"))
+ACCURACY_CI_LEVEL = float(os.getenv("ACCURACY_CI_LEVEL", "0.95"))
+ACCURACY_METRICS = ["mae", "rmse", "within_1", "spearman"]
+# Resamples are drawn in blocks of about this many array elements
+BLOCK_ELEMENTS = 4000000
+
+
+def _weighted_ranks(values: np.ndarray, reps: np.ndarray) -> np.ndarray:
+    """
+    Average ranks of ``values`` in each resample, where row b of ``reps``
+    says how many copies of each value resample b holds. The values are
+    sorted once; ranks come from running sums of the copy counts.
+    """
+    order = np.argsort(values, kind="stable")
+    sv = values[order]
+    group_starts = np.flatnonzero(np.r_[True, sv[1:] != sv[:-1]])
+    group = np.cumsum(np.r_[True, sv[1:] != sv[:-1]]) - 1
+    in_group = np.add.reduceat(reps[:, order], group_starts, axis=1)
+    group_rank = np.cumsum(in_group, axis=1) - in_group + (in_group + 1) / 2
+    ranks = np.empty(reps.shape)
+    ranks[:, order] = group_rank[:, group]
+    return ranks
+
+
+def _weighted_corr(a: np.ndarray, b: np.ndarray, w: np.ndarray) -> np.ndarray:
+    """Pearson correlation of each row of ``a`` and ``b`` under row weights ``w``."""
+    total = w.sum(axis=1, keepdims=True)
+    a = a - (w * a).sum(axis=1, keepdims=True) / total
+    b = b - (w * b).sum(axis=1, keepdims=True) / total
+    den = np.sqrt((w * a * a).sum(axis=1) * (w * b * b).sum(axis=1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, (w * a * b).sum(axis=1) / den, np.nan)
+
+
+def bootstrap_accuracy(story, value, count, truth, resample_trials: bool = True,
+                       n_resamples: int = ACCURACY_RESAMPLES,
+                       level: float = ACCURACY_CI_LEVEL, seed: int = 0) -> dict:
+    """
+    MAE, RMSE and within-±1 accuracy over trials, and Spearman correlation
+    of per-story mean estimates, against ``truth`` with percentile
+    bootstrap confidence intervals.
+
+    Trials are given as (story, value, count) triples, sorted by story
+    index into ``truth``: ``count`` trials of that story gave ``value``.
+    Each resample draws stories with replacement and, with
+    ``resample_trials``, redraws every drawn copy of a story's trials from
+    that story's trials. Spearman is resampled over stories only: redrawing
+    trials would add within-story noise to story means that already carry
+    it, biasing the correlation down. All resamples of a block are computed
+    at once as array operations over (resamples x stories) and (resamples x
+    drawn stories x trials per story); nothing loops over resamples.
+    """
+    story = np.repeat(np.asarray(story, dtype=np.int64), count)
+    value = np.repeat(np.asarray(value, dtype=float), count)
+    truth = np.asarray(truth, dtype=float)
+    n_stories, n_trials = len(truth), len(value)
+    starts = np.flatnonzero(np.r_[True, story[1:] != story[:-1]])
+    sizes = np.diff(np.r_[starts, n_trials])
+    err = value - truth[story]
+    # per trial: absolute error, squared error, within ±1
+    table = np.column_stack([np.abs(err), err ** 2, np.abs(err) <= 1])
+    story_sums = np.add.reduceat(table, starts)
+    means = np.add.reduceat(value, starts) / sizes
+
+    def metrics(sums: np.ndarray, reps: np.ndarray) -> np.ndarray:
+        # sums: (resamples, 3) totals of each statistic over the drawn trials
+        mae, mse, within = (sums / (reps @ sizes)[:, None]).T
+        spearman = _weighted_corr(_weighted_ranks(means, reps),
+                                  _weighted_ranks(truth, reps), reps)
+        return np.column_stack([mae, np.sqrt(mse), within, spearman])
+
+    point = metrics(story_sums.sum(axis=0)[None], np.ones((1, n_stories)))[0]
+
+    rng = np.random.default_rng(seed)
+    # trial draws are padded to the largest story and masked
+    width = int(sizes.max())
+    ragged = width > sizes.min()
+    padded = np.vstack([table, np.zeros((1, 3))])
+    block = max(1, BLOCK_ELEMENTS // (3 * n_stories * width))
+    draws = []
+    for start in range(0, n_resamples, block):
+        b = min(block, n_resamples - start)
+        picks = rng.integers(0, n_stories, size=(b, n_stories))
+        reps = np.bincount((picks + n_stories * np.arange(b)[:, None]).ravel(),
+                           minlength=b * n_stories).reshape(b, n_stories)
+        if resample_trials:
+            u = rng.random((b, n_stories, width), dtype=np.float32)
+            size = sizes[picks][:, :, None]
+            # float32 rounding can take u * size up to size itself
+            pos = np.minimum((u * size.astype(np.float32)).astype(np.intp), size - 1)
+            idx = starts[picks][:, :, None] + pos
+            if ragged:  # padding past a story's trials reads the zero row
+                idx = np.where(np.arange(width) < size, idx, n_trials)
+            sums = np.einsum("bswk->bk", np.take(padded, idx, axis=0))
+        else:
+            sums = reps @ story_sums
+        draws.append(metrics(sums, reps.astype(float)))
+    draws = np.concatenate(draws)
+    alpha = 100 * (1 - level) / 2
+    with np.errstate(invalid="ignore"):
+        lo, hi = np.nanpercentile(draws, [alpha, 100 - alpha], axis=0)
+
+    def clean(x):
+        return None if np.isnan(x) else float(x)
+    return {name: {"value": clean(point[i]), "ci": [clean(lo[i]), clean(hi[i])]}
+            for i, name in enumerate(ACCURACY_METRICS)}
+
+
+def accuracy_summary(state: dict, stories_csv: str,
+                     n_resamples: int = ACCURACY_RESAMPLES,
+                     level: float = ACCURACY_CI_LEVEL, seed: int = 0) -> dict:
+    """
+    Accuracy of the LLM trials in a summary state and of heuristic_estimate
+    against the ``human_baseline`` column of ``stories_csv``, on the stories
+    that have both a human baseline and at least one parsed estimate.
+    Returns None when the CSV has no human_baseline column.
+    """
+    stories = pd.read_csv(stories_csv, usecols=lambda c: c in
+                          ("id", "story", "human_baseline"))
+    if "human_baseline" not in stories.columns:
+        return None
+    stories = stories.dropna(subset=["human_baseline"])
+    hists = state["stories"]
+    stories = stories[[bool(hists.get(str(sid), {}).get("hist"))
+                       for sid in stories["id"]]]
+    if stories.empty:
+        return None
+
+    story, value, count = [], [], []
+    for i, sid in enumerate(stories["id"]):
+        for v, k in hists[str(sid)]["hist"].items():
+            story.append(i)
+            value.append(float(v))
+            count.append(k)
+    truth = stories["human_baseline"].to_numpy(dtype=float)
+    heuristic = heuristic_estimate_batch(stories["story"])
+    positions = np.arange(len(stories))
+    return {
+        "stories": len(stories),
+        "trials": int(sum(count)),
+        "resamples": n_resamples,
+        "ci_level": level,
+        "llm": bootstrap_accuracy(story, value, count, truth, True,
+                                  n_resamples, level, seed),
+        "heuristic": bootstrap_accuracy(positions, heuristic,
+                                        np.ones(len(stories), dtype=np.int64),
+                                        truth, False, n_resamples, level, seed)
+    }
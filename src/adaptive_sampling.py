@@ -0,0 +1,89 @@
+import numpy as np
+
+
+class AdaptiveScheduler:
+    """
+    Decides how many trials each story gets. Every story first receives
+    ``min_trials``; afterwards, rounds hand one extra trial to each story
+    whose estimates have not converged, most uncertain first, until the
+    stories converge, hit ``max_trials`` or the call ``budget`` runs out.
+
+    A story has converged once it has at least ``min_trials`` valid
+    estimates and their uncertainty is at most ``tolerance``. Uncertainty
+    is the std of the estimates (``metric="std"``) or the share falling
+    outside ±1 of their mean (``metric="consistency"``, i.e. one minus
+    evaluate's consistency_within_±1).
+
+    ``budget`` must cover ``min_trials`` for every story; records of
+    stories that are not scheduled (e.g. from an older stories file when
+    resuming) are ignored.
+    """
+
+    def __init__(self, story_ids, min_trials: int = 2, max_trials: int = 10,
+                 budget: int = None, metric: str = "std",
+                 tolerance: float = 0.5):
+        if metric not in ("std", "consistency"):
+            raise ValueError(f"unknown convergence metric {metric!r}")
+        self.story_ids = list(story_ids)
+        if budget is not None and budget < min_trials * len(self.story_ids):
+            raise ValueError(f"a budget of {budget} calls cannot give "
+                             f"{len(self.story_ids)} stories {min_trials} trials each")
+        self.min_trials = min_trials
+        self.max_trials = max(max_trials, min_trials)
+        self.budget = budget
+        self.metric = metric
+        self.tolerance = tolerance
+        self.trials = {sid: 0 for sid in self.story_ids}
+        self.estimates = {sid: [] for sid in self.story_ids}
+        self.calls = 0
+
+    def observe(self, story_id, trial: int, estimate):
+        """Record a finished trial (``estimate`` is None when unparsable)."""
+        if story_id not in self.trials:
+            return
+        self.trials[story_id] = max(self.trials[story_id], trial + 1)
+        self.calls += 1
+        if estimate is not None and estimate == estimate:
+            self.estimates[story_id].append(float(estimate))
+
+    def uncertainty(self, story_id) -> float:
+        ests = np.asarray(self.estimates[story_id])
+        if len(ests) < 2:
+            return np.inf
+        if self.metric == "std":
+            return float(ests.std())
+        return 1.0 - float((np.abs(ests - ests.mean()) <= 1).mean())
+
+    def converged(self, story_id) -> bool:
+        if len(self.estimates[story_id]) < self.min_trials:
+            return False
+        return self.uncertainty(story_id) <= self.tolerance
+
+    def _budget_left(self) -> float:
+        return np.inf if self.budget is None else self.budget - self.calls
+
+    def next_round(self) -> list:
+        """Return the (story_id, trial) pairs to run next; empty when done."""
+        budget = self._budget_left()
+        jobs = [(sid, t) for sid in self.story_ids
+                for t in range(self.trials[sid], self.min_trials)]
+        if jobs:
+            return jobs[:max(0, int(min(budget, len(jobs))))]
+        open_stories = [sid for sid in self.story_ids
+                        if self.trials[sid] < self.max_trials
+                        and not self.converged(sid)]
+        open_stories.sort(key=self.uncertainty, reverse=True)
+        return [(sid, self.trials[sid])
+                for sid in open_stories[:max(0, int(min(budget, len(open_stories))))]]
+
+    def report(self, fixed_trials: int) -> dict:
+        """Calls spent versus running every story ``fixed_trials`` times."""
+        fixed_calls = fixed_trials * len(self.story_ids)
+        return {
+            "calls": self.calls,
+            "fixed_calls": fixed_calls,
+            "calls_saved": fixed_calls - self.calls,
+            "converged_stories": sum(self.converged(sid) for sid in self.story_ids),
+            "stories": len(self.story_ids),
+            "trials_per_story": dict(self.trials)
+        }
@@ -0,0 +1,161 @@
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from src import call_metrics, model_inference
+from src.output_parser import split_multi_output
+
+BATCH_MODES = ("single", "n", "multi")
+CALL_ERRORS = (requests.RequestException, model_inference.CircuitOpenError,
+               KeyError, ValueError)
+
+
+def _call_single(batch, timeout, use_cache, stream_mode=None):
+    (story_id, trial, story), = batch
+    raw, latency, metrics = model_inference.query_model(
+        story, timeout, trial=trial, use_cache=use_cache, with_metrics=True,
+        stream_mode=stream_mode)
+    return [(story_id, trial, story, raw, latency, None, metrics)]
+
+
+def _call_n(batch, timeout, use_cache):
+    story_id, first_trial, story = batch[0]
+    outputs = model_inference.query_model_n(story, len(batch), first_trial,
+                                            timeout, use_cache=use_cache,
+                                            with_metrics=True)
+    return [(sid, t, s, raw, latency, None, metrics)
+            for (sid, t, s), (raw, latency, metrics) in zip(batch, outputs)]
+
+
+def _call_multi(batch, timeout, use_cache):
+    stories = [(sid, story) for sid, _, story in batch]
+    raw, latency, call = model_inference.query_model_multi(
+        stories, trial=batch[0][1], timeout=timeout, use_cache=use_cache,
+        with_metrics=True)
+    per_story = split_multi_output(raw, [sid for sid, _ in stories])
+    latency /= len(batch)
+    metrics = call if call["cached"] else call_metrics.trial_metrics(call, len(batch))
+    return [(sid, t, story, per_story[sid] or "", latency, None, dict(metrics))
+            for sid, t, story in batch]
+
+
+CALLS = {"single": _call_single, "n": _call_n, "multi": _call_multi}
+
+
+def check_modes(batch_mode: str, batch_size: int, stream_mode: str = None) -> str:
+    """
+    Validate a batch/stream mode combination and return the stream mode
+    in effect (default $LM_STREAM_MODE); raises ValueError when the modes
+    are unknown or streaming is combined with batched requests.
+    """
+    if batch_mode not in BATCH_MODES:
+        raise ValueError(f"unknown batch mode {batch_mode!r}")
+    stream_mode = stream_mode or model_inference.STREAM_MODE
+    if stream_mode not in model_inference.STREAM_MODES:
+        raise ValueError(f"unknown stream mode {stream_mode!r}")
+    if stream_mode != "off" and batch_mode != "single" and batch_size > 1:
+        raise ValueError("streaming needs batch mode 'single'")
+    return stream_mode
+
+
+def _batched(jobs, mode: str, size: int):
+    """
+    Group (story_id, trial, story) jobs into request batches: one job per
+    batch in "single" mode, consecutive trials of one story in "n" mode,
+    and distinct stories sharing a trial index in "multi" mode.
+    """
+    if mode == "single" or size <= 1:
+        for job in jobs:
+            yield [job]
+    elif mode == "n":
+        batch = []
+        for job in jobs:
+            if batch and (job[0] != batch[0][0] or job[1] != batch[-1][1] + 1
+                          or len(batch) >= size):
+                yield batch
+                batch = []
+            batch.append(job)
+        if batch:
+            yield batch
+    else:
+        open_batches = {}
+        for job in jobs:
+            batch = open_batches.setdefault(job[1], [])
+            batch.append(job)
+            if len(batch) >= size:
+                yield open_batches.pop(job[1])
+        yield from open_batches.values()
+
+
+async def _run_batch(loop, executor, batch, timeout, use_cache, mode,
+                     stream_mode):
+    if len(batch) == 1:
+        call = partial(_call_single, batch, timeout, use_cache, stream_mode)
+    else:
+        call = partial(CALLS[mode], batch, timeout, use_cache)
+    try:
+        return await loop.run_in_executor(executor, call)
+    except CALL_ERRORS as e:
+        return [(sid, t, story, "", None, str(e), None)
+                for sid, t, story in batch]
+
+
+async def query_jobs_async(jobs, concurrency: int = 4, timeout: int = 60,
+                           use_cache: bool = None, batch_mode: str = "single",
+                           batch_size: int = 1, stream_mode: str = None):
+    """
+    Fan out (story_id, trial, story) jobs to the model with at most
+    ``concurrency`` requests in flight, yielding
+    (story_id, trial, story, raw_output, latency, error, metrics) as each one
+    finishes, where ``metrics`` holds the call_metrics.CALL_METRIC_COLUMNS.
+    Jobs are pulled lazily, so ``jobs`` may be an arbitrarily long iterator.
+    A request that still fails after the client's retries yields an empty
+    ``raw_output``, the error message and no metrics instead of aborting
+    the run.
+
+    ``batch_mode`` "n" asks for up to ``batch_size`` completions of a story
+    per request; "multi" packs up to ``batch_size`` stories into one prompt.
+    ``stream_mode`` (see model_inference.STREAM_MODES) applies to
+    unbatched requests only.
+    """
+    stream_mode = check_modes(batch_mode, batch_size, stream_mode)
+    loop = asyncio.get_running_loop()
+    batches = _batched(jobs, batch_mode, batch_size)
+    pending = set()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            while True:
+                for batch in batches:
+                    pending.add(asyncio.ensure_future(_run_batch(
+                        loop, executor, batch, timeout, use_cache, batch_mode,
+                        stream_mode)))
+                    if len(pending) >= concurrency:
+                        break
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    for res in fut.result():
+                        yield res
+        finally:
+            for fut in pending:
+                fut.cancel()
+
+
+def run_jobs(jobs, on_result, concurrency: int = 4, timeout: int = 60,
+             use_cache: bool = None, batch_mode: str = "single",
+             batch_size: int = 1, stream_mode: str = None) -> int:
+    """
+    Synchronous driver for query_jobs_async. Calls ``on_result`` with each
+    completed tuple in completion order and returns the number of jobs run.
+    """
+    async def _drive():
+        n = 0
+        async for res in query_jobs_async(jobs, concurrency, timeout,
+                                          use_cache, batch_mode, batch_size,
+                                          stream_mode):
+            on_result(*res)
+            n += 1
+        return n
+    return asyncio.run(_drive())
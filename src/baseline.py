@@ -1,33 +1,165 @@
+import json, os, re
+import numpy as np
+
+BASELINE_KEYWORDS = os.getenv("BASELINE_KEYWORDS")
+
+# Tiers are checked in order; the first tier with any matching keyword
+# scores min(cap, base + number of distinct keywords matched).
+DEFAULT_TIERS = {
+    "tiers": [
+        {"name": "high", "base": 6, "cap": 10,
+         "keywords": ["integrate", "export", "import", "payment", "real time",
+                      "dashboard", "analytics", "notifications"]},
+        {"name": "medium", "base": 3, "cap": 8,
+         "keywords": ["update", "create", "form", "auth", "discount", "assign"]},
+        {"name": "low", "base": 1, "cap": 5,
+         "keywords": ["view", "read", "list", "display", "browse"]}
+    ],
+    "default": 3
+}
+
+
+def load_keyword_tiers(path: str = None) -> dict:
+    """
+    Load keyword tiers from a JSON file with the same layout as
+    DEFAULT_TIERS. Falls back to $BASELINE_KEYWORDS, then the defaults.
+    """
+    path = path or BASELINE_KEYWORDS
+    if not path:
+        return DEFAULT_TIERS
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _trie_pattern(keywords) -> str:
+    """
+    Regex alternation factored into a prefix trie, e.g. ``im(?:port|age)``.
+    Python's regex engine backtracks through a flat alternation keyword by
+    keyword; the trie form rejects a position after one character test, so
+    scan cost stays nearly flat as the vocabulary grows. Optional suffixes
+    are greedy, so the longest keyword at a position wins.
+    """
+    trie = {}
+    for kw in keywords:
+        node = trie
+        for ch in kw:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        alts = [re.escape(ch) + build(child)
+                for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if "" in node:
+            return body + "?" if len(alts) == 1 and len(body) == 1 else f"(?:{body})?"
+        return body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Single compiled multi-pattern matcher over every tier's keywords.
+
+    One trie-regex scan per story finds the longest keyword starting at each
+    position; keywords contained in a longer match are credited too, so
+    the distinct-keyword counts equal a per-keyword substring test.
+    """
+
+    def __init__(self, tiers: dict = None):
+        tiers = tiers or load_keyword_tiers()
+        self.default = tiers.get("default", 3)
+        self.base = np.array([t["base"] for t in tiers["tiers"]])
+        self.cap = np.array([t["cap"] for t in tiers["tiers"]])
+
+        self.keywords = []
+        self.tier_of = []
+        for i, tier in enumerate(tiers["tiers"]):
+            for kw in tier["keywords"]:
+                kw = kw.lower()
+                if kw not in self.keywords:
+                    self.keywords.append(kw)
+                    self.tier_of.append(i)
+        self.tier_of = np.array(self.tier_of, dtype=int)
+        self.index = {kw: i for i, kw in enumerate(self.keywords)}
+        self.contains = {kw: [self.index[other] for other in self.keywords
+                              if other in kw]
+                         for kw in self.keywords}
+        self.pattern = (re.compile(f"(?=({_trie_pattern(self.keywords)}))")
+                        if self.keywords else None)
+
+    def tier_counts(self, stories) -> np.ndarray:
+        """(n_stories, n_tiers) array of distinct keywords matched per tier."""
+        counts = np.zeros((len(stories), len(self.base)), dtype=int)
+        if self.pattern is None:
+            return counts
+        rows, hit_ids = [], []
+        for row, story in enumerate(stories):
+            hits = set()
+            for kw in set(self.pattern.findall(str(story).lower())):
+                hits.update(self.contains[kw])
+            rows.extend([row] * len(hits))
+            hit_ids.extend(hits)
+        np.add.at(counts, (np.array(rows, dtype=int),
+                           self.tier_of[np.array(hit_ids, dtype=int)]), 1)
+        return counts
+
+    def estimate(self, stories) -> np.ndarray:
+        """Heuristic story points for each story as an int array."""
+        counts = self.tier_counts(stories)
+        scores = np.minimum(self.cap, self.base + counts)
+        out = np.full(len(stories), self.default, dtype=int)
+        # Walk tiers from lowest to highest priority so earlier tiers win
+        for i in reversed(range(counts.shape[1])):
+            out = np.where(counts[:, i] > 0, scores[:, i], out)
+        return out
+
+
+_default_matcher = None
+
+
+def get_matcher() -> KeywordMatcher:
+    global _default_matcher
+    if _default_matcher is None:
+        _default_matcher = KeywordMatcher()
+    return _default_matcher
+
+
+def heuristic_estimate_batch(stories, matcher: KeywordMatcher = None) -> np.ndarray:
+    """
+    Vectorised heuristic_estimate over a column, list or array of stories,
+    returning a NumPy int array of estimates.
+    """
+    return (matcher or get_matcher()).estimate(list(stories))
+
+
 def heuristic_estimate(story: str) -> int:
     """
     A simple keyword-based heuristic for story point estimation.
     This is a baseline method that can be used for comparison.
     """
-    # Define complexity indicators
-    low_complexity_indicators = ["view", "read", "list", "display", "browse"]
-    medium_complexity_indicators = ["update", "create", "form", "auth",
-        "discount", "assign"]
-    high_complexity_indicators = ["integrate", "export", "import", "payment",
-        "real time", "dashboard", "analytics",
-        "notifications"]
-
-    story_lower = story.lower()
-
-    # Count complexity indicators
-    low_count = sum(1 for indicator in low_complexity_indicators
-                    if indicator in story_lower)
-    medium_count = sum(1 for indicator in medium_complexity_indicators
-                       if indicator in story_lower)
-    high_count = sum(1 for indicator in high_complexity_indicators
-                     if indicator in story_lower)
-
-    # Determine score based on complexity indicators
-    if high_count > 0:
-        return min(10, 6 + high_count)  # High complexity: 6-10 points
-    elif medium_count > 0:
-        return min(8, 3 + medium_count)  # Medium complexity: 3-8 points
-    elif low_count > 0:
-        return min(5, 1 + low_count)  # Low complexity: 1-5 points
-    else:
-        return 3  # Default for unrecognized patterns
+    return int(heuristic_estimate_batch([story])[0])
+
 
+if __name__ == "__main__":
+    import argparse
+    import pandas as pd
+    parser = argparse.ArgumentParser(description="Add heuristic baseline "
+                                     "estimates to a stories CSV")
+    parser.add_argument("in_csv")
+    parser.add_argument("out_csv")
+    parser.add_argument("--keywords", help="keyword tiers JSON file")
+    parser.add_argument("--chunksize", type=int, default=100000)
+    args = parser.parse_args()
+    matcher = KeywordMatcher(load_keyword_tiers(args.keywords))
+    n = 0
+    for i, chunk in enumerate(pd.read_csv(args.in_csv, chunksize=args.chunksize)):
+        # empty stories read back as NaN, which str() would turn into "nan"
+        stories = chunk["story"].fillna("").to_numpy()
+        chunk["baseline_estimate"] = matcher.estimate(stories)
+        chunk.to_csv(args.out_csv, mode="w" if i == 0 else "a",
+                     header=i == 0, index=False)
+        n += len(chunk)
+    print(f"Estimated {n} stories into {args.out_csv}")
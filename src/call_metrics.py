@@ -0,0 +1,71 @@
+import warnings
+
+# Per-trial columns written next to response_time. Timings are monotonic
+# seconds: queue_time is spent before the final attempt was sent (circuit
+# breaker waits, failed attempts, backoff), wait_time from sending it to the
+# response headers (connect, server queueing and generation), read_time
+# reading and decoding the body, and ttft (streamed calls only) from sending
+# it to the first content chunk. Calls shared by several trials (n and
+# multi batch modes) split timings and completion tokens evenly. endpoint
+# is the server that answered.
+CALL_METRIC_COLUMNS = ["cached", "endpoint", "retries", "queue_time",
+                       "wait_time", "read_time", "ttft", "prompt_tokens",
+                       "completion_tokens", "finish_reason"]
+
+FINISH_TRUNCATED = "length"
+# Streamed call closed by the client once the estimate had been read
+FINISH_EARLY_STOP = "early_stop"
+
+_hooks = []
+
+
+def register_hook(hook):
+    """
+    Call ``hook(record)`` after every upstream request with a dict of
+    url, endpoint, model, status ("ok" or "error"), error, retries, queue_time,
+    wait_time, read_time, ttft, total_time, prompt_tokens, completion_tokens,
+    finish_reason and n_choices. Returns ``hook`` so it can be used as a
+    decorator. Hooks run on the requesting thread and should be quick.
+    """
+    _hooks.append(hook)
+    return hook
+
+
+def unregister_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def emit(record: dict):
+    for hook in list(_hooks):
+        try:
+            hook(record)
+        except Exception as e:
+            warnings.warn(f"metrics hook {hook!r} failed: {e}")
+
+
+def cached_metrics() -> dict:
+    """Metrics columns for a trial served from the response cache."""
+    return dict(dict.fromkeys(CALL_METRIC_COLUMNS), cached=True)
+
+
+def trial_metrics(call: dict, k: int = 1, choice: dict = None) -> dict:
+    """
+    Share of one upstream call's metrics attributed to each of the ``k``
+    trials it produced; ``choice`` supplies a per-choice finish_reason.
+    """
+    def split(value):
+        return None if value is None else value / k
+    finish = (choice or {}).get("finish_reason", call.get("finish_reason"))
+    return {
+        "cached": False,
+        "endpoint": call.get("endpoint"),
+        "retries": call.get("retries"),
+        "queue_time": split(call.get("queue_time")),
+        "wait_time": split(call.get("wait_time")),
+        "read_time": split(call.get("read_time")),
+        "ttft": call.get("ttft"),
+        "prompt_tokens": split(call.get("prompt_tokens")),
+        "completion_tokens": split(call.get("completion_tokens")),
+        "finish_reason": finish
+    }
@@ -0,0 +1,257 @@
+import os, threading, time, requests
+from collections import deque
+import numpy as np
+from src.model_inference import (LLMClient, CircuitOpenError, MAX_RETRIES,
+                                 RETRY_STATUSES)
+
+ENDPOINT_CONCURRENCY = int(os.getenv("LM_ENDPOINT_CONCURRENCY", "4"))
+HEALTH_INTERVAL = float(os.getenv("LM_HEALTH_INTERVAL", "5"))
+
+POOL_ERRORS = (requests.RequestException, CircuitOpenError)
+
+
+def _is_client_error(error: Exception) -> bool:
+    """A non-transient 4xx: the request is at fault, not the endpoint."""
+    response = getattr(error, "response", None)
+    return (isinstance(error, requests.HTTPError) and response is not None
+            and 400 <= response.status_code < 500
+            and response.status_code not in RETRY_STATUSES)
+
+
+def parse_hosts(spec: str, default_cap: int = ENDPOINT_CONCURRENCY) -> list:
+    """
+    Parse "http://gpu1:1234=8,http://gpu2:1234" into [(host, cap), ...];
+    entries without ``=cap`` get ``default_cap`` concurrent requests.
+    """
+    hosts = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, _, cap = entry.partition("=")
+        hosts.append((host.rstrip("/"), int(cap) if cap else default_cap))
+    return hosts
+
+
+class Endpoint:
+    """One model server: its client, in-flight count and latency record."""
+
+    def __init__(self, host: str, cap: int, model: str = None):
+        self.host = host
+        self.cap = cap
+        self.model = model
+        # Ejection takes the place of the per-client circuit breaker
+        self.client = LLMClient(host=host, pool_size=cap, max_retries=0,
+                                breaker_threshold=float("inf"))
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.ewma = None
+        self.samples = 0  # successes since (re-)admission
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+        self.ejected_at = None
+        self.recent = deque(maxlen=1000)
+
+    def stats(self) -> dict:
+        lat = np.fromiter(self.recent, dtype=float)
+        p50, p95, p99 = (np.percentile(lat, [50, 95, 99]) if len(lat)
+                         else (None, None, None))
+        return {
+            "healthy": self.healthy,
+            "cap": self.cap,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+            "mean": float(lat.mean()) if len(lat) else None,
+            "p50": None if p50 is None else float(p50),
+            "p95": None if p95 is None else float(p95),
+            "p99": None if p99 is None else float(p99)
+        }
+
+
+class EndpointPool:
+    """
+    Spreads requests over several model servers; a drop-in replacement for
+    LLMClient (same ``post`` and ``stream``).
+
+    Each request goes to the healthy endpoint with the fewest outstanding
+    requests relative to its cap (ties go to the lower latency average),
+    and waits when every endpoint is at its cap. Failed requests are
+    retried on another endpoint. An endpoint is ejected after
+    ``eject_after`` consecutive failures, or when its latency average
+    exceeds ``slow_factor`` times the fastest healthy endpoint's; the last
+    healthy endpoint is never ejected. A background thread probes ejected
+    endpoints (``GET /v1/models``) every ``health_interval`` seconds once
+    they have sat out ``cooldown`` seconds, and re-admits those that answer.
+    """
+
+    def __init__(self, hosts, max_retries: int = MAX_RETRIES,
+                 eject_after: int = 3, slow_factor: float = 5.0,
+                 min_samples: int = 5, cooldown: float = 30.0,
+                 health_interval: float = HEALTH_INTERVAL,
+                 ewma_alpha: float = 0.2):
+        self.endpoints = [h if isinstance(h, Endpoint) else Endpoint(*h)
+                          for h in hosts]
+        if not self.endpoints:
+            raise ValueError("endpoint pool needs at least one host")
+        self.max_retries = max_retries
+        self.eject_after = eject_after
+        self.slow_factor = slow_factor
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.health_interval = health_interval
+        self.ewma_alpha = ewma_alpha
+
+        self._cond = threading.Condition()
+        self._closed = threading.Event()
+        self._checker = threading.Thread(target=self._health_loop, daemon=True)
+        self._checker.start()
+
+    @classmethod
+    def from_spec(cls, spec: str, **kwargs) -> "EndpointPool":
+        return cls(parse_hosts(spec), **kwargs)
+
+    @property
+    def url(self) -> str:
+        return ",".join(ep.host for ep in self.endpoints)
+
+    def _acquire(self, deadline: float, exclude=None) -> Endpoint:
+        with self._cond:
+            while True:
+                healthy = [ep for ep in self.endpoints if ep.healthy]
+                # a failed endpoint is skipped on retry while others remain
+                candidates = [ep for ep in healthy
+                              if ep.outstanding < ep.cap and ep is not exclude]
+                if not candidates and exclude is not None and len(healthy) == 1:
+                    candidates = [ep for ep in healthy if ep.outstanding < ep.cap]
+                if candidates:
+                    ep = min(candidates, key=lambda e: (e.outstanding / e.cap,
+                                                        e.ewma or 0.0))
+                    ep.outstanding += 1
+                    return ep
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise requests.Timeout("no endpoint available before deadline")
+                self._cond.wait(remaining)
+
+    def _eject(self, ep: Endpoint):
+        if sum(e.healthy for e in self.endpoints) <= 1:
+            return
+        ep.healthy = False
+        ep.ejections += 1
+        ep.ejected_at = time.monotonic()
+
+    def _release(self, ep: Endpoint, ok, latency: float = None):
+        """
+        Free ``ep``'s slot and record the outcome: ``ok`` True for a
+        success, False for an endpoint failure and None for an error that
+        is not the endpoint's fault, which is not charged to it.
+        """
+        with self._cond:
+            ep.outstanding -= 1
+            ep.requests += 1
+            if ok:
+                ep.failures = 0
+                ep.recent.append(latency)
+                ep.samples += 1
+                ep.ewma = (latency if ep.ewma is None else
+                           ep.ewma + self.ewma_alpha * (latency - ep.ewma))
+                self._check_slow(ep)
+            elif ok is not None:
+                ep.errors += 1
+                ep.failures += 1
+                if ep.healthy and ep.failures >= self.eject_after:
+                    self._eject(ep)
+            self._cond.notify_all()
+
+    def _check_slow(self, ep: Endpoint):
+        if not self.slow_factor or not ep.healthy or ep.samples < self.min_samples:
+            return
+        peers = [e.ewma for e in self.endpoints
+                 if e.healthy and e is not ep and e.samples >= self.min_samples]
+        if peers and ep.ewma > self.slow_factor * min(peers):
+            self._eject(ep)
+
+    def _probe(self, ep: Endpoint) -> bool:
+        try:
+            r = ep.client.session.get(f"{ep.host}/v1/models", timeout=5)
+            return r.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def _health_loop(self):
+        while not self._closed.wait(self.health_interval):
+            now = time.monotonic()
+            with self._cond:
+                due = [ep for ep in self.endpoints
+                       if not ep.healthy and now - ep.ejected_at >= self.cooldown]
+            # probe without the lock so requests are not held up meanwhile
+            for ep in due:
+                ok = self._probe(ep)
+                with self._cond:
+                    if ok:
+                        ep.healthy = True
+                        ep.failures = 0
+                        ep.ewma = None
+                        ep.samples = 0
+                        self._cond.notify_all()
+                    else:
+                        ep.ejected_at = now
+
+    def _call(self, method: str, payload: dict, timeout: float, metrics: dict,
+              **kwargs):
+        start = time.monotonic()
+        deadline = start + timeout
+        attempt = 0
+        failed = None
+        while True:
+            ep = self._acquire(deadline, exclude=failed)
+            body = dict(payload, model=ep.model) if ep.model else payload
+            t0 = time.monotonic()
+            # the slot is released whatever happens; only transport errors
+            # and server-side failures count against the endpoint
+            ok, latency = None, None
+            try:
+                result = getattr(ep.client, method)(
+                    body, timeout=max(0.0, deadline - t0), metrics=metrics,
+                    **kwargs)
+                ok, latency = True, time.monotonic() - t0
+            except POOL_ERRORS as e:
+                if _is_client_error(e):
+                    raise
+                ok = False
+                if attempt >= self.max_retries or time.monotonic() >= deadline:
+                    raise
+            finally:
+                self._release(ep, ok, latency)
+            if not ok:
+                attempt += 1
+                failed = ep
+                continue
+            if metrics is not None:
+                # waiting for a free endpoint and failed attempts count as queueing
+                metrics["retries"] = attempt
+                metrics["queue_time"] = (t0 - start) + (metrics.get("queue_time") or 0.0)
+            return result
+
+    def post(self, payload: dict, timeout: float = 60, metrics: dict = None) -> dict:
+        """LLMClient.post on the least-loaded healthy endpoint, with failover."""
+        return self._call("post", payload, timeout, metrics)
+
+    def stream(self, payload: dict, timeout: float = 60, metrics: dict = None,
+               on_delta=None) -> str:
+        """LLMClient.stream on the least-loaded healthy endpoint, with failover."""
+        return self._call("stream", payload, timeout, metrics, on_delta=on_delta)
+
+    def stats(self) -> dict:
+        """Per-endpoint health, load, error and latency figures."""
+        with self._cond:
+            return {ep.host: ep.stats() for ep in self.endpoints}
+
+    def close(self):
+        self._closed.set()
+        for ep in self.endpoints:
+            ep.client.close()
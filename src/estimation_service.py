@@ -0,0 +1,298 @@
+import json, os, threading, time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from src import model_inference
+from src.async_inference import CALL_ERRORS
+from src.output_parser import (STATUS_OK, load_output, parse_output,
+                               split_multi_output)
+
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8080"))
+BATCH_WINDOW = float(os.getenv("SERVICE_BATCH_WINDOW", "0.01"))
+MAX_BATCH = int(os.getenv("SERVICE_MAX_BATCH", "8"))
+WORKERS = int(os.getenv("SERVICE_WORKERS", "4"))
+LATENCY_WINDOW = 1000
+
+
+def _latency_stats(samples) -> dict:
+    if not samples:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None}
+    arr = np.fromiter(samples, dtype=float)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {"count": len(arr), "mean": float(arr.mean()), "p50": float(p50),
+            "p95": float(p95), "p99": float(p99)}
+
+
+def _response_fields(raw) -> dict:
+    """Parsed estimate, confidence and reasons of one raw response."""
+    parsed = parse_output(raw)
+    reasons = None
+    if parsed["parse_status"] == STATUS_OK:
+        reasons = load_output(raw).get("reasons")
+    return {
+        "estimate": parsed["estimate"],
+        "confidence": parsed["confidence"],
+        "reasons": reasons if isinstance(reasons, list) else None,
+        "parse_status": parsed["parse_status"],
+        "parse_error": parsed["parse_error"]
+    }
+
+
+class EstimationService:
+    """
+    On-demand story estimates on top of query_model.
+
+    Requests for a story that is already queued or in flight share its
+    pending future, so identical concurrent requests cost one upstream
+    call. Distinct stories arriving within ``window`` seconds of the first
+    queued one are packed into a single multi-story request of up to
+    ``max_batch`` stories; stories the model skips in a batch answer are
+    retried on their own. At most ``workers`` batches run at once; further
+    stories wait in the queue (``queue_depth`` in metrics) until a worker
+    frees up, and ``in_flight`` counts stories of running batches only.
+    """
+
+    def __init__(self, window: float = BATCH_WINDOW, max_batch: int = MAX_BATCH,
+                 workers: int = WORKERS, timeout: int = 60,
+                 use_cache: bool = None):
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.timeout = timeout
+        self.use_cache = use_cache
+
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._pending = {}
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.Semaphore(workers)
+
+        self.requests = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.batched_stories = 0
+        self.errors = 0
+        self.in_flight = 0
+        self._request_latency = deque(maxlen=LATENCY_WINDOW)
+        self._upstream_latency = deque(maxlen=LATENCY_WINDOW)
+
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, story: str) -> Future:
+        """Queue ``story`` (or join its pending request); returns a Future."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("estimation service is closed")
+            self.requests += 1
+            fut = self._pending.get(story)
+            if fut is not None:
+                self.coalesced += 1
+                return fut
+            fut = self._pending[story] = Future()
+            self._queue.append(story)
+            self._cond.notify()
+            return fut
+
+    def estimate(self, story: str, timeout: float = None) -> dict:
+        """Blocking estimate of one story with its request latency."""
+        t0 = time.monotonic()
+        result = self.submit(story).result(timeout or self.timeout)
+        latency = time.monotonic() - t0
+        with self._cond:
+            self._request_latency.append(latency)
+        return dict(result, latency=latency)
+
+    def _dispatch(self):
+        while True:
+            # batches are formed only when a worker is free, so stories
+            # waiting for one stay in the queue (and can still be batched)
+            self._slots.acquire()
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    self._slots.release()
+                    return
+                deadline = time.monotonic() + self.window
+                while len(self._queue) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._queue.popleft()
+                         for _ in range(min(len(self._queue), self.max_batch))]
+                self.in_flight += len(batch)
+                self.batches += 1
+                self.batched_stories += len(batch)
+            self._executor.submit(self._run_batch, batch)
+
+    def _query(self, batch) -> dict:
+        if len(batch) == 1:
+            raw, _ = model_inference.query_model(batch[0], self.timeout,
+                                                 use_cache=self.use_cache)
+            return {batch[0]: raw}
+        ids = [str(i) for i in range(len(batch))]
+        raw, _ = model_inference.query_model_multi(
+            list(zip(ids, batch)), timeout=self.timeout, use_cache=self.use_cache)
+        per_story = split_multi_output(raw, ids)
+        raws = {story: per_story[i] for i, story in zip(ids, batch)}
+        for story, raw in raws.items():
+            if raw is None:
+                raws[story], _ = model_inference.query_model(
+                    story, self.timeout, use_cache=self.use_cache)
+        return raws
+
+    def _run_batch(self, batch):
+        t0 = time.monotonic()
+        try:
+            results = {story: _response_fields(raw)
+                       for story, raw in self._query(batch).items()}
+            error = None
+        except Exception as e:  # every waiter must be released, whatever failed
+            error = e
+        with self._cond:
+            self._upstream_latency.append(time.monotonic() - t0)
+            self.in_flight -= len(batch)
+            if error is not None:
+                self.errors += 1
+            futures = [(story, self._pending.pop(story)) for story in batch]
+        self._slots.release()
+        for story, fut in futures:
+            if error is None:
+                fut.set_result(results[story])
+            else:
+                fut.set_exception(error)
+
+    def metrics(self) -> dict:
+        with self._cond:
+            return {
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "queue_depth": len(self._queue),
+                "in_flight": self.in_flight,
+                "batches": self.batches,
+                "mean_batch_size": (self.batched_stories / self.batches
+                                    if self.batches else None),
+                "errors": self.errors,
+                "request_latency": _latency_stats(self._request_latency),
+                "upstream_latency": _latency_stats(self._upstream_latency)
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        if path == "/metrics":
+            self._send_json(200, self.server.service.metrics())
+        elif path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if self.path.rstrip("/") != "/estimate":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            story = json.loads(self.rfile.read(length) or b"{}").get("story")
+        except (json.JSONDecodeError, AttributeError):
+            story = None
+        if not isinstance(story, str) or not story.strip():
+            self._send_json(400, {"error": "expected JSON body with a 'story' string"})
+            return
+        try:
+            self._send_json(200, self.server.service.estimate(story))
+        except FutureTimeout:
+            self._send_json(504, {"error": "timed out waiting for the model"})
+        except CALL_ERRORS as e:
+            self._send_json(502, {"error": str(e)})
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+
+
+class EstimationServer:
+    """
+    HTTP front end for EstimationService: ``POST /estimate`` with
+    ``{"story": ...}`` returns the parsed estimate, confidence and reasons;
+    ``GET /metrics`` reports queue depth, coalescing, batch sizes and
+    latency percentiles.
+    """
+
+    def __init__(self, host: str = SERVICE_HOST, port: int = SERVICE_PORT,
+                 service: EstimationService = None):
+        self.service = service or EstimationService()
+        self.httpd = ThreadingHTTPServer((host, port), _ServiceHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.service = self.service
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.service.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve on-demand story "
+                                     "estimates over HTTP")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--window", type=float, default=BATCH_WINDOW,
+                        help="seconds to wait for more stories to batch")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--timeout", type=int, default=60)
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+    service = EstimationService(args.window, args.max_batch, args.workers,
+                                args.timeout,
+                                use_cache=False if args.no_cache else None)
+    server = EstimationServer(args.host, args.port, service)
+    print(f"Estimation service listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    finally:
+        service.close()
@@ -1,64 +1,461 @@
-import pandas as pd, json, numpy as np, os
-
-def evaluate(parsed_csv: str, out_summary: str):
-    df = pd.read_csv(parsed_csv)
-    summary = {"stories": {}, "global": {}}
-    all_estimates = []
-
-    for sid, g in df.groupby("story_id"):
-        # Parse estimates from raw_output if estimate column is null
-        estimates = []
-        for _, row in g.iterrows():
-            if pd.notna(row["estimate"]) and row["estimate"] != "":
-                try:
-                    estimates.append(float(row["estimate"]))
-                except:
-                    pass
-            else:
-                # Parse from raw_output
-                raw = row["raw_output"]
-                try:
-                    import json
-                    if "```json" in raw:
-                        start = raw.find("```json") + 7
-                        end = raw.find("```", start)
-                        json_str = raw[start:end].strip()
-                    else:
-                        json_str = raw
-                    parsed = json.loads(json_str)
-                    if "estimate" in parsed:
-                        estimates.append(float(parsed["estimate"]))
-                except:
-                    pass
-        
-        ests = pd.Series(estimates)
-        mean = ests.mean() if len(ests) > 0 else None
-        std = ests.std(ddof=0) if len(ests) > 0 else None
-        cv = std / mean if mean and std else None
-        consistency = None
-        if len(ests) > 0:
-            within1 = ((ests - ests.mean()).abs() <= 1).sum() / len(ests)
-            consistency = within1
-        summary["stories"][int(sid)] = {
-            "n_trials": len(g),
-            "mean": mean,
-            "std": std,
-            "cv": cv,
-            "consistency_within_±1": consistency
+import pandas as pd, json, math, numpy as np, os
+from src.call_metrics import CALL_METRIC_COLUMNS, FINISH_TRUNCATED
+from src.output_parser import ensure_parsed_columns
+
+SUMMARY_STATE_VERSION = 3
+
+# Call metric columns summed into the latency section
+CALL_SUM_COLUMNS = ["retries", "queue_time", "wait_time", "read_time", "ttft",
+                    "prompt_tokens", "completion_tokens"]
+
+# Fixed, geometrically spaced latency bins (seconds) so histograms from
+# different chunks and runs add up; the last bin also takes overflow.
+LATENCY_BIN_EDGES = np.concatenate([[0.0], np.geomspace(0.01, 600, 80)])
+
+
+def _latency_aggregate(times) -> dict:
+    times = pd.to_numeric(pd.Series(times), errors="coerce").dropna().to_numpy(dtype=float)
+    idx = np.clip(np.searchsorted(LATENCY_BIN_EDGES, times, side="right") - 1,
+                  0, len(LATENCY_BIN_EDGES) - 2)
+    return {"count": int(len(times)), "sum": float(times.sum()),
+            "hist": np.bincount(idx, minlength=len(LATENCY_BIN_EDGES) - 1).tolist()}
+
+
+def _merge_latency(a: dict, b: dict) -> dict:
+    return {"count": a["count"] + b["count"], "sum": a["sum"] + b["sum"],
+            "hist": [x + y for x, y in zip(a["hist"], b["hist"])]}
+
+
+def _calls_aggregate(df: pd.DataFrame) -> dict:
+    """
+    Additive call-metric totals: cached trials, count and sum of each
+    CALL_SUM_COLUMNS value, completion tokens and the generation time they
+    took (rows with both known), finish_reason counts and a response-time
+    histogram per endpoint.
+    """
+    agg = {"cached": 0, "counts": dict.fromkeys(CALL_SUM_COLUMNS, 0),
+           "sums": dict.fromkeys(CALL_SUM_COLUMNS, 0.0),
+           "token_count": 0.0, "token_time": 0.0, "finish_reasons": {}}
+    if "cached" in df:
+        agg["cached"] = int(df["cached"].astype(str).str.lower().eq("true").sum())
+    cols = {c: pd.to_numeric(df[c], errors="coerce")
+            for c in CALL_SUM_COLUMNS if c in df}
+    for c, values in cols.items():
+        agg["counts"][c] = int(values.notna().sum())
+        agg["sums"][c] = float(values.sum())
+    if {"completion_tokens", "wait_time", "read_time"} <= set(cols):
+        gen_time = cols["wait_time"] + cols["read_time"]
+        known = cols["completion_tokens"].notna() & gen_time.notna()
+        agg["token_count"] = float(cols["completion_tokens"][known].sum())
+        agg["token_time"] = float(gen_time[known].sum())
+    if "finish_reason" in df:
+        agg["finish_reasons"] = {str(k): int(v) for k, v in
+                                 df["finish_reason"].dropna().value_counts().items()}
+    agg["endpoints"] = {}
+    if "endpoint" in df and "response_time" in df:
+        for ep, times in df["response_time"].groupby(df["endpoint"]):
+            agg["endpoints"][str(ep)] = _latency_aggregate(times)
+    return agg
+
+
+def _merge_calls(a: dict, b: dict) -> dict:
+    for agg in (a, b):  # states written before a column existed
+        for c in CALL_SUM_COLUMNS:
+            agg["counts"].setdefault(c, 0)
+            agg["sums"].setdefault(c, 0.0)
+        agg.setdefault("endpoints", {})
+    reasons = dict(a["finish_reasons"])
+    for k, v in b["finish_reasons"].items():
+        reasons[k] = reasons.get(k, 0) + v
+    endpoints = dict(a["endpoints"])
+    for ep, lat in b["endpoints"].items():
+        endpoints[ep] = _merge_latency(endpoints[ep], lat) if ep in endpoints else lat
+    return {"cached": a["cached"] + b["cached"],
+            "counts": {c: a["counts"][c] + b["counts"][c] for c in CALL_SUM_COLUMNS},
+            "sums": {c: a["sums"][c] + b["sums"][c] for c in CALL_SUM_COLUMNS},
+            "token_count": a["token_count"] + b["token_count"],
+            "token_time": a["token_time"] + b["token_time"],
+            "finish_reasons": reasons,
+            "endpoints": endpoints}
+
+
+def _partial_aggregates(df: pd.DataFrame):
+    """
+    Reduce a block of trials to mergeable aggregates: trials per story,
+    the count of each distinct estimate per story, a fixed-bin latency
+    histogram and call-metric totals. All combine across chunks by plain
+    addition.
+    """
+    est = pd.to_numeric(df["estimate"], errors="coerce")
+    n_trials = df.groupby("story_id").size()
+    valid = est.notna()
+    counts = (pd.DataFrame({"story_id": df.loc[valid, "story_id"],
+                            "estimate": est[valid].astype(float)})
+              .groupby(["story_id", "estimate"]).size())
+    latency = _latency_aggregate(df["response_time"] if "response_time" in df
+                                 else [])
+    return n_trials, counts, latency, _calls_aggregate(df)
+
+
+def _percentile_from_counts(values: np.ndarray, counts: np.ndarray, q: float) -> float:
+    """np.percentile (linear interpolation) over sorted values with multiplicities."""
+    cum = np.cumsum(counts)
+    h = (cum[-1] - 1) * q / 100.0
+    lo = int(np.floor(h))
+    v_lo = values[np.searchsorted(cum, lo, side="right")]
+    v_hi = values[np.searchsorted(cum, min(lo + 1, cum[-1] - 1), side="right")]
+    return float(v_lo + (h - lo) * (v_hi - v_lo))
+
+
+def _percentile_from_hist(counts, q: float) -> float:
+    """Percentile of a LATENCY_BIN_EDGES histogram, interpolated within its bin."""
+    counts = np.asarray(counts, dtype=float)
+    cum = np.cumsum(counts)
+    target = cum[-1] * q / 100.0
+    i = min(int(np.searchsorted(cum, target, side="left")), len(counts) - 1)
+    lo, hi = LATENCY_BIN_EDGES[i], LATENCY_BIN_EDGES[i + 1]
+    before = cum[i] - counts[i]
+    frac = (target - before) / counts[i] if counts[i] else 0.0
+    return float(lo + frac * (hi - lo))
+
+
+def _hist_key(value: float) -> str:
+    return repr(float(value))
+
+
+def _empty_state() -> dict:
+    return {"version": SUMMARY_STATE_VERSION, "stories": {},
+            "global": {"count": 0, "mean": 0.0, "m2": 0.0, "hist": {}},
+            "latency": _latency_aggregate([]),
+            "calls": _calls_aggregate(pd.DataFrame())}
+
+
+def _build_state(n_trials: pd.Series, counts: pd.Series, latency: dict,
+                 calls: dict) -> dict:
+    """
+    Turn merged aggregates into the mergeable summary state: per story the
+    trial count, valid-estimate count, Welford mean/M2 and a counts-by-
+    estimate histogram, plus the same sufficient statistics globally, the
+    latency histogram and the call-metric totals.
+    """
+    state = _empty_state()
+    state["latency"] = latency
+    state["calls"] = calls
+
+    sids = counts.index.get_level_values("story_id")
+    vals = counts.index.get_level_values("estimate").to_numpy(dtype=float)
+    c = counts.to_numpy(dtype=float)
+
+    n = pd.Series(c, index=sids).groupby(level=0).sum()
+    mean = pd.Series(c * vals, index=sids).groupby(level=0).sum() / n
+    dev = vals - mean.reindex(sids).to_numpy()
+    m2 = pd.Series(c * dev ** 2, index=sids).groupby(level=0).sum()
+
+    for sid, trials in n_trials.sort_index().items():
+        state["stories"][str(int(sid))] = {
+            "n_trials": int(trials),
+            "count": int(n.get(sid, 0)),
+            "mean": float(mean[sid]) if sid in n.index else 0.0,
+            "m2": float(m2[sid]) if sid in n.index else 0.0,
+            "hist": {}
         }
-        all_estimates.extend(ests.tolist())
-
-    if len(all_estimates) > 0:
-        arr = np.array(all_estimates)
-        summary["global"] = {
-            "mean": arr.mean().item(),
-            "std": arr.std().item(),
-            "p50": np.percentile(arr, 50).item(),
-            "p90": np.percentile(arr, 90).item()
+    for (sid, v), k in zip(counts.index, c):
+        state["stories"][str(int(sid))]["hist"][_hist_key(v)] = int(k)
+
+    if len(c) > 0:
+        hist = pd.Series(c, index=vals).groupby(level=0).sum().sort_index()
+        state["global"] = _global_state(hist.index.to_numpy(dtype=float),
+                                        hist.to_numpy(dtype=float))
+    return state
+
+
+def _global_state(hv: np.ndarray, hc: np.ndarray) -> dict:
+    """Global sufficient statistics from sorted estimate values and counts."""
+    total = hc.sum()
+    g_mean = (hv * hc).sum() / total
+    return {
+        "count": int(total),
+        "mean": float(g_mean),
+        "m2": float((hc * (hv - g_mean) ** 2).sum()),
+        "hist": {_hist_key(v): int(k) for v, k in zip(hv, hc)}
+    }
+
+
+def merge_states(states) -> dict:
+    """
+    Combine summary states over disjoint sets of stories, such as the
+    shards of one run, into the state evaluate would build from all their
+    trials at once. Raises ValueError if a story appears in two states.
+    """
+    merged = _empty_state()
+    hist = {}
+    for state in states:
+        overlap = merged["stories"].keys() & state["stories"].keys()
+        if overlap:
+            raise ValueError(f"stories in more than one state: "
+                             f"{sorted(overlap, key=int)[:10]}")
+        merged["stories"].update(state["stories"])
+        for v, k in state["global"]["hist"].items():
+            hist[v] = hist.get(v, 0) + k
+        merged["latency"] = _merge_latency(
+            merged["latency"], state.get("latency") or _latency_aggregate([]))
+        merged["calls"] = _merge_calls(
+            merged["calls"], state.get("calls") or _calls_aggregate(pd.DataFrame()))
+    merged["stories"] = dict(sorted(merged["stories"].items(),
+                                    key=lambda item: int(item[0])))
+    if hist:
+        values = sorted(hist, key=float)
+        merged["global"] = _global_state(np.array([float(v) for v in values]),
+                                         np.array([hist[v] for v in values],
+                                                  dtype=float))
+    return merged
+
+
+def _welford_add(st: dict, value: float):
+    st["count"] += 1
+    delta = value - st["mean"]
+    st["mean"] += delta / st["count"]
+    st["m2"] += delta * (value - st["mean"])
+    key = _hist_key(value)
+    st["hist"][key] = st["hist"].get(key, 0) + 1
+
+
+def _hist_moments(hist: dict):
+    """
+    Exact (count, mean, std) of a counts-by-estimate histogram. The sums are
+    correctly rounded (math.fsum), so the result does not depend on the
+    order trials arrived in: a full evaluate and incremental updates agree.
+    """
+    items = [(float(v), k) for v, k in hist.items()]
+    count = sum(k for _, k in items)
+    mean = math.fsum(v * k for v, k in items) / count
+    var = math.fsum(k * (v - mean) ** 2 for v, k in items) / count
+    return count, mean, math.sqrt(var)
+
+
+def _render_story(st: dict) -> dict:
+    if st["count"] == 0:
+        return {"n_trials": st["n_trials"], "mean": None, "std": None,
+                "cv": None, "consistency_within_±1": None}
+    count, mean, std = _hist_moments(st["hist"])
+    within1 = sum(k for v, k in st["hist"].items()
+                  if abs(float(v) - mean) <= 1)
+    return {
+        "n_trials": st["n_trials"],
+        "mean": mean,
+        "std": std,
+        "cv": std / mean if mean and std else None,
+        "consistency_within_±1": within1 / count
+    }
+
+
+def _render_global(g: dict) -> dict:
+    if g["count"] == 0:
+        return {}
+    hist = sorted((float(v), k) for v, k in g["hist"].items())
+    hv = np.array([v for v, _ in hist])
+    hc = np.array([k for _, k in hist])
+    _, mean, std = _hist_moments(g["hist"])
+    return {
+        "mean": mean,
+        "std": std,
+        "p50": _percentile_from_counts(hv, hc, 50),
+        "p90": _percentile_from_counts(hv, hc, 90)
+    }
+
+
+def _render_distributions(state: dict) -> dict:
+    """
+    Pre-binned chart inputs: counts of estimates per integer story point
+    (floor, matching integer-edged histogram bins) and the latency
+    histogram, so charts never need the per-trial rows.
+    """
+    points = {}
+    for v, k in state["global"]["hist"].items():
+        p = int(np.floor(float(v)))
+        points[p] = points.get(p, 0) + k
+    latency = state.get("latency") or _latency_aggregate([])
+    return {
+        "estimate_counts": {str(p): points[p] for p in sorted(points)},
+        "latency_histogram": {
+            "bin_edges": LATENCY_BIN_EDGES.tolist(),
+            "counts": latency["hist"],
+            "count": latency["count"],
+            "mean": latency["sum"] / latency["count"] if latency["count"] else None
         }
+    }
+
+
+def _render_latency_hist(latency: dict) -> dict:
+    out = {"count": latency["count"],
+           "mean": latency["sum"] / latency["count"] if latency["count"] else None}
+    for q in (50, 95, 99):
+        out[f"p{q}"] = (_percentile_from_hist(latency["hist"], q)
+                        if latency["count"] else None)
+    return out
+
+
+def _render_latency(state: dict) -> dict:
+    """
+    Latency section: response-time percentiles (interpolated within the
+    fixed histogram bins), mean per-phase timings and retries, completion
+    tokens per second of generation time, and the share of completions cut
+    off by max_tokens (finish_reason "length"). Response-time figures are
+    also broken down per endpoint.
+    """
+    latency = state.get("latency") or _latency_aggregate([])
+    calls = state.get("calls") or _calls_aggregate(pd.DataFrame())
+    out = _render_latency_hist(latency)
+    for c in ("retries", "queue_time", "wait_time", "read_time", "ttft"):
+        n = calls["counts"].get(c, 0)
+        out[f"mean_{c}"] = calls["sums"].get(c, 0.0) / n if n else None
+    out["prompt_tokens"] = calls["sums"]["prompt_tokens"]
+    out["completion_tokens"] = calls["sums"]["completion_tokens"]
+    out["tokens_per_sec"] = (calls["token_count"] / calls["token_time"]
+                             if calls["token_time"] else None)
+    finished = sum(calls["finish_reasons"].values())
+    out["finish_reasons"] = calls["finish_reasons"]
+    out["truncation_rate"] = (calls["finish_reasons"].get(FINISH_TRUNCATED, 0)
+                              / finished if finished else None)
+    out["cached_trials"] = calls["cached"]
+    out["endpoints"] = {ep: _render_latency_hist(lat) for ep, lat
+                        in sorted(calls.get("endpoints", {}).items())}
+    return out
+
+
+def summary_from_state(state: dict) -> dict:
+    """Render the benchmark_summary.json structure from a summary state."""
+    return {
+        "stories": {int(sid): _render_story(st)
+                    for sid, st in state["stories"].items()},
+        "global": _render_global(state["global"]),
+        "latency": _render_latency(state),
+        "distributions": _render_distributions(state)
+    }
 
-    os.makedirs(os.path.dirname(out_summary), exist_ok=True)
-    with open(out_summary, "w", encoding="utf-8") as f:
-        json.dump(summary, f, indent=2)
+
+def state_path_for(out_summary: str) -> str:
+    """Where the mergeable state for a summary file is kept."""
+    return os.path.splitext(out_summary)[0] + ".state.json"
+
+
+def _write_json(path: str, obj):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=2)
+
+
+def evaluate(parsed_csv: str, out_summary: str, chunksize: int = None,
+             stories_csv: str = None):
+    """
+    Aggregate per-story and global estimate statistics from a results CSV
+    or Parquet file (see src.results_store), reading only the columns used.
+
+    With ``chunksize`` the file is streamed in blocks of that many rows and
+    the partial aggregates are merged, so memory stays bounded by the number
+    of distinct (story, estimate) pairs rather than the number of trials.
+    A file without trials gives an empty summary.
+
+    With ``stories_csv`` the summary also gets an ``accuracy`` section
+    comparing the estimates and the heuristic baseline against its
+    human_baseline column (see src.accuracy).
+    """
+    from src.results_store import is_parquet, iter_frames, result_columns
+    # an empty CSV (e.g. every story answered from the kNN index) has no header
+    empty = not is_parquet(parsed_csv) and os.path.getsize(parsed_csv) == 0
+    header = [] if empty else result_columns(parsed_csv)
+    usecols = None
+    if "parse_status" in header:
+        usecols = [c for c in ["story_id", "estimate", "response_time",
+                               *CALL_METRIC_COLUMNS] if c in header]
+    chunks = [] if empty else iter_frames(parsed_csv, usecols, chunksize)
+
+    n_trials, counts, latency, calls = None, None, None, None
+    for chunk in chunks:
+        if usecols is None:
+            chunk = ensure_parsed_columns(chunk)
+        part_n, part_c, part_l, part_calls = _partial_aggregates(chunk)
+        if n_trials is None:
+            n_trials, counts, latency, calls = part_n, part_c, part_l, part_calls
+        else:
+            n_trials = n_trials.add(part_n, fill_value=0)
+            counts = counts.add(part_c, fill_value=0)
+            latency = _merge_latency(latency, part_l)
+            calls = _merge_calls(calls, part_calls)
+
+    if n_trials is None:
+        state = _empty_state()
+    else:
+        state = _build_state(n_trials, counts, latency, calls)
+    summary = summary_from_state(state)
+    if stories_csv:
+        from src.accuracy import accuracy_summary
+        accuracy = accuracy_summary(state, stories_csv)
+        if accuracy is not None:
+            summary["accuracy"] = accuracy
+
+    _write_json(state_path_for(out_summary), state)
+    _write_json(out_summary, summary)
     return summary
 
+
+def update_summary(new_records, out_summary: str = "results/benchmark_summary.json"):
+    """
+    Fold newly finished trials into an existing summary without re-reading
+    the results file. ``new_records`` is a DataFrame or an iterable of
+    dicts with ``story_id`` and ``estimate``; only the touched stories and
+    the global section are recomputed, so the cost is O(new records).
+    A missing summary file is rebuilt from the state; the accuracy section
+    is dropped, as it would no longer match the trials.
+    """
+    state_path = state_path_for(out_summary)
+    if os.path.exists(state_path):
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+    else:
+        state = _empty_state()
+    state.setdefault("latency", _latency_aggregate([]))
+    state.setdefault("calls", _calls_aggregate(pd.DataFrame()))
+    if os.path.exists(out_summary):
+        with open(out_summary, encoding="utf-8") as f:
+            summary = json.load(f)
+        summary["stories"] = {int(sid): st for sid, st in summary["stories"].items()}
+    else:
+        summary = summary_from_state(state)
+    # accuracy needs the stories CSV; evaluate() with stories_csv recomputes it
+    summary.pop("accuracy", None)
+
+    if isinstance(new_records, pd.DataFrame):
+        new_records = new_records.to_dict("records")
+    new_records = list(new_records)
+    touched = set()
+    latency = []
+    for rec in new_records:
+        sid = str(int(rec["story_id"]))
+        st = state["stories"].setdefault(
+            sid, {"n_trials": 0, "count": 0, "mean": 0.0, "m2": 0.0, "hist": {}})
+        st["n_trials"] += 1
+        touched.add(sid)
+        est = pd.to_numeric(rec.get("estimate"), errors="coerce")
+        if pd.notna(est):
+            _welford_add(st, float(est))
+            _welford_add(state["global"], float(est))
+        rt = pd.to_numeric(rec.get("response_time"), errors="coerce")
+        if pd.notna(rt):
+            latency.append(float(rt))
+
+    for sid in touched:
+        summary["stories"][int(sid)] = _render_story(state["stories"][sid])
+    summary["stories"] = dict(sorted(summary["stories"].items()))
+    summary["global"] = _render_global(state["global"])
+    state["latency"] = _merge_latency(state["latency"], _latency_aggregate(latency))
+    state["calls"] = _merge_calls(state["calls"],
+                                  _calls_aggregate(pd.DataFrame(new_records)))
+    state["version"] = SUMMARY_STATE_VERSION
+    summary["latency"] = _render_latency(state)
+    summary["distributions"] = _render_distributions(state)
+
+    _write_json(state_path, state)
+    _write_json(out_summary, summary)
+    return summary
@@ -1,14 +1,274 @@
-import os, time, requests
-from src.prompt_design import PROMPT_SYSTEM, PROMPT_USER_TEMPLATE
+import json, os, random, threading, time, requests
+from requests.adapters import HTTPAdapter
+from src import call_metrics, response_cache
+from src.output_parser import StreamingEstimateParser
+from src.prompt_design import (PROMPT_SYSTEM, PROMPT_USER_TEMPLATE,
+                               PROMPT_MULTI_USER_TEMPLATE, PROMPT_MULTI_STORY_LINE)
 
 API_HOST = os.getenv("LMSTUDIO_HOST", "http://127.0.0.1:1234")
+# Comma-separated servers (optionally "url=max_concurrency") to spread load
+# over; when set it takes precedence over LMSTUDIO_HOST
+API_HOSTS = os.getenv("LMSTUDIO_HOSTS")
 API_KEY = os.getenv("LMSTUDIO_API_KEY", "lm-studio")
 MODEL = os.getenv("LM_MODEL", "gpt-oss-7b-instruct")
 HEADERS = {"Content-Type": "application/json", "Authorization": f"Bearer {API_KEY}"}
+POOL_SIZE = int(os.getenv("LM_POOL_SIZE", "16"))
+MAX_RETRIES = int(os.getenv("LM_MAX_RETRIES", "3"))
+# "off": plain request; "full": stream the whole answer (records ttft);
+# "early": stream and hang up as soon as the estimate has been read
+STREAM_MODES = ("off", "full", "early")
+STREAM_MODE = os.getenv("LM_STREAM_MODE", "off")
 
-def query_model(story: str, timeout: int = 60):
-    url = f"{API_HOST}/v1/chat/completions"
-    payload = {
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when the circuit breaker stays open past a request deadline."""
+
+
+class LLMClient:
+    """
+    Reusable chat-completions client with a pooled keep-alive session,
+    exponential-backoff retries with full jitter for transient failures,
+    an overall per-request deadline, and a circuit breaker that pauses
+    all traffic for ``breaker_cooldown`` seconds after
+    ``breaker_threshold`` consecutive failures.
+    """
+
+    def __init__(self, host: str = None, headers: dict = None,
+                 pool_size: int = POOL_SIZE, max_retries: int = MAX_RETRIES,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 breaker_threshold: int = 5, breaker_cooldown: float = 30.0):
+        self.host = host
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+
+        self.session = requests.Session()
+        self.session.headers.update(headers or HEADERS)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open_until = 0.0
+
+    @property
+    def url(self) -> str:
+        return f"{self.host or API_HOST}/v1/chat/completions"
+
+    def _backoff(self, attempt: int, retry_after=None) -> float:
+        if retry_after is not None:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    def _wait_for_circuit(self, deadline: float):
+        with self._lock:
+            open_until = self._open_until
+        now = time.monotonic()
+        if open_until > now:
+            if open_until > deadline:
+                raise CircuitOpenError(
+                    f"circuit open for {open_until - now:.1f}s, past request deadline")
+            time.sleep(open_until - now)
+
+    def _record(self, ok: bool):
+        with self._lock:
+            if ok:
+                self._failures = 0
+                return
+            self._failures += 1
+            if self._failures >= self.breaker_threshold:
+                self._open_until = time.monotonic() + self.breaker_cooldown
+                self._failures = 0
+
+    def _send(self, payload: dict, deadline: float, timeout: float,
+              record: dict, stream: bool = False):
+        """
+        Send ``payload`` with retries until a non-retryable response arrives
+        before ``deadline``; returns (response, sent_at, headers_at).
+        """
+        attempt = 0
+        while True:
+            self._wait_for_circuit(deadline)
+            sent = time.monotonic()
+            remaining = deadline - sent
+            if remaining <= 0:
+                raise requests.Timeout(f"deadline of {timeout}s exceeded")
+            retry_after = None
+            try:
+                r = self.session.post(self.url, json=payload,
+                                      timeout=remaining, stream=True)
+                headers_at = time.monotonic()
+                if r.status_code not in RETRY_STATUSES:
+                    if not stream:
+                        r.content  # read the body so the connection is released
+                    if r.status_code >= 400:
+                        r.close()
+                        r.raise_for_status()
+                    return r, sent, headers_at
+                r.close()
+                retry_after = r.headers.get("Retry-After")
+                error = requests.HTTPError(
+                    f"{r.status_code} from {self.url}", response=r)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            self._record(False)
+
+            delay = self._backoff(attempt, retry_after)
+            if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                raise error
+            time.sleep(delay)
+            attempt += 1
+            record["retries"] = attempt
+
+    def _new_record(self, payload: dict) -> dict:
+        return {"url": self.url, "endpoint": self.host or API_HOST,
+                "model": payload.get("model"),
+                "status": "error", "error": None, "retries": 0,
+                "queue_time": None, "wait_time": None, "read_time": None,
+                "ttft": None, "total_time": None, "prompt_tokens": None,
+                "completion_tokens": None, "finish_reason": None,
+                "n_choices": 0}
+
+    def _finish(self, record: dict, start: float, metrics: dict):
+        record["total_time"] = time.monotonic() - start
+        if metrics is not None:
+            metrics.update(record)
+        call_metrics.emit(record)
+
+    def post(self, payload: dict, timeout: float = 60, metrics: dict = None) -> dict:
+        """POST a chat-completions payload and return the decoded response.
+
+        ``timeout`` is the deadline for the whole call, retries included.
+        Phase timings, token usage, finish_reason and the retry count are
+        passed to the call_metrics hooks and, if given, stored in ``metrics``.
+        """
+        start = time.monotonic()
+        record = self._new_record(payload)
+        try:
+            r, sent, headers_at = self._send(payload, start + timeout, timeout,
+                                             record)
+            resp = r.json()
+            self._record(True)
+            record.update(_usage_fields(resp), status="ok",
+                          queue_time=sent - start, wait_time=headers_at - sent,
+                          read_time=time.monotonic() - headers_at)
+            return resp
+        except Exception as e:
+            record["error"] = str(e)
+            raise
+        finally:
+            self._finish(record, start, metrics)
+
+    def stream(self, payload: dict, timeout: float = 60, metrics: dict = None,
+               on_delta=None) -> str:
+        """
+        Stream a completion over server-sent events and return its text.
+
+        ``on_delta(chunk)`` is called with each content chunk; when it
+        returns a string the stream is closed at once, which stops
+        generation on the server, and that string is returned instead of
+        the text so far (finish_reason "early_stop"). Metrics are as for
+        post, plus ``ttft``, the time from sending the request to the first
+        content chunk. Without a usage chunk, completion_tokens counts the
+        content chunks received.
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+        record = self._new_record(payload)
+        payload = dict(payload, stream=True,
+                       stream_options={"include_usage": True})
+        try:
+            r, sent, headers_at = self._send(payload, deadline, timeout,
+                                             record, stream=True)
+            record.update(queue_time=sent - start, wait_time=headers_at - sent)
+            parts, chunks, usage, finish = [], 0, None, None
+            try:
+                for line in r.iter_lines():
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == b"[DONE]":
+                        break
+                    if time.monotonic() > deadline:
+                        raise requests.Timeout(f"deadline of {timeout}s exceeded")
+                    event = json.loads(data)
+                    usage = event.get("usage") or usage
+                    if not event.get("choices"):
+                        continue
+                    choice = event["choices"][0]
+                    finish = choice.get("finish_reason") or finish
+                    delta = (choice.get("delta") or {}).get("content")
+                    if not delta:
+                        continue
+                    if not parts:
+                        record["ttft"] = time.monotonic() - sent
+                    parts.append(delta)
+                    chunks += 1
+                    if on_delta is not None:
+                        early = on_delta(delta)
+                        if early is not None:
+                            parts, finish = [early], call_metrics.FINISH_EARLY_STOP
+                            break
+            finally:
+                r.close()
+            self._record(True)
+            record.update(status="ok", finish_reason=finish, n_choices=1,
+                          read_time=time.monotonic() - headers_at,
+                          prompt_tokens=(usage or {}).get("prompt_tokens"),
+                          completion_tokens=(usage or {}).get("completion_tokens",
+                                                              chunks))
+            return "".join(parts)
+        except Exception as e:
+            record["error"] = str(e)
+            raise
+        finally:
+            self._finish(record, start, metrics)
+
+    def close(self):
+        self.session.close()
+
+
+def _usage_fields(resp: dict) -> dict:
+    usage = resp.get("usage") or {}
+    choices = resp.get("choices") or []
+    return {"prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+            "finish_reason": choices[0].get("finish_reason") if choices else None,
+            "n_choices": len(choices)}
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    """
+    Return the process-wide client shared by query_model: an
+    endpoint_pool.EndpointPool when LMSTUDIO_HOSTS is set, else an LLMClient.
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            if API_HOSTS:
+                from src.endpoint_pool import EndpointPool
+                _default_client = EndpointPool.from_spec(API_HOSTS)
+            else:
+                _default_client = LLMClient()
+        return _default_client
+
+
+def build_payload(story: str) -> dict:
+    """Chat-completions payload for a single-story estimate."""
+    return {
         "model": MODEL,
         "messages": [
             {"role": "system", "content": PROMPT_SYSTEM},
@@ -17,11 +277,145 @@ def query_model(story: str, timeout: int = 60):
         "temperature": 0.2,
         "max_tokens": 300
     }
-    t0 = time.time()
-    r = requests.post(url, json=payload, headers=HEADERS, timeout=timeout)
-    r.raise_for_status()
-    resp = r.json()
-    text = resp["choices"][0]["message"]["content"]
-    rt = time.time() - t0
+
+
+def build_multi_payload(stories) -> dict:
+    """Payload asking for estimates of several (id, story) pairs at once."""
+    lines = "\n".join(PROMPT_MULTI_STORY_LINE.format(id=sid, story=story)
+                      for sid, story in stories)
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": PROMPT_SYSTEM},
+            {"role": "user", "content": PROMPT_MULTI_USER_TEMPLATE.format(stories=lines)}
+        ],
+        "temperature": 0.2,
+        "max_tokens": 300 * len(stories)
+    }
+
+
+def query_model(story: str, timeout: int = 60, client: LLMClient = None,
+                trial: int = None, use_cache: bool = None,
+                with_metrics: bool = False, stream_mode: str = None):
+    """
+    Ask the model for an estimate of ``story`` and return (raw_text, latency).
+
+    Responses are served from the on-disk cache when the same payload and
+    ``trial`` index were seen before; pass ``use_cache=False`` (or set
+    LM_CACHE_BYPASS=1) to always query the model. With ``with_metrics``
+    a third item holds the call_metrics.CALL_METRIC_COLUMNS for the trial.
+
+    ``stream_mode`` (default $LM_STREAM_MODE) is one of STREAM_MODES. In
+    "early" mode raw_text is the answer up to its estimate, closed into a
+    JSON object, so reasons and the rest are not generated; such answers
+    are cached apart from full ones.
+    """
+    if use_cache is None:
+        use_cache = not response_cache.CACHE_BYPASS
+    stream_mode = stream_mode or STREAM_MODE
+    if stream_mode not in STREAM_MODES:
+        raise ValueError(f"unknown stream mode {stream_mode!r}")
+    payload = build_payload(story)
+    if use_cache:
+        cache = response_cache.get_cache()
+        key = response_cache.cache_key(
+            dict(payload, early_stop=True) if stream_mode == "early" else payload,
+            trial)
+        hit = cache.get(key)
+        if hit is not None:
+            return (*hit, call_metrics.cached_metrics()) if with_metrics else hit
+
+    call = {}
+    client = client or get_client()
+    t0 = time.monotonic()
+    if stream_mode == "off":
+        resp = client.post(payload, timeout=timeout, metrics=call)
+        text = resp["choices"][0]["message"]["content"]
+    else:
+        on_delta = (StreamingEstimateParser().feed if stream_mode == "early"
+                    else None)
+        text = client.stream(payload, timeout=timeout, metrics=call,
+                             on_delta=on_delta)
+    rt = time.monotonic() - t0
+    if use_cache:
+        cache.put(key, text, rt)
+    if with_metrics:
+        return text, rt, call_metrics.trial_metrics(call)
     return text, rt
 
+
+def query_model_n(story: str, n: int, first_trial: int = 0, timeout: int = 60,
+                  client: LLMClient = None, use_cache: bool = None,
+                  with_metrics: bool = False):
+    """
+    Sample ``n`` completions of one story using the ``n`` request parameter
+    and return a list of (raw_text, latency), one per trial, where latency
+    is the request time split evenly across its completions. Servers that
+    ignore ``n`` return fewer choices; the remainder is re-requested until
+    all trials are filled. Trials share cache entries with query_model.
+    ``with_metrics`` adds each trial's metrics as a third item.
+    """
+    if use_cache is None:
+        use_cache = not response_cache.CACHE_BYPASS
+    payload = build_payload(story)
+    trials = list(range(first_trial, first_trial + n))
+    results = {}
+    if use_cache:
+        cache = response_cache.get_cache()
+        keys = {t: response_cache.cache_key(payload, t) for t in trials}
+        for t in trials:
+            hit = cache.get(keys[t])
+            if hit is not None:
+                results[t] = (*hit, call_metrics.cached_metrics())
+
+    missing = [t for t in trials if t not in results]
+    client = client or get_client()
+    while missing:
+        call = {}
+        t0 = time.monotonic()
+        resp = client.post(dict(payload, n=len(missing)), timeout=timeout,
+                           metrics=call)
+        choices = resp["choices"][:len(missing)]
+        if not choices:
+            raise ValueError("model returned no choices")
+        rt = (time.monotonic() - t0) / len(choices)
+        for t, choice in zip(missing, choices):
+            results[t] = (choice["message"]["content"], rt,
+                          call_metrics.trial_metrics(call, len(choices), choice))
+            if use_cache:
+                cache.put(keys[t], results[t][0], rt)
+        missing = missing[len(choices):]
+    if with_metrics:
+        return [results[t] for t in trials]
+    return [results[t][:2] for t in trials]
+
+
+def query_model_multi(stories, trial: int = None, timeout: int = 60,
+                      client: LLMClient = None, use_cache: bool = None,
+                      with_metrics: bool = False):
+    """
+    Estimate several (id, story) pairs in one request and return
+    (raw_text, latency). The response is a JSON array; split it back into
+    per-story outputs with output_parser.split_multi_output. With
+    ``with_metrics`` a third item holds the metrics of the whole call.
+    """
+    if use_cache is None:
+        use_cache = not response_cache.CACHE_BYPASS
+    payload = build_multi_payload(stories)
+    if use_cache:
+        cache = response_cache.get_cache()
+        key = response_cache.cache_key(payload, trial)
+        hit = cache.get(key)
+        if hit is not None:
+            return (*hit, call_metrics.cached_metrics()) if with_metrics else hit
+
+    call = {}
+    t0 = time.monotonic()
+    resp = (client or get_client()).post(payload, timeout=timeout, metrics=call)
+    text = resp["choices"][0]["message"]["content"]
+    rt = time.monotonic() - t0
+    if use_cache:
+        cache.put(key, text, rt)
+    if with_metrics:
+        return text, rt, call_metrics.trial_metrics(call)
+    return text, rt
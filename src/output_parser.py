@@ -0,0 +1,206 @@
+import json, re
+import pandas as pd
+
+PARSED_COLUMNS = ["estimate", "confidence", "n_reasons", "parse_status",
+                  "parse_error"]
+
+STATUS_OK = "ok"
+STATUS_EMPTY = "empty"
+STATUS_INVALID_JSON = "invalid_json"
+STATUS_MISSING_ESTIMATE = "missing_estimate"
+STATUS_INVALID_ESTIMATE = "invalid_estimate"
+
+# A numeric estimate followed by a delimiter, i.e. one that cannot grow
+STREAMED_ESTIMATE_RE = re.compile(r'"estimate"\s*:\s*(-?\d+(?:\.\d+)?)(?=[\s,}])')
+
+
+def extract_json(raw: str) -> str:
+    """Return the JSON body of a response, unwrapping a ```json fence."""
+    if "```json" in raw:
+        start = raw.find("```json") + 7
+        end = raw.find("```", start)
+        return raw[start:end].strip()
+    return raw
+
+
+def _coerce_estimate(value):
+    if isinstance(value, bool):
+        raise ValueError("boolean estimate")
+    est = float(value)
+    if est != est:
+        raise ValueError("NaN estimate")
+    return int(est) if est.is_integer() else est
+
+
+def load_output(raw):
+    """Decode the JSON body of a raw response (raises JSONDecodeError)."""
+    return json.loads(extract_json(raw))
+
+
+def parse_output(raw) -> dict:
+    """
+    Parse one raw model response into the typed result columns:
+    estimate, confidence, n_reasons, parse_status and parse_error.
+    """
+    result = dict.fromkeys(PARSED_COLUMNS)
+    if not isinstance(raw, str) or not raw.strip():
+        result["parse_status"] = STATUS_EMPTY
+        return result
+    try:
+        parsed = load_output(raw)
+    except json.JSONDecodeError as e:
+        result["parse_status"] = STATUS_INVALID_JSON
+        result["parse_error"] = str(e)
+        return result
+    if not isinstance(parsed, dict):
+        result["parse_status"] = STATUS_INVALID_JSON
+        result["parse_error"] = f"expected object, got {type(parsed).__name__}"
+        return result
+
+    confidence = parsed.get("confidence")
+    result["confidence"] = confidence if isinstance(confidence, str) else None
+    reasons = parsed.get("reasons")
+    result["n_reasons"] = len(reasons) if isinstance(reasons, list) else None
+
+    if "estimate" not in parsed:
+        result["parse_status"] = STATUS_MISSING_ESTIMATE
+        result["parse_error"] = "no 'estimate' key"
+        return result
+    try:
+        result["estimate"] = _coerce_estimate(parsed["estimate"])
+    except (TypeError, ValueError) as e:
+        result["parse_status"] = STATUS_INVALID_ESTIMATE
+        result["parse_error"] = f"bad estimate {parsed['estimate']!r}: {e}"
+        return result
+    result["parse_status"] = STATUS_OK
+    return result
+
+
+class StreamingEstimateParser:
+    """
+    Incremental parser for a streamed response. ``feed`` each text chunk;
+    it returns None until the top-level ``estimate`` value is complete and
+    then a closed JSON object holding the fields received so far, which
+    parses like a full response (later fields are simply absent). Only
+    the unscanned tail of the text is searched on each call.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._scan_from = 0
+
+    def feed(self, chunk: str):
+        self.text += chunk
+        while True:
+            m = STREAMED_ESTIMATE_RE.search(self.text, self._scan_from)
+            if m is None:
+                # keep enough tail to catch a key split across chunks
+                self._scan_from = max(self._scan_from, len(self.text) - 64)
+                return None
+            self._scan_from = m.end()
+            start = self.text.find("{")
+            if start == -1 or start > m.start():
+                continue
+            closed = self.text[start:m.end(1)] + "}"
+            if parse_output(closed)["parse_status"] == STATUS_OK:
+                return closed
+
+
+def parse_outputs(raws) -> pd.DataFrame:
+    """
+    Batch-parse a column of raw responses. Each distinct response is parsed
+    once and the result broadcast back, which makes re-parsing large
+    historical files with many repeated outputs cheap.
+    """
+    raws = pd.Series(raws)
+    codes, uniques = pd.factorize(raws, use_na_sentinel=False)
+    parsed = pd.DataFrame([parse_output(raw) for raw in uniques],
+                          columns=PARSED_COLUMNS)
+    out = parsed.iloc[codes].reset_index(drop=True)
+    out.index = raws.index
+    return out
+
+
+def split_multi_output(raw, story_ids) -> dict:
+    """
+    Split a multi-story response (a JSON array of per-story objects) into
+    {story_id: raw_json_or_None}. Objects are matched on their ``id`` key,
+    falling back to position when ids are missing; stories the model
+    skipped map to None and parse as empty.
+    """
+    out = dict.fromkeys(story_ids)
+    if not isinstance(raw, str):
+        return out
+    body = raw
+    if "```json" not in raw and "```" in raw:
+        start = raw.find("```") + 3
+        end = raw.find("```", start)
+        body = raw[start:end if end != -1 else None]
+    try:
+        items = json.loads(extract_json(body))
+    except json.JSONDecodeError:
+        return out
+    if isinstance(items, dict):
+        items = next((v for v in items.values() if isinstance(v, list)), [items])
+    if not isinstance(items, list):
+        return out
+
+    by_id = {str(sid): sid for sid in story_ids}
+    unmatched = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        sid = by_id.get(str(item.get("id")))
+        if sid is not None and out[sid] is None:
+            out[sid] = json.dumps(item)
+        else:
+            unmatched.append(item)
+    if unmatched and len(items) == len(story_ids):
+        for sid, item in zip(story_ids, items):
+            if out[sid] is None and isinstance(item, dict):
+                out[sid] = json.dumps(item)
+    return out
+
+
+def ensure_parsed_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add the parsed columns to a results frame written before they existed.
+    An existing non-null ``estimate`` is kept; other rows are parsed from
+    ``raw_output``.
+    """
+    if "parse_status" in df.columns:
+        return df
+    parsed = parse_outputs(df["raw_output"])
+    if "estimate" in df.columns:
+        known = pd.to_numeric(df["estimate"], errors="coerce")
+        parsed["estimate"] = known.where(known.notna(),
+                                         pd.to_numeric(parsed["estimate"]))
+        parsed.loc[known.notna(), "parse_status"] = STATUS_OK
+        parsed.loc[known.notna(), "parse_error"] = None
+    df = df.drop(columns=[c for c in PARSED_COLUMNS if c in df.columns])
+    return pd.concat([df, parsed], axis=1)
+
+
+def reparse_csv(in_csv: str, out_csv: str, chunksize: int = 100000) -> int:
+    """Re-parse a historical results CSV chunk by chunk; returns row count."""
+    n = 0
+    for i, chunk in enumerate(pd.read_csv(in_csv, chunksize=chunksize)):
+        chunk = chunk.drop(columns=[c for c in PARSED_COLUMNS
+                                    if c in chunk.columns])
+        chunk = pd.concat([chunk, parse_outputs(chunk["raw_output"])], axis=1)
+        chunk.to_csv(out_csv, mode="w" if i == 0 else "a", header=i == 0,
+                     index=False)
+        n += len(chunk)
+    return n
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Re-parse raw model outputs "
+                                     "in a results CSV into typed columns")
+    parser.add_argument("in_csv")
+    parser.add_argument("out_csv")
+    parser.add_argument("--chunksize", type=int, default=100000)
+    args = parser.parse_args()
+    n = reparse_csv(args.in_csv, args.out_csv, args.chunksize)
+    print(f"Re-parsed {n} rows into {args.out_csv}")
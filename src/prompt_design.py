@@ -8,3 +8,15 @@ PROMPT_USER_TEMPLATE = (
     "Be concise."
 )
 
+
+
+PROMPT_MULTI_USER_TEMPLATE = (
+    "Estimate story points (integer 1-10) for each user story below. "
+    "Return valid JSON only: an array with one object per story, in the same order, "
+    "with keys: id (the story's id), estimate (int), reasons (list of short strings), "
+    "similar_examples (short string), confidence (low|med|high).\n\n"
+    "User stories:\n{stories}\n"
+    "Be concise."
+)
+
+PROMPT_MULTI_STORY_LINE = "[{id}] \"{story}\""
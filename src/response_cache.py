@@ -0,0 +1,119 @@
+import hashlib, json, os, sqlite3, threading, time
+
+CACHE_PATH = os.getenv("LM_CACHE_PATH", "results/cache/responses.sqlite")
+CACHE_BYPASS = os.getenv("LM_CACHE_BYPASS", "0").lower() in ("1", "true", "yes")
+CACHE_MAX_ENTRIES = int(os.getenv("LM_CACHE_MAX_ENTRIES", "100000"))
+CACHE_MAX_AGE_DAYS = float(os.getenv("LM_CACHE_MAX_AGE_DAYS", "30"))
+
+EVICT_EVERY = 256
+
+
+def cache_key(payload: dict, trial=None) -> str:
+    """SHA-256 over the canonical request payload plus the trial index."""
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f"{blob}\x00{trial}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Content-addressed SQLite store of model responses. Entries older than
+    ``max_age_days`` are dropped, and the least recently used entries are
+    evicted once the table grows past ``max_entries``.
+    """
+
+    def __init__(self, path: str = CACHE_PATH,
+                 max_entries: int = CACHE_MAX_ENTRIES,
+                 max_age_days: float = CACHE_MAX_AGE_DAYS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, text TEXT NOT NULL, latency REAL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed "
+            "ON responses (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        """Return the cached (text, latency) for ``key``, or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, latency, created_at FROM responses WHERE key = ?",
+                (key,)).fetchone()
+            if row is None or (self.max_age and now - row[2] > self.max_age):
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return row[0], row[1]
+
+    def put(self, key: str, text: str, latency: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, text, latency, now, now))
+            self._conn.commit()
+            self._puts += 1
+            if self._puts % EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        if self.max_age:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?",
+                               (now - self.max_age,))
+        if self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+        self._conn.commit()
+
+    def evict(self):
+        """Apply age and size eviction immediately."""
+        with self._lock:
+            self._evict(time.time())
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else None,
+            "entries": len(self)
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    """Return the process-wide cache shared by query_model."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
@@ -0,0 +1,139 @@
+import csv, json, os
+
+
+class ResultLog:
+    """
+    Append-only JSONL log of finished trials. Each record is flushed as it
+    is written and the file is fsync'd every ``fsync_every`` records, so a
+    crash loses at most the records since the last sync.
+    """
+
+    def __init__(self, path: str, resume: bool = False, fsync_every: int = 50):
+        self.path = path
+        self.fsync_every = fsync_every
+        self._pending = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if resume:
+            _truncate_partial_line(path)
+        self._f = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def append(self, record: dict):
+        self._f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._f.flush()
+        self._pending += 1
+        if self._pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._pending = 0
+
+    def close(self):
+        if not self._f.closed:
+            self.sync()
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _truncate_partial_line(path: str):
+    """Drop a trailing record left half-written by a crash."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        pos = size - 1
+        while pos > 0:
+            step = min(4096, pos)
+            f.seek(pos - step)
+            chunk = f.read(step)
+            idx = chunk.rfind(b"\n")
+            if idx != -1:
+                f.truncate(pos - step + idx + 1)
+                return
+            pos -= step
+        f.truncate(0)
+
+
+def iter_records(path: str):
+    """Yield records from a result log, skipping a corrupt trailing line."""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def completed_trials(path: str) -> set:
+    """
+    Return the (story_id, trial) pairs already done, i.e. whose latest
+    record in the log did not fail; failed trials are retried on resume.
+    The set holds every finished pair, so it grows with the run (one small
+    tuple per trial) while the records themselves are streamed.
+    """
+    done = set()
+    for r in iter_records(path):
+        key = (r["story_id"], r["trial"])
+        if r.get("error") is None:
+            done.add(key)
+        else:
+            done.discard(key)
+    return done
+
+
+def latest_records(path: str):
+    """
+    Yield the records of a result log in log order, keeping only the last
+    record of each (story_id, trial), so a failed trial that was retried
+    after a resume counts once.
+
+    A trial is only logged again after a failed record (resume skips
+    finished ones), so only trials with a failure are tracked: memory
+    grows with the number of failed trials, not the size of the log.
+    """
+    last = {}
+    for i, r in enumerate(iter_records(path)):
+        key = (r["story_id"], r["trial"])
+        if key in last or r.get("error") is not None:
+            last[key] = i
+    for i, r in enumerate(iter_records(path)):
+        if last.get((r["story_id"], r["trial"]), i) == i:
+            yield r
+
+
+def log_to_csv(path: str, out_csv: str) -> int:
+    """
+    Stream the log into a CSV file row by row and return the row count.
+    Only the latest record of each trial is written (see latest_records).
+    Columns are the union of record keys in first-seen order, so logs that
+    were resumed across schema changes still convert; missing values are
+    left empty.
+    """
+    fieldnames = {}
+    for record in iter_records(path):
+        fieldnames.update(dict.fromkeys(record))
+    n = 0
+    with open(out_csv, "w", newline="", encoding="utf-8") as f:
+        if not fieldnames:
+            return 0
+        writer = csv.DictWriter(f, fieldnames=list(fieldnames))
+        writer.writeheader()
+        for record in latest_records(path):
+            writer.writerow(record)
+            n += 1
+    return n
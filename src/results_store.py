@@ -0,0 +1,303 @@
+import glob, hashlib, json, os, time, uuid
+import pandas as pd
+from src.evaluation import _write_json
+from src.model_inference import MODEL, build_payload
+from src.result_log import iter_records, latest_records
+
+RESULTS_STORE = os.getenv("RESULTS_STORE", "results/store")
+RUN_PREFIX = "run_id="
+RUN_META = "run.json"
+RUN_RESULTS = "results.parquet"
+RUN_SUMMARY = "summary.json"
+PARQUET_SUFFIX = ".parquet"
+WRITE_BATCH = 50000
+
+# Arrow types of the columns main.py writes; any other column gets the
+# type of its first non-null value
+COLUMN_TYPES = {
+    "trial": "int64", "story": "string", "raw_output": "string",
+    "response_time": "float64", "cached": "bool", "endpoint": "string",
+    "retries": "int64", "queue_time": "float64", "wait_time": "float64",
+    "read_time": "float64", "ttft": "float64", "prompt_tokens": "float64",
+    "completion_tokens": "float64", "finish_reason": "string",
+    "estimate": "float64", "confidence": "string", "n_reasons": "int64",
+    "parse_status": "string", "parse_error": "string",
+    "baseline_estimate": "int64", "error": "string"
+}
+
+
+def _pyarrow():
+    """Import pyarrow and pyarrow.parquet, which only the store needs."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("the columnar results store needs pyarrow "
+                          "(pip install pyarrow)") from e
+    return pyarrow, pyarrow.parquet
+
+
+def is_parquet(path: str) -> bool:
+    return str(path).endswith(PARQUET_SUFFIX)
+
+
+def result_columns(path: str) -> list:
+    """Column names of a results CSV or Parquet file, without reading rows."""
+    if is_parquet(path):
+        _, pq = _pyarrow()
+        return pq.read_schema(path).names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def iter_frames(path: str, columns=None, chunksize: int = None):
+    """
+    Yield a results CSV or Parquet file as DataFrames of ``chunksize`` rows
+    (one frame without it), reading only ``columns``. Parquet files are
+    memory-mapped and keep their stored types.
+    """
+    if not is_parquet(path):
+        if chunksize:
+            yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+        else:
+            yield pd.read_csv(path, usecols=columns)
+        return
+    _, pq = _pyarrow()
+    if not chunksize:
+        yield pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+        return
+    pf = pq.ParquetFile(path, memory_map=True)
+    for batch in pf.iter_batches(batch_size=chunksize, columns=columns):
+        yield batch.to_pandas()
+
+
+def read_frame(path: str, columns=None) -> pd.DataFrame:
+    """A whole results CSV or Parquet file, restricted to ``columns``."""
+    return next(iter_frames(path, columns))
+
+
+def prompt_hash() -> str:
+    """
+    Short hash of the request template (prompts, temperature, max_tokens),
+    so runs made with different prompt versions can be told apart.
+    """
+    template = dict(build_payload("{story}"))
+    template.pop("model")
+    blob = json.dumps(template, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()[:12]
+
+
+def new_run_id() -> str:
+    return time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + uuid.uuid4().hex[:6]
+
+
+def run_dir(run_id: str, store: str = RESULTS_STORE) -> str:
+    return os.path.join(store, RUN_PREFIX + run_id)
+
+
+def _schema(results_log: str):
+    pa, _ = _pyarrow()
+    first = {}
+    for record in iter_records(results_log):
+        for key, value in record.items():
+            if first.get(key) is None:
+                first[key] = value
+    fields = []
+    for name, value in first.items():
+        if name in COLUMN_TYPES:
+            type_ = COLUMN_TYPES[name]
+        elif isinstance(value, bool):
+            type_ = "bool"
+        elif isinstance(value, int):
+            type_ = "int64"
+        elif isinstance(value, float):
+            type_ = "float64"
+        else:
+            type_ = "string"
+        fields.append(pa.field(name, pa.type_for_alias(type_)))
+    return pa.schema(fields)
+
+
+def log_to_parquet(results_log: str, out_path: str,
+                   batch_size: int = WRITE_BATCH) -> int:
+    """
+    Stream a result log into a typed Parquet file in row groups of
+    ``batch_size`` records and return the row count. As in log_to_csv only
+    the latest record of each trial is kept and columns are the union of
+    record keys.
+    """
+    pa, pq = _pyarrow()
+    schema = _schema(results_log)
+    n = 0
+    with pq.ParquetWriter(out_path, schema) as writer:
+        batch = []
+        for record in latest_records(results_log):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                n += len(batch)
+                batch = []
+        if batch or n == 0:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            n += len(batch)
+    return n
+
+
+def record_run(results_log: str, store: str = RESULTS_STORE, summary: dict = None,
+               run_id: str = None, model: str = MODEL, **meta) -> dict:
+    """
+    Save a finished run's trials under ``store/run_id=<id>/`` as Parquet,
+    next to its summary and a run.json with the run id, model, prompt hash,
+    UTC timestamp, row count and any extra ``meta`` (trials, source, ...).
+    Returns the run metadata.
+    """
+    run_id = run_id or new_run_id()
+    path = run_dir(run_id, store)
+    if os.path.exists(path):
+        raise FileExistsError(f"run {run_id} already exists in {store}")
+    os.makedirs(path)
+    rows = log_to_parquet(results_log, os.path.join(path, RUN_RESULTS))
+    if summary is not None:
+        _write_json(os.path.join(path, RUN_SUMMARY), summary)
+    info = {
+        "run_id": run_id,
+        "model": model,
+        "prompt_hash": prompt_hash(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "rows": rows,
+        **meta
+    }
+    _write_json(os.path.join(path, RUN_META), info)
+    return info
+
+
+def list_runs(store: str = RESULTS_STORE, model: str = None,
+              prompt_hash: str = None) -> pd.DataFrame:
+    """One row of metadata per stored run, oldest first, optionally filtered."""
+    runs = []
+    for meta in glob.glob(os.path.join(store, RUN_PREFIX + "*", RUN_META)):
+        with open(meta, encoding="utf-8") as f:
+            runs.append(json.load(f))
+    df = pd.DataFrame(runs, columns=None if runs else
+                      ["run_id", "model", "prompt_hash", "created_at", "rows"])
+    if model is not None:
+        df = df[df["model"] == model]
+    if prompt_hash is not None:
+        df = df[df["prompt_hash"] == prompt_hash]
+    # run ids start with their timestamp, so they order runs made within a second
+    return df.sort_values(["created_at", "run_id"]).reset_index(drop=True)
+
+
+def load_run_summary(run_id: str, store: str = RESULTS_STORE) -> dict:
+    with open(os.path.join(run_dir(run_id, store), RUN_SUMMARY),
+              encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _select_runs(store, runs, model, prompt_hash) -> pd.DataFrame:
+    meta = list_runs(store, model, prompt_hash)
+    if runs is not None:
+        runs = [runs] if isinstance(runs, str) else list(runs)
+        unknown = set(runs) - set(meta["run_id"])
+        if unknown:
+            raise KeyError(f"no such runs in {store}: {', '.join(sorted(unknown))}")
+        meta = meta[meta["run_id"].isin(runs)]
+    return meta
+
+
+def load_results(store: str = RESULTS_STORE, runs=None, columns=None,
+                 model: str = None, prompt_hash: str = None,
+                 filters=None) -> pd.DataFrame:
+    """
+    Trials of the selected runs (all by default) as one frame with run_id,
+    model and prompt_hash columns added. Only ``columns`` are read, from
+    memory-mapped files; ``filters`` are pyarrow row filters such as
+    ``[("parse_status", "==", "ok")]``.
+    """
+    _, pq = _pyarrow()
+    frames = []
+    for run in _select_runs(store, runs, model, prompt_hash).itertuples():
+        path = os.path.join(run_dir(run.run_id, store), RUN_RESULTS)
+        have = pq.read_schema(path).names
+        cols = None if columns is None else [c for c in columns if c in have]
+        df = pq.read_table(path, columns=cols, filters=filters,
+                           memory_map=True).to_pandas()
+        frames.append(df.assign(run_id=run.run_id, model=run.model,
+                                prompt_hash=run.prompt_hash))
+    if not frames:
+        return pd.DataFrame(columns=[*(columns or []), "run_id", "model",
+                                     "prompt_hash"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def compare_runs(store: str = RESULTS_STORE, runs=None, model: str = None,
+                 prompt_hash: str = None) -> pd.DataFrame:
+    """
+    Side-by-side run statistics: stories, trials, parse success rate, mean
+    and spread of estimates, mean within-story std, and latency p50/p95.
+    """
+    df = load_results(store, runs, ["story_id", "estimate", "response_time",
+                                    "parse_status"], model, prompt_hash)
+    if df.empty:
+        return pd.DataFrame()
+    by_run = df.groupby("run_id", sort=False)
+    story_std = (df.groupby(["run_id", "story_id"])["estimate"].std(ddof=0)
+                 .groupby("run_id").mean())
+    out = pd.DataFrame({
+        "model": by_run["model"].first(),
+        "prompt_hash": by_run["prompt_hash"].first(),
+        "stories": by_run["story_id"].nunique(),
+        "trials": by_run.size(),
+        "parse_ok_rate": by_run["parse_status"].apply(lambda s: (s == "ok").mean()),
+        "mean_estimate": by_run["estimate"].mean(),
+        "std_estimate": by_run["estimate"].std(ddof=0),
+        "mean_story_std": story_std,
+        "latency_p50": by_run["response_time"].quantile(0.5),
+        "latency_p95": by_run["response_time"].quantile(0.95)
+    })
+    meta = list_runs(store).set_index("run_id")["created_at"]
+    return out.join(meta).sort_values("created_at", kind="stable")
+
+
+def compare_stories(store: str = RESULTS_STORE, runs=None, model: str = None,
+                    prompt_hash: str = None) -> pd.DataFrame:
+    """Mean estimate per story (rows) and run (columns), for spotting drift."""
+    df = load_results(store, runs, ["story_id", "estimate"], model, prompt_hash)
+    return df.pivot_table(index="story_id", columns="run_id", values="estimate",
+                          aggfunc="mean")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Inspect and compare runs in "
+                                     "the columnar results store")
+    parser.add_argument("--store", default=RESULTS_STORE)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="list stored runs")
+    compare = sub.add_parser("compare", help="compare run statistics")
+    compare.add_argument("runs", nargs="*", help="run ids (default: all)")
+    compare.add_argument("--model")
+    compare.add_argument("--prompt-hash")
+    compare.add_argument("--stories", action="store_true",
+                         help="show mean estimates per story instead")
+    add = sub.add_parser("add", help="store an existing results directory")
+    add.add_argument("--results-dir", default="results")
+    add.add_argument("--model", default=MODEL)
+    args = parser.parse_args()
+
+    pd.set_option("display.width", 200)
+    if args.command == "list":
+        print(list_runs(args.store).to_string(index=False))
+    elif args.command == "compare":
+        fn = compare_stories if args.stories else compare_runs
+        print(fn(args.store, args.runs or None, args.model,
+                 args.prompt_hash).to_string())
+    else:
+        summary_path = os.path.join(args.results_dir, "benchmark_summary.json")
+        summary = None
+        if os.path.exists(summary_path):
+            with open(summary_path, encoding="utf-8") as f:
+                summary = json.load(f)
+        info = record_run(os.path.join(args.results_dir, "model_outputs.jsonl"),
+                          args.store, summary, model=args.model,
+                          source=args.results_dir)
+        print(f"Stored run {info['run_id']} ({info['rows']} trials)")
@@ -0,0 +1,187 @@
+import glob, hashlib, json, os
+import pandas as pd
+from src.evaluation import (merge_states, state_path_for, summary_from_state,
+                            _write_json)
+from src.result_log import ResultLog, iter_records, log_to_csv
+
+SHARDS_DIR = os.getenv("SHARDS_DIR", "shards")
+SHARD_RESULTS_DIR = os.getenv("SHARD_RESULTS_DIR", "results/shards")
+MANIFEST = "manifest.json"
+SHARD_MARKER = "shard.json"
+
+
+class ShardError(ValueError):
+    """Raised when shard outputs are missing, duplicated or inconsistent."""
+
+
+def shard_of(story_id, n_shards: int) -> int:
+    """Stable shard index of a story id, the same on every host and run."""
+    digest = hashlib.sha256(str(story_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % n_shards
+
+
+def shard_name(index: int, n_shards: int) -> str:
+    return f"shard-{index:03d}-of-{n_shards:03d}"
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest(shards_dir: str = SHARDS_DIR) -> dict:
+    with open(os.path.join(shards_dir, MANIFEST), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def split_stories(stories_csv: str, n_shards: int, shards_dir: str = SHARDS_DIR,
+                  chunksize: int = 100000) -> dict:
+    """
+    Stream ``stories_csv`` into ``n_shards`` CSVs by hash of ``id`` and
+    write a manifest with the source fingerprint and per-shard story counts.
+    """
+    os.makedirs(shards_dir, exist_ok=True)
+    names = [shard_name(i, n_shards) for i in range(n_shards)]
+    counts = [0] * n_shards
+    for i, chunk in enumerate(pd.read_csv(stories_csv, chunksize=chunksize)):
+        shard = chunk["id"].map(lambda sid: shard_of(sid, n_shards))
+        for s, name in enumerate(names):
+            part = chunk[shard == s]
+            part.to_csv(os.path.join(shards_dir, name + ".csv"),
+                        mode="w" if i == 0 else "a", header=i == 0, index=False)
+            counts[s] += len(part)
+    manifest = {
+        "source": stories_csv,
+        "fingerprint": _file_sha256(stories_csv),
+        "n_shards": n_shards,
+        "stories": dict(zip(names, counts))
+    }
+    _write_json(os.path.join(shards_dir, MANIFEST), manifest)
+    return manifest
+
+
+def shard_paths(index: int, shards_dir: str = SHARDS_DIR,
+                results_root: str = SHARD_RESULTS_DIR):
+    """(stories_csv, results_dir) for running shard ``index``."""
+    n_shards = load_manifest(shards_dir)["n_shards"]
+    if not 0 <= index < n_shards:
+        raise ShardError(f"shard {index} out of range for {n_shards} shards")
+    name = shard_name(index, n_shards)
+    return (os.path.join(shards_dir, name + ".csv"),
+            os.path.join(results_root, name))
+
+
+def mark_shard_done(results_dir: str, index: int, shards_dir: str = SHARDS_DIR):
+    """Record that shard ``index`` of the current split finished in ``results_dir``."""
+    manifest = load_manifest(shards_dir)
+    _write_json(os.path.join(results_dir, SHARD_MARKER), {
+        "shard": index,
+        "n_shards": manifest["n_shards"],
+        "fingerprint": manifest["fingerprint"]
+    })
+
+
+def _find_shards(manifest: dict, results_root: str) -> dict:
+    found, problems = {}, []
+    for marker in sorted(glob.glob(os.path.join(results_root, "*", SHARD_MARKER))):
+        with open(marker, encoding="utf-8") as f:
+            info = json.load(f)
+        shard_dir = os.path.dirname(marker)
+        if (info["fingerprint"] != manifest["fingerprint"]
+                or info["n_shards"] != manifest["n_shards"]):
+            problems.append(f"{shard_dir} belongs to a different split")
+        elif info["shard"] in found:
+            problems.append(f"shard {info['shard']} found twice: "
+                            f"{found[info['shard']]} and {shard_dir}")
+        else:
+            found[info["shard"]] = shard_dir
+    # shards that received no stories have nothing to run
+    missing = [name for i, name in enumerate(manifest["stories"])
+               if i not in found and manifest["stories"][name] > 0]
+    if missing:
+        problems.append(f"missing or unfinished shards: {', '.join(missing)}")
+    if problems:
+        raise ShardError("; ".join(problems))
+    return found
+
+
+def merge_shards(shards_dir: str = SHARDS_DIR,
+                 results_root: str = SHARD_RESULTS_DIR,
+                 out_dir: str = "results") -> dict:
+    """
+    Combine finished shard runs into ``out_dir``: one model_outputs log and
+    CSV, and a benchmark_summary.json merged from the shard summary states,
+    identical to evaluating all trials in one run (with the accuracy
+    section while the split's source stories CSV still exists). Raises
+    ShardError when a shard is missing, duplicated, from another split,
+    incomplete, or holds stories that hash to a different shard.
+    """
+    manifest = load_manifest(shards_dir)
+    n_shards = manifest["n_shards"]
+    found = _find_shards(manifest, results_root)
+
+    states = []
+    for index in sorted(found):
+        name = shard_name(index, n_shards)
+        with open(state_path_for(os.path.join(found[index], "benchmark_summary.json")),
+                  encoding="utf-8") as f:
+            state = json.load(f)
+        stray = [sid for sid in state["stories"] if shard_of(sid, n_shards) != index]
+        if stray:
+            raise ShardError(f"{name} holds stories of other shards: {stray[:10]}")
+        if len(state["stories"]) != manifest["stories"][name]:
+            raise ShardError(f"{name} has results for {len(state['stories'])} of "
+                             f"{manifest['stories'][name]} stories")
+        states.append(state)
+    try:
+        state = merge_states(states)
+    except ValueError as e:
+        raise ShardError(str(e)) from e
+
+    os.makedirs(out_dir, exist_ok=True)
+    log_path = os.path.join(out_dir, "model_outputs.jsonl")
+    with ResultLog(log_path) as log:
+        for index in sorted(found):
+            for record in iter_records(os.path.join(found[index],
+                                                    "model_outputs.jsonl")):
+                log.append(record)
+    log_to_csv(log_path, os.path.join(out_dir, "model_outputs.csv"))
+
+    summary = summary_from_state(state)
+    if os.path.exists(manifest["source"]):
+        from src.accuracy import accuracy_summary
+        accuracy = accuracy_summary(state, manifest["source"])
+        if accuracy is not None:
+            summary["accuracy"] = accuracy
+    out_summary = os.path.join(out_dir, "benchmark_summary.json")
+    _write_json(state_path_for(out_summary), state)
+    _write_json(out_summary, summary)
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Split stories into shards "
+                                     "or merge finished shard runs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    split = sub.add_parser("split", help="hash-partition a stories CSV")
+    split.add_argument("--stories", default="data/user_stories.csv")
+    split.add_argument("--shards", type=int, required=True)
+    split.add_argument("--shards-dir", default=SHARDS_DIR)
+    merge = sub.add_parser("merge", help="combine shard outputs and summaries")
+    merge.add_argument("--shards-dir", default=SHARDS_DIR)
+    merge.add_argument("--results-root", default=SHARD_RESULTS_DIR)
+    merge.add_argument("--out-dir", default="results")
+    args = parser.parse_args()
+
+    if args.command == "split":
+        manifest = split_stories(args.stories, args.shards, args.shards_dir)
+        for name, n in manifest["stories"].items():
+            print(f"{name}: {n} stories")
+        print(f"Run each with: python main.py --shard N --shards-dir {args.shards_dir}")
+    else:
+        summary = merge_shards(args.shards_dir, args.results_root, args.out_dir)
+        print(f"Merged {len(summary['stories'])} stories into {args.out_dir}")
@@ -0,0 +1,303 @@
+import json, math, os, re
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+KNN_INDEX = os.getenv("KNN_INDEX", "results/knn_index.npz")
+KNN_THRESHOLD = float(os.getenv("KNN_THRESHOLD", "0.75"))
+KNN_K = int(os.getenv("KNN_K", "5"))
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def story_terms(story: str) -> list:
+    """Lower-cased word unigrams and bigrams of a story."""
+    words = TOKEN_RE.findall(str(story).lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class StoryIndex:
+    """
+    TF-IDF nearest-neighbour index over stories with known estimates.
+
+    Stories are weighted with sublinear term frequency and smoothed IDF and
+    L2-normalised, so the dot product of two vectors is their cosine
+    similarity. Terms found in more than ``max_df`` of the stories (the
+    "As a ..., I want to ... so that" boilerplate) are dropped. Vectors are
+    kept as an inverted index (per term, the stories containing it and
+    their weights), so a query only touches stories sharing a term with it.
+    Query terms the index has never seen count towards the query's norm,
+    so a story that is mostly new vocabulary scores low; dropped boilerplate
+    terms are ignored on both sides.
+    """
+
+    def __init__(self, stories, estimates, ids=None, max_df: float = 0.5):
+        stories = [str(s) for s in stories]
+        self.stories = np.array(stories, dtype=str)
+        self.estimates = np.asarray(estimates, dtype=float)
+        self.ids = np.array(ids if ids is not None else range(len(stories)))
+        n = len(stories)
+
+        docs = [Counter(story_terms(s)) for s in stories]
+        df = Counter(term for doc in docs for term in doc)
+        max_count = max(1, max_df * n)
+        terms = sorted(t for t, k in df.items() if k <= max_count)
+        self.stop_terms = {t for t, k in df.items() if k > max_count}
+        self.vocab = {t: i for i, t in enumerate(terms)}
+        self.idf = np.array([math.log((1 + n) / (1 + df[t])) + 1 for t in terms])
+        self.unseen_idf = math.log(1 + n) + 1
+
+        rows, cols, vals = [], [], []
+        for row, doc in enumerate(docs):
+            w = {self.vocab[t]: (1 + math.log(k)) * self.idf[self.vocab[t]]
+                 for t, k in doc.items() if t in self.vocab}
+            norm = math.sqrt(sum(v * v for v in w.values())) or 1.0
+            rows.extend([row] * len(w))
+            cols.extend(w)
+            vals.extend(v / norm for v in w.values())
+        self._set_postings(np.array(rows, dtype=np.int64),
+                           np.array(cols, dtype=np.int64),
+                           np.array(vals, dtype=float))
+
+    def _set_postings(self, rows, cols, vals):
+        order = np.argsort(cols, kind="stable")
+        self.post_rows = rows[order]
+        self.post_vals = vals[order]
+        self.post_ptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(cols, minlength=len(self.vocab)))])
+
+    def __len__(self) -> int:
+        return len(self.stories)
+
+    def _query(self, story: str):
+        counts = Counter(story_terms(story))
+        cols, weights, sq_norm = [], [], 0.0
+        for term, k in counts.items():
+            if term in self.stop_terms:
+                continue
+            col = self.vocab.get(term)
+            w = (1 + math.log(k)) * (self.unseen_idf if col is None else self.idf[col])
+            sq_norm += w * w
+            if col is not None:
+                cols.append(col)
+                weights.append(w)
+        norm = math.sqrt(sq_norm) or 1.0
+        return cols, np.array(weights) / norm
+
+    def rows_of(self, story_id=None, story: str = None) -> np.ndarray:
+        """Rows holding ``story_id`` or exactly the text ``story``."""
+        if not hasattr(self, "_rows_by_key"):
+            self._rows_by_key = {}
+            for row, (sid, text) in enumerate(zip(self.ids.tolist(),
+                                                  self.stories.tolist())):
+                self._rows_by_key.setdefault(("id", str(sid)), []).append(row)
+                self._rows_by_key.setdefault(("story", text), []).append(row)
+        rows = (self._rows_by_key.get(("id", str(story_id)), [])
+                + self._rows_by_key.get(("story", story), []))
+        return np.unique(np.array(rows, dtype=np.int64))
+
+    def kneighbors(self, story: str, k: int = KNN_K, exclude=None):
+        """
+        (rows, similarities) of the ``k`` most similar indexed stories,
+        leaving out the row or rows in ``exclude``.
+        """
+        cols, weights = self._query(story)
+        if not cols:
+            return np.array([], dtype=np.int64), np.array([])
+        spans = [(self.post_ptr[c], self.post_ptr[c + 1]) for c in cols]
+        rows = np.concatenate([self.post_rows[a:b] for a, b in spans])
+        contrib = np.concatenate([self.post_vals[a:b] * w
+                                  for (a, b), w in zip(spans, weights)])
+        cand, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=contrib)
+        if exclude is not None:
+            scores[np.isin(cand, exclude)] = -1.0
+        k = min(k, len(cand))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        keep = scores[top] > 0
+        return cand[top[keep]], scores[top[keep]]
+
+    def estimate(self, story: str, k: int = KNN_K, exclude=None) -> dict:
+        """
+        Similarity-weighted mean estimate of the ``k`` nearest stories, with
+        the best similarity and the neighbours' ids. Neighbours less than
+        half as similar as the best one are left out, so a near-duplicate
+        is not diluted by loosely related stories.
+        """
+        rows, sims = self.kneighbors(story, k, exclude)
+        if not len(rows):
+            return {"knn_estimate": None, "similarity": 0.0, "neighbours": []}
+        close = sims >= 0.5 * sims[0]
+        rows, sims = rows[close], sims[close]
+        return {
+            "knn_estimate": float(np.average(self.estimates[rows], weights=sims)),
+            "similarity": float(sims[0]),
+            "neighbours": self.ids[rows].tolist()
+        }
+
+    def estimate_batch(self, stories, k: int = KNN_K,
+                       leave_one_out: bool = False) -> pd.DataFrame:
+        """
+        estimate() for each story; with ``leave_one_out`` story i is the
+        i-th indexed story and is left out of its own neighbours.
+        """
+        return pd.DataFrame([self.estimate(s, k, i if leave_one_out else None)
+                             for i, s in enumerate(stories)],
+                            columns=["knn_estimate", "similarity", "neighbours"])
+
+    def save(self, path: str = KNN_INDEX):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez_compressed(
+            path, stories=self.stories, estimates=self.estimates,
+            ids=self.ids.astype(str), terms=np.array(list(self.vocab), dtype=str),
+            stop_terms=np.array(sorted(self.stop_terms), dtype=str),
+            idf=self.idf, unseen_idf=self.unseen_idf, post_rows=self.post_rows,
+            post_vals=self.post_vals, post_ptr=self.post_ptr)
+
+    @classmethod
+    def load(cls, path: str = KNN_INDEX) -> "StoryIndex":
+        with np.load(path, allow_pickle=False) as f:
+            index = cls.__new__(cls)
+            index.stories = f["stories"]
+            index.estimates = f["estimates"]
+            ids = f["ids"]
+            index.ids = (ids.astype(np.int64)
+                         if all(i.lstrip("-").isdigit() for i in ids) else ids)
+            index.vocab = {t: i for i, t in enumerate(f["terms"].tolist())}
+            index.stop_terms = set(f["stop_terms"].tolist())
+            index.idf = f["idf"]
+            index.unseen_idf = float(f["unseen_idf"])
+            index.post_rows = f["post_rows"]
+            index.post_vals = f["post_vals"]
+            index.post_ptr = f["post_ptr"]
+        return index
+
+
+def story_means(results_path: str) -> pd.DataFrame:
+    """Mean parsed LLM estimate per story of a results CSV or Parquet file."""
+    from src.results_store import iter_frames
+    sums = None
+    for chunk in iter_frames(results_path, ["story_id", "story", "estimate"],
+                             chunksize=200000):
+        part = chunk.groupby(["story_id", "story"])["estimate"].agg(["sum", "count"])
+        sums = part if sums is None else sums.add(part, fill_value=0)
+    means = (sums["sum"] / sums["count"]).rename("llm_estimate")
+    return means.dropna().reset_index()
+
+
+def build_index(stories_csv: str = None, results=(), max_df: float = 0.5) -> StoryIndex:
+    """
+    Index the ``human_baseline`` points of ``stories_csv`` plus, for
+    stories without one, the mean LLM estimates in the ``results`` files.
+    """
+    frames = []
+    if stories_csv:
+        df = pd.read_csv(stories_csv, usecols=["id", "story", "human_baseline"])
+        frames.append(df.dropna(subset=["human_baseline"]).rename(
+            columns={"human_baseline": "estimate"}))
+    for path in results:
+        frames.append(story_means(path).rename(
+            columns={"story_id": "id", "llm_estimate": "estimate"}))
+    if not frames:
+        raise ValueError("need a stories CSV with human_baseline or results to index")
+    # earlier sources win: human points over LLM means
+    known = pd.concat(frames, ignore_index=True).drop_duplicates("story")
+    return StoryIndex(known["story"], known["estimate"], known["id"], max_df)
+
+
+def compare_with_llm(index: StoryIndex, stories_csv: str, results_path: str,
+                     threshold: float = KNN_THRESHOLD, k: int = KNN_K) -> dict:
+    """
+    Leave-one-out kNN error against ``human_baseline`` next to the LLM's
+    error (mean estimate per story in ``results_path``) on the same
+    stories, overall and for the stories the threshold would route to kNN.
+    """
+    human = pd.read_csv(stories_csv, usecols=["id", "story", "human_baseline"])
+    human = human.dropna(subset=["human_baseline"])
+    knn = pd.DataFrame([index.estimate(s, k, index.rows_of(sid, s))
+                        for sid, s in zip(human["id"], human["story"])],
+                       index=human.index)
+    df = human.join(knn).merge(
+        story_means(results_path)[["story_id", "llm_estimate"]],
+        left_on="id", right_on="story_id", how="left")
+
+    def errors(part: pd.DataFrame) -> dict:
+        both = part.dropna(subset=["knn_estimate", "llm_estimate"])
+        return {
+            "stories": len(part),
+            "compared": len(both),
+            "knn_mae": _mae(both["knn_estimate"], both["human_baseline"]),
+            "llm_mae": _mae(both["llm_estimate"], both["human_baseline"])
+        }
+
+    confident = df[df["similarity"] >= threshold]
+    return {"threshold": threshold, "k": k, "all": errors(df),
+            "above_threshold": errors(confident)}
+
+
+def _mae(pred: pd.Series, truth: pd.Series):
+    return float((pred - truth).abs().mean()) if len(pred) else None
+
+
+def routing_report(routed: dict, llm_means: dict, human: dict, trials: int,
+                   threshold: float = KNN_THRESHOLD) -> dict:
+    """
+    Summary of a run that sent confident stories to the kNN index:
+    ``routed`` maps story id to its estimate() result, ``llm_means`` the
+    other stories to their mean LLM estimate and ``human`` story ids to
+    ``human_baseline``. Errors are MAE against human points, each over the
+    stories of its route that have one.
+    """
+    def errors(estimates: dict):
+        pairs = [(est, human[sid]) for sid, est in estimates.items()
+                 if est is not None and pd.notna(human.get(sid))]
+        if not pairs:
+            return None, 0
+        pred, truth = np.array(pairs, dtype=float).T
+        return float(np.abs(pred - truth).mean()), len(pairs)
+
+    knn_mae, knn_n = errors({sid: r["knn_estimate"] for sid, r in routed.items()})
+    llm_mae, llm_n = errors(llm_means)
+    return {
+        "threshold": threshold,
+        "stories": len(routed) + len(llm_means),
+        "routed_to_knn": len(routed),
+        "sent_to_llm": len(llm_means),
+        "calls_avoided": len(routed) * trials,
+        "knn_mae": knn_mae,
+        "knn_compared": knn_n,
+        "llm_mae": llm_mae,
+        "llm_compared": llm_n,
+        "knn_estimates": {str(sid): r for sid, r in routed.items()}
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build or evaluate the "
+                                     "nearest-neighbour story index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="index stories with known estimates")
+    build.add_argument("--stories", default="data/user_stories.csv")
+    build.add_argument("--results", nargs="*", default=[],
+                       help="results CSV/Parquet files whose LLM means fill "
+                            "in stories without human_baseline")
+    build.add_argument("--out", default=KNN_INDEX)
+    compare = sub.add_parser("compare", help="kNN vs LLM error on human_baseline")
+    compare.add_argument("--index", default=KNN_INDEX)
+    compare.add_argument("--stories", default="data/user_stories.csv")
+    compare.add_argument("--results", default="results/model_outputs.csv")
+    compare.add_argument("--threshold", type=float, default=KNN_THRESHOLD)
+    compare.add_argument("--k", type=int, default=KNN_K)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = build_index(args.stories, args.results)
+        index.save(args.out)
+        print(f"Indexed {len(index)} stories ({len(index.vocab)} terms) in {args.out}")
+    else:
+        report = compare_with_llm(StoryIndex.load(args.index), args.stories,
+                                  args.results, args.threshold, args.k)
+        print(json.dumps(report, indent=2))
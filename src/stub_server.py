@@ -0,0 +1,331 @@
+import hashlib, json, random, re, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STORY_RE = re.compile(r'User story: "(.*?)"', re.S)
+MULTI_STORY_RE = re.compile(r'^\[(.+?)\] "(.*)"$', re.M)
+CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def stub_estimate(story: str) -> int:
+    """Deterministic 1-10 estimate derived from the story text."""
+    digest = hashlib.sha256(story.encode("utf-8")).digest()
+    return digest[0] % 10 + 1
+
+
+REASONS = [
+    "Touches several services", "Needs new database migration",
+    "Reuses existing UI components", "Requires third-party API integration",
+    "Simple CRUD change", "Unclear acceptance criteria",
+    "Needs permission checks", "Heavy test coverage required",
+    "Small copy and layout change", "Background job and retries needed"
+]
+EXAMPLES = ["Password reset flow", "CSV export of orders", "Profile page edit",
+            "Payment provider integration", "Admin dashboard widgets"]
+
+
+def estimate_body(story: str, rng: random.Random, temperature: float) -> dict:
+    estimate = stub_estimate(story)
+    if temperature > 0:
+        estimate = max(1, min(10, estimate + rng.choice((-1, 0, 0, 1))))
+    return {
+        "estimate": estimate,
+        "reasons": rng.sample(REASONS, rng.randint(1, 3)),
+        "similar_examples": rng.choice(EXAMPLES),
+        "confidence": rng.choice(("low", "med", "med", "high"))
+    }
+
+
+def _malformed(body: dict, rng: random.Random) -> str:
+    """One of the ways real models break the requested JSON format."""
+    text = json.dumps(body, indent=2)
+    kind = rng.randrange(5)
+    if kind == 0:  # cut off by max_tokens
+        return "```json\n" + text[:rng.randint(5, len(text) - 5)]
+    if kind == 1:  # prose around bare JSON
+        return f"Sure! Here is my estimate:\n{text}\nLet me know if you need more."
+    if kind == 2:
+        return "```json\n" + json.dumps({k: v for k, v in body.items()
+                                          if k != "estimate"}) + "\n```"
+    if kind == 3:
+        words = ["one", "two", "three", "five", "eight", "ten"]
+        return "```json\n" + json.dumps(dict(body, estimate=rng.choice(words))) + "\n```"
+    return "```json\n" + str(body) + "\n```"  # Python repr, single quotes
+
+
+def format_completion(body: dict, rng: random.Random, unfenced_rate: float = 0.0,
+                      malformed_rate: float = 0.0) -> str:
+    """
+    Render an estimate body the way a model answers: fenced JSON by
+    default, bare JSON for a share ``unfenced_rate`` of answers and broken
+    output (truncated, prose-wrapped, missing or non-numeric estimate,
+    single-quoted) for a share ``malformed_rate``.
+    """
+    roll = rng.random()
+    if roll < malformed_rate:
+        return _malformed(body, rng)
+    if roll < malformed_rate + unfenced_rate:
+        return json.dumps(body, indent=2)
+    return "```json\n" + json.dumps(body) + "\n```"
+
+
+def _completion_text(user_msg: str, rng: random.Random, temperature: float,
+                     unfenced_rate: float = 0.0, malformed_rate: float = 0.0):
+    """Return (text, number of story estimates in it)."""
+    multi = MULTI_STORY_RE.findall(user_msg)
+    if multi:
+        items = [dict(id=sid, **estimate_body(story, rng, temperature))
+                 for sid, story in multi]
+        return "```json\n" + json.dumps(items) + "\n```", len(items)
+    match = STORY_RE.search(user_msg)
+    story = match.group(1) if match else user_msg
+    body = estimate_body(story, rng, temperature)
+    return format_completion(body, rng, unfenced_rate, malformed_rate), 1
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        # clients that stop a stream early reset the keep-alive connection
+        # while the next request is being read
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, retry_after=None):
+        data = json.dumps({"error": "server busy" if status >= 500
+                           else "request rejected"}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if retry_after is not None:
+            self.send_header("Retry-After", str(retry_after))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, payload: dict, text: str, max_tokens):
+        """Send ``text`` as chat.completion.chunk SSE events, one token each."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(event):
+            data = f"data: {json.dumps(event) if isinstance(event, dict) else event}\n\n"
+            data = data.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish=None):
+            return {"object": "chat.completion.chunk",
+                    "model": payload.get("model", "stub-model"),
+                    "choices": [{"index": 0, "delta": delta,
+                                 "finish_reason": finish}]}
+
+        tokens = [text[i:i + CHARS_PER_TOKEN]
+                  for i in range(0, len(text), CHARS_PER_TOKEN)]
+        finish = "stop"
+        if max_tokens and len(tokens) > max_tokens:
+            tokens, finish = tokens[:max_tokens], "length"
+        sent = 0
+        try:
+            send(chunk({"role": "assistant"}))
+            for token in tokens:
+                if self.server.token_latency:
+                    time.sleep(self.server.token_latency)
+                send(chunk({"content": token}))
+                sent += 1
+            send(chunk({}, finish))
+            if (payload.get("stream_options") or {}).get("include_usage"):
+                prompt_tokens = sum(count_tokens(m.get("content", ""))
+                                    for m in payload["messages"])
+                send({"object": "chat.completion.chunk", "choices": [],
+                      "usage": {"prompt_tokens": prompt_tokens,
+                                "completion_tokens": sent,
+                                "total_tokens": prompt_tokens + sent}})
+            send("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client hung up early
+        finally:
+            with self.server.lock:
+                self.server.streamed_tokens += sent
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/v1/models":
+            self._send_json(200, {"data": [{"id": "stub-model"}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": "not found"})
+            return
+        server = self.server
+        n = 1 if server.ignore_n else max(1, int(payload.get("n", 1)))
+        user_msg = payload["messages"][-1]["content"]
+        temperature = payload.get("temperature", 0)
+        with server.lock:
+            server.request_count += 1
+            overloaded = server.rng.random() < server.error_rate
+            completions = [_completion_text(user_msg, server.rng, temperature,
+                                            server.unfenced_rate,
+                                            server.malformed_rate)
+                           for _ in range(n)]
+            jitter = server.rng.uniform(1 - server.jitter, 1 + server.jitter)
+        items = sum(k for _, k in completions)
+        delay = (server.latency + server.item_latency * items) * jitter
+        if not payload.get("stream"):
+            delay += server.token_latency * sum(count_tokens(text)
+                                                for text, _ in completions)
+        if delay:
+            time.sleep(delay)
+        if overloaded:
+            self._send_error(server.error_status, server.retry_after)
+            return
+
+        max_tokens = payload.get("max_tokens")
+        if payload.get("stream"):
+            self._stream(payload, completions[0][0], max_tokens)
+            return
+        choices = []
+        for i, (text, _) in enumerate(completions):
+            finish = "stop"
+            if max_tokens and count_tokens(text) > max_tokens:
+                text, finish = text[:max_tokens * CHARS_PER_TOKEN], "length"
+            choices.append({"index": i,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": finish})
+        prompt_tokens = sum(count_tokens(m.get("content", ""))
+                            for m in payload["messages"])
+        completion_tokens = sum(count_tokens(c["message"]["content"])
+                                for c in choices)
+        self._send_json(200, {
+            "id": "stub-completion",
+            "object": "chat.completion",
+            "model": payload.get("model", "stub-model"),
+            "choices": choices,
+            "usage": {"prompt_tokens": prompt_tokens,
+                      "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        })
+
+
+class StubLLMServer:
+    """
+    Minimal OpenAI-compatible chat-completions server for offline runs.
+    Answers every request with a fenced JSON estimate after ``latency``
+    seconds plus ``item_latency`` per generated estimate, so pipeline
+    throughput can be measured without LM Studio. It honours the ``n``
+    parameter (unless ``ignore_n``) and multi-story prompts, which get a
+    JSON array back. A fraction ``error_rate`` of requests is rejected with
+    ``error_status`` (503 by default, with a ``retry_after`` header when
+    set) to exercise client retries. Responses carry approximate ``usage``
+    token counts, and completions longer than ``max_tokens`` are cut off
+    with finish_reason "length". ``stream: true`` requests get the answer
+    as server-sent events, one token per ``token_latency`` seconds (which
+    non-streamed answers also pay per token), and ``streamed_tokens``
+    counts tokens actually sent, so early hang-ups show up. Latency is
+    scaled by a random factor within ±``jitter``, and ``unfenced_rate`` /
+    ``malformed_rate`` control the mix of answer formats (see
+    format_completion).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, error_rate: float = 0.0, seed: int = 0,
+                 item_latency: float = 0.0, ignore_n: bool = False,
+                 token_latency: float = 0.0, jitter: float = 0.0,
+                 unfenced_rate: float = 0.0, malformed_rate: float = 0.0,
+                 error_status: int = 503, retry_after: float = None):
+        self.httpd = ThreadingHTTPServer((host, port), _StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.error_rate = error_rate
+        self.httpd.error_status = error_status
+        self.httpd.retry_after = retry_after
+        self.httpd.item_latency = item_latency
+        self.httpd.ignore_n = ignore_n
+        self.httpd.token_latency = token_latency
+        self.httpd.jitter = jitter
+        self.httpd.unfenced_rate = unfenced_rate
+        self.httpd.malformed_rate = malformed_rate
+        self.httpd.streamed_tokens = 0
+        self.httpd.rng = random.Random(seed)
+        self.httpd.lock = threading.Lock()
+        self.httpd.request_count = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def request_count(self) -> int:
+        return self.httpd.request_count
+
+    @property
+    def streamed_tokens(self) -> int:
+        return self.httpd.streamed_tokens
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the stub LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--item-latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--ignore-n", action="store_true")
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--unfenced-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = StubLLMServer(args.host, args.port, args.latency, args.error_rate,
+                           item_latency=args.item_latency, ignore_n=args.ignore_n,
+                           token_latency=args.token_latency, jitter=args.jitter,
+                           unfenced_rate=args.unfenced_rate,
+                           malformed_rate=args.malformed_rate,
+                           error_status=args.error_status,
+                           retry_after=args.retry_after)
+    print(f"Stub LLM server listening on {server.url}")
+    server.httpd.serve_forever()
@@ -0,0 +1,18 @@
+import pytest
+from src import model_inference
+from src.model_inference import LLMClient
+from src.stub_server import StubLLMServer
+
+
+@pytest.fixture
+def stub():
+    """A stub LLM server that query_model's default client talks to."""
+    with StubLLMServer() as server:
+        client = LLMClient(host=server.url, max_retries=0)
+        old = model_inference._default_client
+        model_inference._default_client = client
+        try:
+            yield server
+        finally:
+            model_inference._default_client = old
+            client.session.close()
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.accuracy import ACCURACY_METRICS, bootstrap_accuracy
+
+# (story index, estimate, count) triples, sorted by story; story 3 has a
+# single trial, story 2 ties story 4 on its mean and truth
+STORY = [0, 0, 0, 1, 1, 2, 2, 2, 3, 4, 4]
+VALUE = [3, 5, 8, 1, 2, 5, 8, 13, 20, 5, 13]
+COUNT = [2, 1, 1, 3, 1, 1, 2, 1, 1, 2, 2]
+TRUTH = [5, 1, 8, 13, 8]
+SEED, RESAMPLES, LEVEL = 7, 400, 0.9
+
+
+def _spearman(x, y):
+    rx, ry = pd.Series(x).rank(), pd.Series(y).rank()
+    if rx.std() == 0 or ry.std() == 0:
+        return np.nan
+    return float(np.corrcoef(rx, ry)[0, 1])
+
+
+def _scores(drawn, means, truth):
+    """Metrics of one resample: ``drawn`` lists (story, trial values) per copy."""
+    errors = np.array([v - truth[s] for s, values in drawn for v in values])
+    return [np.abs(errors).mean(), np.sqrt((errors ** 2).mean()),
+            (np.abs(errors) <= 1).mean(),
+            _spearman([means[s] for s, _ in drawn], [truth[s] for s, _ in drawn])]
+
+
+def naive_bootstrap(resample_trials: bool):
+    """
+    One resample at a time: draw stories with replacement, then redraw the
+    trials of every drawn copy from that story's own trials. Uses the
+    random draws of bootstrap_accuracy (one block) so results can match.
+    """
+    trials_of = {}
+    for s, v, k in zip(STORY, VALUE, COUNT):
+        trials_of.setdefault(s, []).extend([float(v)] * k)
+    n, width = len(TRUTH), max(len(t) for t in trials_of.values())
+    means = {s: np.mean(t) for s, t in trials_of.items()}
+
+    rng = np.random.default_rng(SEED)
+    picks = rng.integers(0, n, size=(RESAMPLES, n))
+    if resample_trials:
+        u = rng.random((RESAMPLES, n, width), dtype=np.float32)
+    point = _scores([(s, trials_of[s]) for s in range(n)], means, TRUTH)
+    draws = []
+    for b in range(RESAMPLES):
+        drawn = []
+        for i, s in enumerate(picks[b]):
+            trials = trials_of[s]
+            if resample_trials:
+                trials = [trials[int(u[b, i, j] * np.float32(len(trials)))]
+                          for j in range(len(trials))]
+            drawn.append((s, trials))
+        draws.append(_scores(drawn, means, TRUTH))
+    alpha = 100 * (1 - LEVEL) / 2
+    lo, hi = np.nanpercentile(np.array(draws), [alpha, 100 - alpha], axis=0)
+    return {name: {"value": point[i], "ci": [lo[i], hi[i]]}
+            for i, name in enumerate(ACCURACY_METRICS)}
+
+
+@pytest.mark.parametrize("resample_trials", [True, False])
+def test_matches_a_looped_bootstrap(resample_trials):
+    fast = bootstrap_accuracy(STORY, VALUE, COUNT, TRUTH, resample_trials,
+                              n_resamples=RESAMPLES, level=LEVEL, seed=SEED)
+    naive = naive_bootstrap(resample_trials)
+    for name in ACCURACY_METRICS:
+        assert fast[name]["value"] == pytest.approx(naive[name]["value"]), name
+        assert fast[name]["ci"] == pytest.approx(naive[name]["ci"]), name
+
+
+def test_point_values():
+    acc = bootstrap_accuracy([0, 0, 1], [3, 5, 8], [4, 1, 5], truth=[3, 8],
+                             n_resamples=50)
+    assert acc["mae"]["value"] == pytest.approx(0.2)
+    assert acc["rmse"]["value"] == pytest.approx(np.sqrt(0.4))
+    assert acc["within_1"]["value"] == pytest.approx(0.9)
+    assert acc["spearman"]["value"] == pytest.approx(1.0)
+    lo, hi = acc["mae"]["ci"]
+    assert 0 <= lo <= 0.2 <= hi
+
+
+def test_trial_resampling_widens_the_interval():
+    def width(acc):
+        lo, hi = acc["mae"]["ci"]
+        return hi - lo
+    stories_only = bootstrap_accuracy(STORY, VALUE, COUNT, TRUTH, False,
+                                      n_resamples=2000, seed=SEED)
+    two_level = bootstrap_accuracy(STORY, VALUE, COUNT, TRUTH, True,
+                                   n_resamples=2000, seed=SEED)
+    assert two_level["mae"]["value"] == stories_only["mae"]["value"]
+    assert two_level["spearman"]["value"] == stories_only["spearman"]["value"]
+    assert width(two_level) > width(stories_only)
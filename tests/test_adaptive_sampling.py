@@ -0,0 +1,76 @@
+import pytest
+from src.adaptive_sampling import AdaptiveScheduler
+
+STORIES = ["a", "b", "c"]
+
+
+def _drive(scheduler, answer):
+    """Run rounds until the scheduler is done; ``answer(sid, trial)`` estimates."""
+    rounds = []
+    while True:
+        jobs = scheduler.next_round()
+        if not jobs:
+            return rounds
+        rounds.append(jobs)
+        for sid, t in jobs:
+            scheduler.observe(sid, t, answer(sid, t))
+
+
+def _noisy(sid, t):
+    return 1 if t % 2 else 13
+
+
+def test_converged_stories_stop_at_min_trials():
+    scheduler = AdaptiveScheduler(STORIES, min_trials=2, max_trials=10,
+                                  budget=30, tolerance=0.5)
+    rounds = _drive(scheduler, lambda sid, t: 5)
+    assert len(rounds) == 1
+    assert scheduler.trials == {"a": 2, "b": 2, "c": 2}
+    assert scheduler.report(fixed_trials=10)["calls_saved"] == 24
+
+
+def test_max_trials_caps_unconverged_stories():
+    scheduler = AdaptiveScheduler(STORIES, min_trials=2, max_trials=4,
+                                  tolerance=0.5)
+    _drive(scheduler, _noisy)
+    assert scheduler.trials == {"a": 4, "b": 4, "c": 4}
+    assert scheduler.report(fixed_trials=4)["converged_stories"] == 0
+
+
+def test_budget_caps_the_total_calls():
+    scheduler = AdaptiveScheduler(STORIES, min_trials=2, max_trials=10,
+                                  budget=8, tolerance=0.5)
+    _drive(scheduler, _noisy)
+    assert scheduler.calls == 8
+    assert sorted(scheduler.trials.values()) == [2, 3, 3]
+
+
+def test_budget_must_cover_min_trials():
+    with pytest.raises(ValueError, match="budget"):
+        AdaptiveScheduler(STORIES, min_trials=3, budget=8)
+
+
+def test_first_round_is_capped_by_the_budget_left():
+    scheduler = AdaptiveScheduler(STORIES, min_trials=2, budget=6)
+    # a resumed log: story a twice, then a retried trial recorded again
+    for sid, t in [("a", 0), ("a", 1), ("a", 1)]:
+        scheduler.observe(sid, t, 5)
+    assert scheduler.next_round() == [("b", 0), ("b", 1), ("c", 0)]
+
+
+def test_most_uncertain_stories_go_first():
+    scheduler = AdaptiveScheduler(STORIES, min_trials=2, max_trials=10,
+                                  budget=7, tolerance=0.5)
+    estimates = {"a": [5, 5], "b": [3, 5], "c": [1, 13]}
+    for sid, t in scheduler.next_round():
+        scheduler.observe(sid, t, estimates[sid][t])
+    assert scheduler.next_round() == [("c", 2)]
+    scheduler.budget = None
+    assert scheduler.next_round() == [("c", 2), ("b", 2)]
+
+
+def test_unknown_stories_are_ignored():
+    scheduler = AdaptiveScheduler(STORIES, min_trials=1, budget=3)
+    scheduler.observe("gone", 0, 5)
+    assert scheduler.calls == 0
+    assert scheduler.next_round() == [("a", 0), ("b", 0), ("c", 0)]
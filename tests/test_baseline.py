@@ -0,0 +1,99 @@
+import json, os, subprocess, sys
+import pandas as pd
+import pytest
+from src.baseline import (DEFAULT_TIERS, KeywordMatcher, heuristic_estimate,
+                          heuristic_estimate_batch)
+
+ROOT = os.path.join(os.path.dirname(__file__), os.pardir)
+STORIES_CSV = os.path.join(ROOT, "data", "user_stories.csv")
+# Keywords that overlap, nest and share prefixes, where a single regex scan
+# could credit only the longest match at a position
+EXTRA_STORIES = [
+    "",
+    "As a user I want nothing in particular",
+    "EXPORT the Dashboard in REAL TIME",
+    "Import, export and re-import the report; view the viewer list",
+    "reimported reports exported to the importer",
+    "As an admin I want to create, update and assign forms with auth",
+    "display browse read list view",
+    "integrate payment analytics notifications dashboard export import",
+]
+CUSTOM_TIERS = {
+    "tiers": [
+        {"name": "epic", "base": 20, "cap": 21, "keywords": ["reimport", "Real Time"]},
+        {"name": "high", "base": 8, "cap": 13,
+         "keywords": ["import", "export", "port", "report", "importer"]},
+        {"name": "medium", "base": 3, "cap": 5,
+         "keywords": ["re", "view", "viewer", "port", "form"]},
+        {"name": "low", "base": 1, "cap": 2, "keywords": ["a", "list"]}
+    ],
+    "default": 0
+}
+
+
+def original_heuristic(story: str) -> int:
+    """heuristic_estimate as first written: one substring test per keyword."""
+    low_complexity_indicators = ["view", "read", "list", "display", "browse"]
+    medium_complexity_indicators = ["update", "create", "form", "auth",
+        "discount", "assign"]
+    high_complexity_indicators = ["integrate", "export", "import", "payment",
+        "real time", "dashboard", "analytics",
+        "notifications"]
+    story_lower = story.lower()
+    low_count = sum(1 for indicator in low_complexity_indicators
+                    if indicator in story_lower)
+    medium_count = sum(1 for indicator in medium_complexity_indicators
+                       if indicator in story_lower)
+    high_count = sum(1 for indicator in high_complexity_indicators
+                     if indicator in story_lower)
+    if high_count > 0:
+        return min(10, 6 + high_count)
+    elif medium_count > 0:
+        return min(8, 3 + medium_count)
+    elif low_count > 0:
+        return min(5, 1 + low_count)
+    else:
+        return 3
+
+
+def looped_heuristic(story: str, tiers: dict) -> int:
+    """The original per-keyword loop generalised to a tiers file."""
+    story_lower = story.lower()
+    for tier in tiers["tiers"]:
+        count = sum(1 for kw in tier["keywords"] if kw.lower() in story_lower)
+        if count > 0:
+            return min(tier["cap"], tier["base"] + count)
+    return tiers.get("default", 3)
+
+
+@pytest.fixture(scope="module")
+def stories():
+    return pd.read_csv(STORIES_CSV)["story"].tolist() + EXTRA_STORIES
+
+
+def test_batch_matches_the_original_heuristic(stories):
+    expected = [original_heuristic(s) for s in stories]
+    assert heuristic_estimate_batch(stories).tolist() == expected
+    assert [heuristic_estimate(s) for s in stories] == expected
+    assert [looped_heuristic(s, DEFAULT_TIERS) for s in stories] == expected
+
+
+def test_batch_matches_the_loop_for_custom_tiers(stories):
+    expected = [looped_heuristic(s, CUSTOM_TIERS) for s in stories]
+    assert len(set(expected)) > 3
+    matcher = KeywordMatcher(CUSTOM_TIERS)
+    assert heuristic_estimate_batch(stories, matcher).tolist() == expected
+
+
+def test_cli_with_a_keywords_file(stories, tmp_path):
+    tiers, in_csv, out_csv = (tmp_path / "tiers.json", tmp_path / "in.csv",
+                              tmp_path / "out.csv")
+    tiers.write_text(json.dumps(CUSTOM_TIERS), encoding="utf-8")
+    pd.DataFrame({"id": range(len(stories)), "story": stories}).to_csv(in_csv, index=False)
+    subprocess.run([sys.executable, "-m", "src.baseline", str(in_csv), str(out_csv),
+                    "--keywords", str(tiers), "--chunksize", "4"],
+                   cwd=ROOT, check=True, capture_output=True)
+    out = pd.read_csv(out_csv, keep_default_na=False)
+    assert out["story"].tolist() == stories
+    assert out["baseline_estimate"].tolist() == [looped_heuristic(s, CUSTOM_TIERS)
+                                                 for s in stories]
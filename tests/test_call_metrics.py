@@ -0,0 +1,113 @@
+import json, os
+import pandas as pd
+import pytest
+import main
+from src import call_metrics, model_inference
+from src.model_inference import LLMClient
+from src.stub_server import StubLLMServer
+
+STORIES_CSV = os.path.join(os.path.dirname(__file__), os.pardir, "data",
+                           "user_stories.csv")
+TRIALS = 2
+
+
+@pytest.fixture
+def flaky_stub():
+    """A stub failing 30% of requests, behind a client that retries them."""
+    with StubLLMServer(seed=3, error_rate=0.3) as server:
+        client = LLMClient(host=server.url, max_retries=10, backoff_base=0.01,
+                           backoff_max=0.02, breaker_threshold=100)
+        old = model_inference._default_client
+        model_inference._default_client = client
+        try:
+            yield server
+        finally:
+            model_inference._default_client = old
+            client.session.close()
+
+
+@pytest.fixture
+def hook_records():
+    records = []
+    hook = call_metrics.register_hook(records.append)
+    yield records
+    call_metrics.unregister_hook(hook)
+
+
+def _run(tmp_path, **kwargs):
+    main.run_pipeline(trials=TRIALS, use_cache=False, stories_csv=STORIES_CSV,
+                      results_dir=str(tmp_path), **kwargs)
+    results = pd.read_csv(tmp_path / main.RESULTS_CSV)
+    with open(tmp_path / main.SUMMARY_JSON, encoding="utf-8") as f:
+        return results, json.load(f)["latency"]
+
+
+def test_hook_and_summary_report_call_metrics(flaky_stub, hook_records, tmp_path):
+    results, latency = _run(tmp_path)
+    n = len(results)
+    assert n == TRIALS * len(pd.read_csv(STORIES_CSV))
+
+    # one hook record per call, retried attempts included
+    assert len(hook_records) == n
+    retries = sum(r["retries"] for r in hook_records)
+    assert retries > 0
+    assert flaky_stub.request_count == n + retries
+    for r in hook_records:
+        assert r["status"] == "ok" and r["error"] is None
+        assert r["endpoint"] == flaky_stub.url
+        assert r["finish_reason"] == "stop" and r["n_choices"] == 1
+        assert r["prompt_tokens"] > 0 and r["completion_tokens"] > 0
+        phases = r["queue_time"] + r["wait_time"] + r["read_time"]
+        assert min(r["queue_time"], r["wait_time"], r["read_time"]) >= 0
+        assert phases <= r["total_time"] + 1e-6
+        if r["retries"]:
+            assert r["queue_time"] > 0  # failed attempts and backoff
+        assert r["ttft"] is None
+
+    # the per-trial columns carry the same figures
+    assert set(call_metrics.CALL_METRIC_COLUMNS) <= set(results.columns)
+    assert results["retries"].sum() == retries
+    assert not results["cached"].any()
+    assert (results["endpoint"] == flaky_stub.url).all()
+    assert (results["finish_reason"] == "stop").all()
+    assert results["prompt_tokens"].sum() == sum(r["prompt_tokens"] for r in hook_records)
+
+    # and the summary's latency section aggregates them
+    assert latency["count"] == n
+    assert latency["mean_retries"] == pytest.approx(retries / n)
+    for c in ("queue_time", "wait_time", "read_time"):
+        assert latency[f"mean_{c}"] == pytest.approx(
+            sum(r[c] for r in hook_records) / n)
+    assert latency["mean_ttft"] is None
+    assert latency["prompt_tokens"] == sum(r["prompt_tokens"] for r in hook_records)
+    assert latency["completion_tokens"] == sum(r["completion_tokens"]
+                                               for r in hook_records)
+    assert latency["tokens_per_sec"] > 0
+    assert latency["finish_reasons"] == {"stop": n}
+    assert latency["truncation_rate"] == 0.0
+    assert latency["cached_trials"] == 0
+    assert latency["endpoints"][flaky_stub.url]["count"] == n
+
+
+def test_streamed_calls_report_ttft_and_early_stop(stub, hook_records, tmp_path):
+    results, latency = _run(tmp_path, stream_mode="early")
+    assert len(hook_records) == len(results)
+    for r in hook_records:
+        assert r["finish_reason"] == call_metrics.FINISH_EARLY_STOP
+        assert 0 <= r["ttft"] <= r["total_time"]
+    assert (results["finish_reason"] == call_metrics.FINISH_EARLY_STOP).all()
+    assert latency["finish_reasons"] == {call_metrics.FINISH_EARLY_STOP: len(results)}
+    assert latency["mean_ttft"] == pytest.approx(
+        sum(r["ttft"] for r in hook_records) / len(results))
+
+
+def test_failing_hooks_only_warn(stub):
+    def broken(record):
+        raise RuntimeError("boom")
+    call_metrics.register_hook(broken)
+    try:
+        with pytest.warns(UserWarning, match="boom"):
+            assert model_inference.query_model("As a user, I want to log in.",
+                                               use_cache=False)
+    finally:
+        call_metrics.unregister_hook(broken)
@@ -0,0 +1,140 @@
+import threading, time
+import pytest
+import requests
+from src.endpoint_pool import EndpointPool
+from src.model_inference import build_payload
+from src.stub_server import StubLLMServer
+
+PAYLOAD = build_payload("As a user, I want to export reports.")
+
+
+@pytest.fixture
+def servers():
+    with StubLLMServer() as a, StubLLMServer() as b:
+        yield a, b
+
+
+def _pool(servers, cap: int = 1) -> EndpointPool:
+    return EndpointPool([(s.url, cap) for s in servers], max_retries=1,
+                        eject_after=1, health_interval=60)
+
+
+def _raise(error):
+    def call(*args, **kwargs):
+        raise error
+    return call
+
+
+def test_requests_spread_over_endpoints(servers):
+    pool = _pool(servers)
+    try:
+        for _ in range(4):
+            assert pool.post(PAYLOAD, timeout=5)["choices"]
+        stats = pool.stats()
+    finally:
+        pool.close()
+    assert sum(st["requests"] for st in stats.values()) == 4
+    assert all(st["requests"] > 0 for st in stats.values())
+    assert all(st["outstanding"] == 0 for st in stats.values())
+
+
+def _wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_slow_endpoint_is_ejected_and_readmitted():
+    with StubLLMServer() as fast, StubLLMServer(latency=0.2) as slow:
+        pool = EndpointPool([(fast.url, 1), (slow.url, 1)], max_retries=1,
+                            min_samples=2, cooldown=0.2, health_interval=0.05)
+        fast_ep, slow_ep = pool.endpoints
+        stop = threading.Event()
+
+        def load():
+            while not stop.is_set():
+                pool.post(PAYLOAD, timeout=5)
+        # three clients on two cap=1 endpoints keep the slow one busy too
+        threads = [threading.Thread(target=load) for _ in range(3)]
+        probes = []
+
+        def failed_probe(ep):
+            probes.append(ep)
+            return False
+        try:
+            pool._probe = failed_probe
+            for t in threads:
+                t.start()
+            _wait_until(lambda: not slow_ep.healthy)
+            assert fast_ep.healthy and slow_ep.ejections == 1
+            assert slow_ep.errors == 0
+
+            # failed probes keep it out and restart the cooldown
+            _wait_until(lambda: len(probes) >= 2)
+            assert not slow_ep.healthy
+            served = slow_ep.requests
+
+            slow.httpd.latency = 0.0
+            del pool._probe
+            _wait_until(lambda: slow_ep.healthy)
+            _wait_until(lambda: slow_ep.requests > served)
+        finally:
+            stop.set()
+            for t in threads:
+                t.join()
+            pool.close()
+        assert probes and set(probes) == {slow_ep}
+        assert slow_ep.ejections == 1
+        assert fast_ep.outstanding == slow_ep.outstanding == 0
+
+
+def test_unexpected_errors_release_the_endpoint_slot(servers):
+    pool = _pool(servers[:1])
+    ep = pool.endpoints[0]
+    try:
+        ep.client.stream = _raise(ValueError("malformed SSE event"))
+        for _ in range(3):  # with a leaked slot the cap=1 endpoint would block
+            with pytest.raises(ValueError):
+                pool.stream(PAYLOAD, timeout=1)
+        assert ep.outstanding == 0
+        assert ep.healthy and ep.errors == 0
+        assert pool.post(PAYLOAD, timeout=5)["choices"]
+    finally:
+        pool.close()
+
+
+def test_client_errors_are_not_charged_to_the_endpoint(servers):
+    pool = _pool(servers)
+    first, second = pool.endpoints
+    response = requests.Response()
+    response.status_code = 400
+    calls = []
+
+    def bad_request(*args, **kwargs):
+        calls.append(1)
+        raise requests.HTTPError("400 bad request", response=response)
+    try:
+        first.client.post = second.client.post = bad_request
+        with pytest.raises(requests.HTTPError):
+            pool.post(PAYLOAD, timeout=5)
+        assert len(calls) == 1  # no failover
+        assert all(ep.healthy and ep.errors == 0 and ep.outstanding == 0
+                   for ep in pool.endpoints)
+    finally:
+        pool.close()
+
+
+def test_server_errors_fail_over_and_eject(servers):
+    pool = _pool(servers)
+    first, second = pool.endpoints
+    try:
+        first.client.post = _raise(requests.ConnectionError("refused"))
+        second.client.post = _raise(requests.ConnectionError("refused"))
+        with pytest.raises(requests.ConnectionError):
+            pool.post(PAYLOAD, timeout=5)
+        assert first.errors + second.errors == 2
+        assert sum(not ep.healthy for ep in pool.endpoints) == 1
+        assert first.outstanding == second.outstanding == 0
+    finally:
+        pool.close()
@@ -0,0 +1,83 @@
+import threading, time
+import requests
+from src.estimation_service import EstimationServer, EstimationService
+
+
+def _post_all(url: str, stories) -> list:
+    """POST every story to /estimate at once; responses in story order."""
+    responses = [None] * len(stories)
+    barrier = threading.Barrier(len(stories))
+
+    def post(i, story):
+        barrier.wait()
+        responses[i] = requests.post(url + "/estimate", json={"story": story},
+                                     timeout=30)
+    threads = [threading.Thread(target=post, args=(i, s))
+               for i, s in enumerate(stories)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return responses
+
+
+def test_identical_stories_coalesce(stub):
+    stub.httpd.latency = 0.3
+    service = EstimationService(window=0.2, max_batch=8, workers=2,
+                                use_cache=False)
+    with EstimationServer(port=0, service=service) as server:
+        story = "As a user, I want to reset my password so that I can log in."
+        responses = _post_all(server.url, [story] * 6)
+        metrics = requests.get(server.url + "/metrics", timeout=5).json()
+
+    assert [r.status_code for r in responses] == [200] * 6
+    bodies = [r.json() for r in responses]
+    assert len({b["estimate"] for b in bodies}) == 1
+    assert bodies[0]["parse_status"] == "ok"
+    assert stub.request_count == 1
+    assert metrics["requests"] == 6
+    assert metrics["coalesced"] == 5
+    assert metrics["batches"] == 1
+
+
+def test_distinct_stories_share_one_multi_story_request(stub):
+    service = EstimationService(window=0.5, max_batch=8, workers=2,
+                                use_cache=False)
+    with EstimationServer(port=0, service=service) as server:
+        stories = [f"As a user, I want feature {i} so that I can work."
+                   for i in range(5)]
+        responses = _post_all(server.url, stories)
+        metrics = requests.get(server.url + "/metrics", timeout=5).json()
+
+    assert all(r.status_code == 200 for r in responses)
+    assert all(r.json()["estimate"] is not None for r in responses)
+    assert stub.request_count == 1
+    assert metrics["requests"] == 5
+    assert metrics["coalesced"] == 0
+    assert metrics["batches"] == 1
+    assert metrics["mean_batch_size"] == 5
+    assert metrics["errors"] == 0
+    assert metrics["queue_depth"] == 0
+    assert metrics["in_flight"] == 0
+    assert metrics["request_latency"]["count"] == 5
+    assert metrics["upstream_latency"]["count"] == 1
+
+
+def test_queue_depth_counts_stories_waiting_for_a_worker(stub):
+    stub.httpd.latency = 0.5
+    service = EstimationService(window=0.0, max_batch=1, workers=1,
+                                use_cache=False)
+    try:
+        futures = [service.submit(f"story {i}") for i in range(4)]
+        # one story runs on the only worker, the rest wait in the queue
+        deadline = time.monotonic() + 5
+        while service.metrics()["in_flight"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        metrics = service.metrics()
+        assert metrics["in_flight"] == 1
+        assert metrics["queue_depth"] == 3
+        for fut in futures:
+            fut.result(10)
+    finally:
+        service.close()
+    assert service.metrics()["batches"] == 4
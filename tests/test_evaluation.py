@@ -0,0 +1,77 @@
+import json, os
+import pandas as pd
+import pytest
+from src.evaluation import evaluate, update_summary
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+RESULTS_CSV = os.path.join(DATA, "model_outputs.csv")
+# Written by the original row-by-row evaluate() from RESULTS_CSV
+BASELINE_SUMMARY = os.path.join(DATA, "benchmark_summary.json")
+STORIES_CSV = os.path.join(DATA, os.pardir, os.pardir, "data", "user_stories.csv")
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    with open(BASELINE_SUMMARY, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def assert_matches_baseline(summary: dict, baseline: dict):
+    assert {str(sid) for sid in summary["stories"]} == set(baseline["stories"])
+    for sid, st in summary["stories"].items():
+        assert st == pytest.approx(baseline["stories"][str(sid)]), sid
+    assert summary["global"] == pytest.approx(baseline["global"])
+
+
+@pytest.mark.parametrize("chunksize", [None, 1, 4, 7])
+def test_evaluate_matches_baseline(tmp_path, baseline, chunksize):
+    out = tmp_path / "benchmark_summary.json"
+    summary = evaluate(RESULTS_CSV, str(out), chunksize=chunksize)
+    assert_matches_baseline(summary, baseline)
+    with open(out, encoding="utf-8") as f:
+        assert_matches_baseline(json.load(f), baseline)
+
+
+def test_update_summary_matches_baseline(tmp_path, baseline):
+    out = str(tmp_path / "benchmark_summary.json")
+    records = pd.read_csv(RESULTS_CSV)
+    update_summary(records.iloc[:9], out)
+    summary = update_summary(records.iloc[9:], out)
+    assert_matches_baseline(summary, baseline)
+
+
+def test_incremental_summary_matches_full_recompute_at_the_boundary(tmp_path):
+    # the mean is exactly 4.0, so 3 and 5 sit exactly on the ±1 boundary;
+    # a running mean of 3.9999999999999996 would leave 5 out
+    rows = pd.DataFrame({"story_id": 1, "trial": range(6),
+                         "estimate": [1, 1, 3, 5, 13, 1], "parse_status": "ok",
+                         "response_time": 0.1})
+    rows.to_csv(tmp_path / "results.csv", index=False)
+    full = evaluate(str(tmp_path / "results.csv"), str(tmp_path / "full.json"))
+    assert full["stories"][1]["mean"] == 4.0
+    assert full["stories"][1]["consistency_within_±1"] == pytest.approx(2 / 6)
+
+    out = str(tmp_path / "incremental.json")
+    for _, row in rows.iterrows():
+        incremental = update_summary([row.to_dict()], out)
+    assert incremental["stories"] == full["stories"]
+    assert incremental["global"] == full["global"]
+
+
+def test_update_summary_drops_accuracy(tmp_path):
+    out = str(tmp_path / "benchmark_summary.json")
+    summary = evaluate(RESULTS_CSV, out, stories_csv=STORIES_CSV)
+    assert "accuracy" in summary
+    summary = update_summary([{"story_id": 1, "trial": 9, "estimate": 8}], out)
+    assert "accuracy" not in summary
+    with open(out, encoding="utf-8") as f:
+        assert "accuracy" not in json.load(f)
+
+
+def test_update_summary_rebuilds_a_missing_summary(tmp_path, baseline):
+    out = tmp_path / "benchmark_summary.json"
+    evaluate(RESULTS_CSV, str(out))
+    out.unlink()
+    summary = update_summary([], str(out))
+    assert_matches_baseline(summary, baseline)
+    assert summary["latency"]["count"] > 0
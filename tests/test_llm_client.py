@@ -0,0 +1,114 @@
+import time
+import pytest
+import requests
+from src.model_inference import CircuitOpenError, LLMClient, build_payload
+from src.stub_server import StubLLMServer
+
+PAYLOAD = build_payload("As a user, I want to export reports.")
+
+
+@pytest.fixture
+def server():
+    with StubLLMServer(seed=1) as server:
+        yield server
+
+
+def _client(server, **kwargs) -> LLMClient:
+    kwargs.setdefault("backoff_base", 0.01)
+    kwargs.setdefault("backoff_max", 0.05)
+    return LLMClient(host=server.url, **kwargs)
+
+
+def test_backoff_is_jittered_within_the_exponential_cap():
+    client = LLMClient(backoff_base=0.5, backoff_max=8.0)
+    for attempt, cap in [(0, 0.5), (1, 1.0), (3, 4.0), (6, 8.0)]:
+        delays = [client._backoff(attempt) for _ in range(200)]
+        assert all(0 <= d <= cap for d in delays)
+        assert len(set(delays)) > 1
+    assert client._backoff(0, retry_after="2") == 2.0
+    assert client._backoff(0, retry_after="120") == 8.0
+    assert 0 <= client._backoff(0, retry_after="Wed, 21 Oct 2015") <= 0.5
+
+
+@pytest.mark.parametrize("status", [503, 429, 500])
+def test_transient_errors_are_retried(server, status):
+    server.httpd.error_rate = 0.5
+    server.httpd.error_status = status
+    client = _client(server, max_retries=10, breaker_threshold=100)
+    retries = 0
+    for _ in range(10):
+        metrics = {}
+        assert client.post(PAYLOAD, timeout=10, metrics=metrics)["choices"]
+        assert metrics["status"] == "ok"
+        retries += metrics["retries"]
+    assert retries > 0
+    assert server.request_count == 10 + retries
+
+
+def test_retry_after_is_honoured(server):
+    server.httpd.error_rate = 1.0
+    server.httpd.error_status = 429
+    server.httpd.retry_after = 0.2
+    client = _client(server, max_retries=2, backoff_max=1.0,
+                     breaker_threshold=100)
+    t0 = time.monotonic()
+    with pytest.raises(requests.HTTPError, match="429"):
+        client.post(PAYLOAD, timeout=10)
+    assert time.monotonic() - t0 >= 0.4
+    assert server.request_count == 3
+
+
+def test_client_errors_are_not_retried(server):
+    server.httpd.error_rate = 1.0
+    server.httpd.error_status = 400
+    client = _client(server, max_retries=5)
+    metrics = {}
+    with pytest.raises(requests.HTTPError):
+        client.post(PAYLOAD, timeout=10, metrics=metrics)
+    assert server.request_count == 1
+    assert metrics["retries"] == 0 and metrics["status"] == "error"
+
+
+def test_deadline_covers_slow_responses(server):
+    server.httpd.latency = 1.0
+    client = _client(server, max_retries=5)
+    t0 = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        client.post(PAYLOAD, timeout=0.3)
+    assert time.monotonic() - t0 < 0.9
+
+
+def test_deadline_covers_retries(server):
+    server.httpd.error_rate = 1.0
+    # a backoff past the deadline gives up at once instead of sleeping
+    client = _client(server, max_retries=5)
+    client._backoff = lambda attempt, retry_after=None: 5.0
+    t0 = time.monotonic()
+    with pytest.raises(requests.HTTPError):
+        client.post(PAYLOAD, timeout=1.0)
+    assert time.monotonic() - t0 < 1.0
+    assert server.request_count == 1
+
+
+def test_circuit_breaker_opens_and_half_opens(server):
+    server.httpd.error_rate = 1.0
+    client = _client(server, max_retries=0, breaker_threshold=2,
+                     breaker_cooldown=0.5)
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            client.post(PAYLOAD, timeout=5)
+    assert server.request_count == 2
+
+    # open: requests whose deadline ends before the cooldown fail fast
+    t0 = time.monotonic()
+    with pytest.raises(CircuitOpenError):
+        client.post(PAYLOAD, timeout=0.1)
+    assert time.monotonic() - t0 < 0.1
+    assert server.request_count == 2
+
+    # a longer deadline waits out the cooldown, then a trial request goes through
+    server.httpd.error_rate = 0.0
+    assert client.post(PAYLOAD, timeout=5)["choices"]
+    assert time.monotonic() - t0 >= 0.4
+    assert server.request_count == 3
+    assert client._failures == 0
@@ -0,0 +1,103 @@
+import json
+import pytest
+from src.output_parser import (STATUS_EMPTY, STATUS_INVALID_ESTIMATE,
+                               STATUS_INVALID_JSON, STATUS_MISSING_ESTIMATE,
+                               STATUS_OK, StreamingEstimateParser, parse_output,
+                               split_multi_output)
+
+ANSWER = {"estimate": 5, "confidence": "med", "reasons": ["api", "ui"]}
+
+
+@pytest.mark.parametrize("raw", [
+    json.dumps(ANSWER),
+    "```json\n" + json.dumps(ANSWER) + "\n```",
+    "```json\n" + json.dumps(ANSWER, indent=2) + "\n```\nHope this helps!",
+])
+def test_parse_output_ok(raw):
+    assert parse_output(raw) == {"estimate": 5, "confidence": "med",
+                                 "n_reasons": 2, "parse_status": STATUS_OK,
+                                 "parse_error": None}
+
+
+@pytest.mark.parametrize("raw, status", [
+    (None, STATUS_EMPTY),
+    ("", STATUS_EMPTY),
+    ("   ", STATUS_EMPTY),
+    ("I think about 5 points", STATUS_INVALID_JSON),
+    ('{"estimate": 5', STATUS_INVALID_JSON),
+    ("[5]", STATUS_INVALID_JSON),
+    ('{"confidence": "low"}', STATUS_MISSING_ESTIMATE),
+    ('{"estimate": "high"}', STATUS_INVALID_ESTIMATE),
+    ('{"estimate": true}', STATUS_INVALID_ESTIMATE),
+    ('{"estimate": null}', STATUS_INVALID_ESTIMATE),
+])
+def test_parse_output_failures(raw, status):
+    parsed = parse_output(raw)
+    assert parsed["parse_status"] == status
+    assert parsed["estimate"] is None
+    if status != STATUS_EMPTY:
+        assert parsed["parse_error"]
+
+
+def test_parse_output_coerces_estimates():
+    assert parse_output('{"estimate": "8"}')["estimate"] == 8
+    assert parse_output('{"estimate": 2.5}')["estimate"] == 2.5
+    assert parse_output('{"estimate": 3.0}')["estimate"] == 3
+    assert parse_output('{"estimate": 1, "reasons": "x"}')["n_reasons"] is None
+
+
+def test_split_multi_output_matches_ids():
+    raw = "```json\n" + json.dumps([{"id": "b", "estimate": 3},
+                                    {"id": "a", "estimate": 8}]) + "\n```"
+    out = split_multi_output(raw, ["a", "b", "c"])
+    assert parse_output(out["a"])["estimate"] == 8
+    assert parse_output(out["b"])["estimate"] == 3
+    assert out["c"] is None
+
+
+def test_split_multi_output_falls_back_to_position():
+    raw = json.dumps([{"estimate": 1}, {"estimate": 2}])
+    out = split_multi_output(raw, [10, 20])
+    assert parse_output(out[10])["estimate"] == 1
+    assert parse_output(out[20])["estimate"] == 2
+
+
+def test_split_multi_output_unwraps_objects_and_plain_fences():
+    raw = "```\n" + json.dumps({"estimates": [{"id": 7, "estimate": 4}]}) + "\n```"
+    assert parse_output(split_multi_output(raw, [7])[7])["estimate"] == 4
+
+
+@pytest.mark.parametrize("raw", [None, "", "no json here", '{"id": 1'])
+def test_split_multi_output_unparseable(raw):
+    assert split_multi_output(raw, [1, 2]) == {1: None, 2: None}
+
+
+def _feed(parser, text, size):
+    for i in range(0, len(text), size):
+        closed = parser.feed(text[i:i + size])
+        if closed is not None:
+            return closed, i + size
+    return None, len(text)
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_streaming_parser_stops_at_the_estimate(size):
+    text = '```json\n{"confidence": "high", "estimate": 13, "reasons": ["a", "b"]}\n```'
+    closed, consumed = _feed(StreamingEstimateParser(), text, size)
+    assert parse_output(closed) == {"estimate": 13, "confidence": "high",
+                                    "n_reasons": None, "parse_status": STATUS_OK,
+                                    "parse_error": None}
+    if size < 10:  # stopped before the reasons were streamed
+        assert consumed < text.index("reasons") + size
+
+
+def test_streaming_parser_waits_for_the_whole_number():
+    parser = StreamingEstimateParser()
+    assert parser.feed('{"estimate": 1') is None
+    assert parser.feed("3") is None
+    assert parse_output(parser.feed(".5,"))["estimate"] == 13.5
+
+
+def test_streaming_parser_without_estimate():
+    closed, _ = _feed(StreamingEstimateParser(), '{"confidence": "low"}', 4)
+    assert closed is None
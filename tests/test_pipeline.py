@@ -0,0 +1,11 @@
+import pytest
+import main
+
+
+def test_stream_with_batching_is_rejected_before_the_log_is_opened(tmp_path):
+    log = tmp_path / main.RESULTS_LOG
+    log.write_text('{"story_id": 1, "trial": 0}\n', encoding="utf-8")
+    with pytest.raises(ValueError, match="streaming"):
+        main.run_pipeline(batch_mode="n", batch_size=2, stream_mode="early",
+                          results_dir=str(tmp_path))
+    assert log.read_text(encoding="utf-8") == '{"story_id": 1, "trial": 0}\n'
@@ -0,0 +1,109 @@
+import itertools, os
+import pytest
+import main
+from src import response_cache
+from src.model_inference import build_payload, query_model
+from src.response_cache import ResponseCache, cache_key
+
+STORIES_CSV = os.path.join(os.path.dirname(__file__), os.pardir, "data",
+                           "user_stories.csv")
+STORY = "As a user, I want to export reports."
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake time.time() that moves one second per call unless set."""
+    ticks = itertools.count(1_000_000)
+    now = {"value": None}
+    monkeypatch.setattr(response_cache.time, "time",
+                        lambda: now["value"] if now["value"] is not None
+                        else next(ticks))
+    return now
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """A fresh cache used by query_model instead of the on-disk default."""
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    monkeypatch.setattr(response_cache, "_default_cache", cache)
+    yield cache
+    cache.close()
+
+
+def test_keys_cover_payload_and_trial():
+    payload = build_payload(STORY)
+    assert cache_key(payload, 0) == cache_key(dict(reversed(payload.items())), 0)
+    assert cache_key(payload, 0) != cache_key(payload, 1)
+    assert cache_key(payload, 0) != cache_key(dict(payload, temperature=0.7), 0)
+
+
+def test_hit_and_miss(cache):
+    key = cache_key(build_payload(STORY), 0)
+    assert cache.get(key) is None
+    cache.put(key, '{"estimate": 3}', 1.5)
+    assert cache.get(key) == ('{"estimate": 3}', 1.5)
+    assert cache.get(cache_key(build_payload(STORY), 1)) is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 1 / 3,
+                             "entries": 1}
+
+
+def test_entries_expire_by_age(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "c.sqlite"), max_age_days=1)
+    clock["value"] = 0
+    cache.put("old", "a", 0.1)
+    clock["value"] = 86400 - 1
+    cache.put("new", "b", 0.1)
+    assert cache.get("old") == ("a", 0.1)
+    clock["value"] = 86400 + 1
+    assert cache.get("old") is None
+    assert cache.get("new") == ("b", 0.1)
+    cache.evict()
+    assert len(cache) == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "c.sqlite"), max_entries=2,
+                          max_age_days=0)
+    for key in ("a", "b", "c"):
+        cache.put(key, key, 0.1)
+    assert cache.get("a") == ("a", 0.1)  # now more recent than b and c
+    cache.evict()
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_query_model_uses_the_cache_per_trial(stub, cache):
+    first = query_model(STORY, trial=0)
+    assert query_model(STORY, trial=0) == first
+    assert stub.request_count == 1
+    query_model(STORY, trial=1)
+    assert stub.request_count == 2
+
+
+def test_bypass(stub, cache, monkeypatch):
+    query_model(STORY, trial=0)
+    query_model(STORY, trial=0, use_cache=False)
+    assert stub.request_count == 2
+    monkeypatch.setattr(response_cache, "CACHE_BYPASS", True)
+    query_model(STORY, trial=0)
+    assert stub.request_count == 3
+    assert cache.stats()["hits"] == 0
+
+
+def test_second_run_makes_no_model_calls(stub, cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "CACHE_BYPASS", False)
+    main.run_pipeline(trials=2, concurrency=4, stories_csv=STORIES_CSV,
+                      results_dir=str(tmp_path / "first"))
+    calls = stub.request_count
+    assert calls > 0
+    main.run_pipeline(trials=2, concurrency=4, stories_csv=STORIES_CSV,
+                      results_dir=str(tmp_path / "second"))
+    assert stub.request_count == calls
+    first = (tmp_path / "first" / main.RESULTS_CSV).read_text(encoding="utf-8")
+    assert len(first.splitlines()) > 1
+
+    # --no-cache always asks the model
+    main.run_pipeline(trials=2, concurrency=4, use_cache=False,
+                      stories_csv=STORIES_CSV, results_dir=str(tmp_path / "third"))
+    assert stub.request_count == 2 * calls
@@ -0,0 +1,55 @@
+import os
+import pandas as pd
+import main
+from src.result_log import ResultLog, completed_trials, latest_records, log_to_csv
+
+STORIES_CSV = os.path.join(os.path.dirname(__file__), os.pardir, "data",
+                           "user_stories.csv")
+
+
+def test_failed_trials_are_not_completed(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    with ResultLog(path) as log:
+        log.append({"story_id": 1, "trial": 0, "estimate": 3, "error": None})
+        log.append({"story_id": 1, "trial": 1, "estimate": None, "error": "timeout"})
+    assert completed_trials(path) == {(1, 0)}
+    with ResultLog(path, resume=True) as log:
+        log.append({"story_id": 1, "trial": 1, "estimate": 5, "error": None})
+    assert completed_trials(path) == {(1, 0), (1, 1)}
+
+    out = str(tmp_path / "out.csv")
+    assert log_to_csv(path, out) == 2
+    assert pd.read_csv(out)["estimate"].tolist() == [3, 5]
+
+
+def test_latest_records_after_repeated_failures(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    with ResultLog(path) as log:
+        log.append({"story_id": 1, "trial": 0, "error": "timeout"})
+        log.append({"story_id": 2, "trial": 0, "error": None})
+        log.append({"story_id": 1, "trial": 0, "error": "503"})
+        log.append({"story_id": 3, "trial": 0, "error": "timeout"})
+        log.append({"story_id": 1, "trial": 0, "error": None})
+    assert [(r["story_id"], r["error"]) for r in latest_records(path)] == [
+        (2, None), (3, "timeout"), (1, None)]
+    assert completed_trials(path) == {(1, 0), (2, 0)}
+
+
+def test_resume_retries_failed_trials(stub, tmp_path):
+    results_dir = str(tmp_path / "results")
+    stub.httpd.error_rate = 0.5
+    main.run_pipeline(trials=2, concurrency=4, use_cache=False,
+                      stories_csv=STORIES_CSV, results_dir=results_dir)
+    first = pd.read_csv(os.path.join(results_dir, main.RESULTS_CSV))
+    failed = int(first["error"].notna().sum())
+    assert failed > 0
+    sent = stub.request_count
+
+    stub.httpd.error_rate = 0.0
+    main.run_pipeline(trials=2, concurrency=4, use_cache=False, resume=True,
+                      stories_csv=STORIES_CSV, results_dir=results_dir)
+    assert stub.request_count - sent == failed
+    df = pd.read_csv(os.path.join(results_dir, main.RESULTS_CSV))
+    assert len(df) == len(first)
+    assert not df.duplicated(["story_id", "trial"]).any()
+    assert df["error"].isna().all()
@@ -0,0 +1,67 @@
+import pytest
+from src.result_log import ResultLog
+
+pytest.importorskip("pyarrow")
+from src.results_store import (compare_runs, list_runs, load_results,  # noqa: E402
+                               load_run_summary, prompt_hash, record_run)
+
+
+def _log(path, trials):
+    with ResultLog(str(path)) as log:
+        for sid, t, estimate, status in trials:
+            log.append({"story_id": sid, "trial": t, "story": f"story {sid}",
+                        "raw_output": f'{{"estimate": {estimate}}}',
+                        "response_time": 0.1 * (t + 1), "estimate": estimate,
+                        "parse_status": status, "error": None})
+    return str(path)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = str(tmp_path / "store")
+    first = _log(tmp_path / "a.jsonl", [(1, 0, 3, "ok"), (1, 1, 5, "ok"),
+                                        (2, 0, None, "invalid_json")])
+    second = _log(tmp_path / "b.jsonl", [(1, 0, 8, "ok"), (2, 0, 2, "ok")])
+    record_run(first, store, {"global": {"mean": 4.0}}, run_id="r1", model="m1")
+    record_run(second, store, run_id="r2", model="m2", trials=1)
+    return store
+
+
+def test_runs_are_listed_with_metadata(store):
+    runs = list_runs(store)
+    assert list(runs["run_id"]) == ["r1", "r2"]
+    assert list(runs["rows"]) == [3, 2]
+    assert set(runs["prompt_hash"]) == {prompt_hash()}
+    assert list(list_runs(store, model="m2")["run_id"]) == ["r2"]
+    assert load_run_summary("r1", store) == {"global": {"mean": 4.0}}
+
+
+def test_record_run_refuses_to_overwrite(store, tmp_path):
+    with pytest.raises(FileExistsError):
+        record_run(_log(tmp_path / "c.jsonl", []), store, run_id="r1")
+
+
+def test_load_results_projects_columns(store):
+    df = load_results(store, columns=["story_id", "estimate"])
+    assert list(df.columns) == ["story_id", "estimate", "run_id", "model",
+                                "prompt_hash"]
+    assert len(df) == 5
+    assert df.loc[df["run_id"] == "r2", "estimate"].tolist() == [8.0, 2.0]
+    assert str(df["estimate"].dtype) == "float64"
+
+
+def test_load_results_filters_runs_and_rows(store):
+    df = load_results(store, runs="r1", columns=["story_id", "parse_status"],
+                      filters=[("parse_status", "==", "ok")])
+    assert df["story_id"].tolist() == [1, 1]
+    assert set(df["run_id"]) == {"r1"}
+    with pytest.raises(KeyError):
+        load_results(store, runs=["r3"])
+
+
+def test_compare_runs(store):
+    stats = compare_runs(store)
+    assert list(stats.index) == ["r1", "r2"]
+    assert stats.loc["r1", "trials"] == 3
+    assert stats.loc["r1", "parse_ok_rate"] == pytest.approx(2 / 3)
+    assert stats.loc["r2", "mean_estimate"] == pytest.approx(5.0)
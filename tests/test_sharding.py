@@ -0,0 +1,53 @@
+import os, shutil
+import pytest
+import main
+from src.evaluation import evaluate
+from src.sharding import (SHARD_MARKER, ShardError, load_manifest,
+                          mark_shard_done, merge_shards, shard_name, shard_paths,
+                          split_stories)
+
+STORIES_CSV = os.path.join(os.path.dirname(__file__), os.pardir, "data",
+                           "user_stories.csv")
+N_SHARDS = 3
+
+
+@pytest.fixture
+def shard_runs(stub, tmp_path):
+    """A split of the sample stories with every shard run against the stub."""
+    shards_dir, root = str(tmp_path / "shards"), str(tmp_path / "runs")
+    split_stories(STORIES_CSV, N_SHARDS, shards_dir)
+    for index in range(N_SHARDS):
+        stories_csv, _ = shard_paths(index, shards_dir, root)
+        results_dir = os.path.join(root, shard_name(index, N_SHARDS))
+        main.run_pipeline(trials=2, concurrency=4, use_cache=False,
+                          stories_csv=stories_csv, results_dir=results_dir)
+        mark_shard_done(results_dir, index, shards_dir)
+    return shards_dir, root
+
+
+def test_merge_matches_a_single_run(shard_runs, tmp_path):
+    shards_dir, root = shard_runs
+    out_dir = str(tmp_path / "merged")
+    merged = merge_shards(shards_dir, root, out_dir)
+    assert sum(load_manifest(shards_dir)["stories"].values()) == len(merged["stories"])
+    whole = evaluate(os.path.join(out_dir, "model_outputs.csv"),
+                     str(tmp_path / "whole" / "benchmark_summary.json"))
+    assert {int(k): v for k, v in merged["stories"].items()} == whole["stories"]
+    assert merged["global"] == pytest.approx(whole["global"])
+
+
+def test_merge_rejects_duplicate_shards(shard_runs, tmp_path):
+    shards_dir, root = shard_runs
+    name = shard_name(0, N_SHARDS)
+    shutil.copytree(os.path.join(root, name), os.path.join(root, name + "-copy"))
+    with pytest.raises(ShardError, match="found twice"):
+        merge_shards(shards_dir, root, str(tmp_path / "merged"))
+
+
+def test_merge_rejects_missing_shards(shard_runs, tmp_path):
+    shards_dir, root = shard_runs
+    counts = load_manifest(shards_dir)["stories"]
+    name = next(n for n, count in counts.items() if count)
+    os.remove(os.path.join(root, name, SHARD_MARKER))
+    with pytest.raises(ShardError, match=f"missing or unfinished shards: {name}"):
+        merge_shards(shards_dir, root, str(tmp_path / "merged"))
@@ -0,0 +1,75 @@
+import json, os
+import numpy as np
+import pandas as pd
+import pytest
+import main
+from src.similarity import StoryIndex, build_index
+
+STORIES_CSV = os.path.join(os.path.dirname(__file__), os.pardir, "data",
+                           "user_stories.csv")
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    path = str(tmp_path / "knn_index.npz")
+    build_index(STORIES_CSV).save(path)
+    return path
+
+
+def test_save_load_round_trip(index_path):
+    index = build_index(STORIES_CSV)
+    loaded = StoryIndex.load(index_path)
+    assert len(loaded) == len(index)
+    assert loaded.ids.tolist() == index.ids.tolist()
+    assert loaded.vocab == index.vocab
+    assert loaded.stop_terms == index.stop_terms
+    np.testing.assert_array_equal(loaded.estimates, index.estimates)
+    for story in pd.read_csv(STORIES_CSV)["story"]:
+        assert loaded.estimate(story) == index.estimate(story)
+        query = story.replace("user", "customer")
+        assert loaded.estimate(query) == index.estimate(query)
+
+
+def test_a_story_is_not_its_own_neighbour(index_path):
+    index = StoryIndex.load(index_path)
+    story = pd.read_csv(STORIES_CSV).iloc[0]
+    assert index.estimate(story["story"])["similarity"] == pytest.approx(1.0)
+    rows = index.rows_of(story["id"], story["story"])
+    assert index.ids[rows].tolist() == [story["id"]]
+    est = index.estimate(story["story"], exclude=rows)
+    assert story["id"] not in est["neighbours"]
+    assert est["similarity"] < 1.0
+
+
+def test_pipeline_does_not_route_stories_to_themselves(stub, index_path, tmp_path):
+    results_dir = tmp_path / "results"
+    main.run_pipeline(trials=1, concurrency=4, use_cache=False,
+                      stories_csv=STORIES_CSV, results_dir=str(results_dir),
+                      knn_index=index_path, knn_threshold=0.75)
+    report = json.loads((results_dir / main.KNN_REPORT).read_text(encoding="utf-8"))
+    assert report["sent_to_llm"] > 0
+    for sid, est in report["knn_estimates"].items():
+        assert int(sid) not in est["neighbours"]
+
+
+def test_pipeline_with_every_story_routed(stub, index_path, tmp_path):
+    # the same stories under new ids and punctuation: exact matches in the
+    # index, but not the same stories
+    stories = pd.read_csv(STORIES_CSV)
+    stories["id"] += 100
+    stories["story"] = stories["story"].str.replace(".", "!", regex=False)
+    stories_csv = tmp_path / "stories.csv"
+    stories.to_csv(stories_csv, index=False)
+    results_dir = tmp_path / "results"
+
+    main.run_pipeline(trials=2, use_cache=False, stories_csv=str(stories_csv),
+                      results_dir=str(results_dir), knn_index=index_path,
+                      knn_threshold=0.75)
+
+    assert stub.request_count == 0
+    report = json.loads((results_dir / main.KNN_REPORT).read_text(encoding="utf-8"))
+    assert report["routed_to_knn"] == len(stories)
+    assert report["calls_avoided"] == 2 * len(stories)
+    assert report["knn_compared"] == len(stories)
+    summary = json.loads((results_dir / main.SUMMARY_JSON).read_text(encoding="utf-8"))
+    assert summary["stories"] == {} and summary["global"] == {}
@@ -0,0 +1,14 @@
+import socket, struct, time
+from src.stub_server import StubLLMServer
+
+
+def test_client_reset_is_not_reported(capsys):
+    with StubLLMServer() as server:
+        conn = socket.create_connection(server.httpd.server_address[:2])
+        conn.sendall(b"GET /v1/models HTTP/1.1\r\nHost: stub\r\n\r\n")
+        assert b"200" in conn.recv(4096)
+        # hang up with a reset while the server waits for the next request
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        conn.close()
+        time.sleep(0.2)
+    assert "ConnectionResetError" not in capsys.readouterr().err